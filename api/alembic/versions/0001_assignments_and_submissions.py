@@ -0,0 +1,54 @@
+"""Create assignments and submissions tables
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "assignments",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("grading_mode", sa.String(), nullable=False, server_default="two_stage"),
+        # zstd-compressed JSON (app.db.CompressedJSON)
+        sa.Column("rubric", sa.LargeBinary(), nullable=True),
+        sa.Column("problem_structure", sa.LargeBinary(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "submissions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("assignment_id", sa.String(), sa.ForeignKey("assignments.id"), nullable=False),
+        sa.Column("student_name", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("batch_id", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=False, server_default="pending"),
+        sa.Column("graded_content", sa.LargeBinary(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_submissions_assignment_id_status", "submissions", ["assignment_id", "status"])
+    op.create_index("ix_submissions_status", "submissions", ["status"])
+    op.create_index("ix_submissions_batch_id", "submissions", ["batch_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_submissions_batch_id", table_name="submissions")
+    op.drop_index("ix_submissions_status", table_name="submissions")
+    op.drop_index("ix_submissions_assignment_id_status", table_name="submissions")
+    op.drop_table("submissions")
+    op.drop_table("assignments")
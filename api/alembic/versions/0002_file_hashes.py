@@ -0,0 +1,35 @@
+"""Record SHA-256 and size of uploaded files
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("assignments") as batch_op:
+        batch_op.add_column(sa.Column("sha256", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("size_bytes", sa.Integer(), nullable=True))
+    with op.batch_alter_table("submissions") as batch_op:
+        batch_op.add_column(sa.Column("sha256", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("size_bytes", sa.Integer(), nullable=True))
+        batch_op.create_index("ix_submissions_sha256", ["sha256"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("submissions") as batch_op:
+        batch_op.drop_index("ix_submissions_sha256")
+        batch_op.drop_column("size_bytes")
+        batch_op.drop_column("sha256")
+    with op.batch_alter_table("assignments") as batch_op:
+        batch_op.drop_column("size_bytes")
+        batch_op.drop_column("sha256")
@@ -0,0 +1,28 @@
+"""Keep extractions and graded rubric digests on submissions
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("submissions") as batch_op:
+        # zstd-compressed JSON (app.db.CompressedJSON)
+        batch_op.add_column(sa.Column("extraction", sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column("rubric_digests", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("submissions") as batch_op:
+        batch_op.drop_column("rubric_digests")
+        batch_op.drop_column("extraction")
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+from google import genai
+from google.genai import types
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+DEFAULT_MODEL = "gemini-2.5-flash-lite"
+
+# Alternative endpoints, e.g. the offline fake in benchmarks/fake_gemini.py:
+# REST base URL for the file API and host:port of the gRPC model service.
+GEMINI_BASE_URL = os.getenv("GRADER_GEMINI_BASE_URL")
+GEMINI_GRPC_ENDPOINT = os.getenv("GRADER_GEMINI_GRPC_ENDPOINT")
+
+# Generation configs used by the pipeline; registry entries are keyed on these.
+JSON_GENERATION_CONFIG: Dict[str, Any] = {
+    "response_mime_type": "application/json",
+    "thinkingConfig": {"thinkingBudget": 0},
+}
+TEXT_GENERATION_CONFIG: Dict[str, Any] = {
+    "thinkingConfig": {"thinkingBudget": 0},
+}
+
+# Pooled instances. Async transports (grpc_asyncio channels, httpx.AsyncClient)
+# are bound to the event loop that first used them, so instances handed out
+# while a loop is running are kept per loop; everything else is shared.
+_lock = threading.Lock()
+_clients: Dict[str, genai.Client] = {}
+_llms: Dict[str, ChatGoogleGenerativeAI] = {}
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, genai.Client]]" = weakref.WeakKeyDictionary()
+_loop_llms: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ChatGoogleGenerativeAI]]" = weakref.WeakKeyDictionary()
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _pool(shared: Dict[str, Any], per_loop: weakref.WeakKeyDictionary) -> Dict[str, Any]:
+    loop = _running_loop()
+    if loop is None:
+        return shared
+    return per_loop.setdefault(loop, {})
+
+
+def _llm_key(model: str, generation_config: Optional[Dict[str, Any]]) -> str:
+    return json.dumps([model, generation_config or {}], sort_keys=True)
+
+
+def get_client() -> genai.Client:
+    """Shared `genai.Client`; its HTTP connection pool is reused across calls."""
+    with _lock:
+        pool = _pool(_clients, _loop_clients)
+        client = pool.get("default")
+        if client is None:
+            http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+            client = genai.Client(http_options=http_options)
+            pool["default"] = client
+        return client
+
+
+def get_llm(model: str = DEFAULT_MODEL, generation_config: Optional[Dict[str, Any]] = None) -> ChatGoogleGenerativeAI:
+    """Shared chat model for (model, generation config); reuses its gRPC channel."""
+    key = _llm_key(model, generation_config)
+    with _lock:
+        pool = _pool(_llms, _loop_llms)
+        llm = pool.get(key)
+        if llm is None:
+            llm = ChatGoogleGenerativeAI(
+                model=model,
+                model_kwargs={"generation_config": dict(generation_config or {})},
+                # One attempt: rate_limit retries 429s itself, and LangChain's own
+                # retries would hide them from the AIMD window.
+                max_retries=1,
+                client_options={"api_endpoint": GEMINI_GRPC_ENDPOINT} if GEMINI_GRPC_ENDPOINT else None,
+            )
+            pool[key] = llm
+        return llm
+
+
+def reset() -> None:
+    """Drop all pooled instances (e.g. after rotating the API key)."""
+    with _lock:
+        _clients.clear()
+        _llms.clear()
+        _loop_clients.clear()
+        _loop_llms.clear()
@@ -0,0 +1,287 @@
+"""Gemini context caches for the prompt prefix shared by an assignment's calls.
+
+Every extraction and grading call of an assignment starts with the same system
+prompt and rubric (or problem structure) text; only the student's markdown and
+PDF change. A `Prefix` is that leading part of the messages. When it is long
+enough, it is stored once as a Gemini cached content and calls send only the
+rest of the messages with `cached_content=<name>`, so the prefix is neither
+re-sent nor re-processed and is billed at the cached-token rate.
+
+Caches are content-addressed by a digest of model, system prompt and prefix
+text: a changed rubric maps to a new cache by construction. A local SQLite
+index (next to the file index) shares names across workers and also remembers
+prefixes Gemini refused to cache (too short, unsupported model) so those are
+sent inline without asking again until the entry expires.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from google.genai import types
+from langchain_core.messages import HumanMessage
+
+from .file_cache import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("GRADER_CONTEXT_CACHE", "1") != "0"
+# Lifetime of a cache; entries used within REFRESH_MARGIN_S of expiry are extended
+TTL_S = int(os.getenv("GRADER_CONTEXT_CACHE_TTL_S", "3600"))
+REFRESH_MARGIN_S = 300
+# Gemini rejects caches below a per-model minimum (1024 tokens for Flash models);
+# shorter prefixes are sent inline without trying
+MIN_TOKENS = int(os.getenv("GRADER_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# How long a refused prefix stays uncached: long for requests Gemini rejected
+# as invalid, short for transient failures
+REFUSED_RETRY_S = 3600
+FAILED_RETRY_S = 60
+
+_CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class Prefix:
+    """System prompt plus the leading text parts of the user turn."""
+
+    model: str
+    system: str
+    parts: Tuple[str, ...]
+
+    @property
+    def digest(self) -> str:
+        payload = json.dumps([self.model, self.system, list(self.parts)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def estimated_tokens(self) -> int:
+        return (len(self.system) + sum(len(part) for part in self.parts)) // _CHARS_PER_TOKEN
+
+    def config(self) -> types.CreateCachedContentConfig:
+        return types.CreateCachedContentConfig(
+            display_name=f"grader-{self.digest[:16]}",
+            system_instruction=self.system,
+            contents=[types.Content(role="user", parts=[types.Part(text=part) for part in self.parts])],
+            ttl=f"{TTL_S}s",
+        )
+
+
+def split_messages(model: str, messages: List[Any], prefix_parts: int) -> Tuple[Prefix, List[Any]]:
+    """Split [system, user] messages into the prefix and the messages still to send.
+
+    The first `prefix_parts` parts of the user turn (all text) go into the
+    prefix; the remaining parts (student markdown, PDF) are sent with the call.
+    """
+    system, user = messages
+    content = user.content
+    prefix = Prefix(model=model, system=system.content, parts=tuple(part["text"] for part in content[:prefix_parts]))
+    return prefix, [HumanMessage(content=content[prefix_parts:])]
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_missing(exc: BaseException) -> bool:
+    """True if a call failed because its cached content expired or was deleted."""
+    # A bare 403/404 may be about the model or an uploaded file, which a new cache would not fix
+    text = str(exc).lower().replace(" ", "")
+    return "cachedcontent" in text and ("notfound" in text or "permission" in text or "expired" in text)
+
+
+def _expiry_of(cached: Any) -> float:
+    expire_time = getattr(cached, "expire_time", None)
+    if expire_time is not None:
+        return expire_time.timestamp()
+    return time.time() + TTL_S
+
+
+class ContextCacheIndex:
+    """SQLite map of prefix digest -> cached content name and expiry.
+
+    A row without a name marks a prefix that could not be cached; it is served
+    inline until `expires_at`. Per-digest locks make concurrent callers in one
+    process create a cache once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self._keyed = KeyedLocks()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS context_caches ("
+                " digest TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, digest: str) -> Optional[Tuple[Optional[str], float]]:
+        """(name, expires_at) for a digest that has not expired yet."""
+        with self._conn_lock:
+            row = self._connection().execute(
+                "SELECT name, expires_at FROM context_caches WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0], row[1]
+
+    def put(self, digest: str, name: Optional[str], expires_at: float) -> None:
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO context_caches (digest, name, expires_at) VALUES (?, ?, ?)",
+                (digest, name, expires_at),
+            )
+            conn.commit()
+
+    def forget(self, digest: str) -> None:
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM context_caches WHERE digest = ?", (digest,))
+            conn.commit()
+
+    def lock_for(self, digest: str) -> Any:
+        return self._keyed.lock_for(digest)
+
+    def alock_for(self, digest: str) -> asyncio.Lock:
+        return self._keyed.alock_for(digest)
+
+
+_index: Optional[ContextCacheIndex] = None
+
+
+def get_context_cache_index() -> ContextCacheIndex:
+    """Process-wide index; location configurable with GRADER_CONTEXT_CACHE_INDEX_PATH."""
+    global _index
+    if _index is None:
+        _index = ContextCacheIndex(os.getenv("GRADER_CONTEXT_CACHE_INDEX_PATH", "context_cache.db"))
+    return _index
+
+
+def _usable(entry: Optional[Tuple[Optional[str], float]]) -> bool:
+    return entry is not None and (entry[0] is None or entry[1] - REFRESH_MARGIN_S > time.time())
+
+
+def _record_failure(index: ContextCacheIndex, prefix: Prefix, exc: BaseException) -> None:
+    refused = _status_code(exc) == 400 or "invalid" in str(exc).lower()
+    logger.info("Prefix %s not cached: %s", prefix.digest[:12], exc)
+    index.put(prefix.digest, None, time.time() + (REFUSED_RETRY_S if refused else FAILED_RETRY_S))
+
+
+def resolve(client: Any, limiter: Any, prefix: Prefix) -> Optional[str]:
+    """Name of a live cache holding `prefix`, creating or extending one if needed.
+
+    Cache API calls go through `limiter` (see `rate_limit.get_caches_limiter`).
+    Returns None when caching is disabled, the prefix is too short or Gemini
+    would not cache it; callers then send the full messages.
+    """
+    if not ENABLED or prefix.estimated_tokens < MIN_TOKENS:
+        return None
+    index = get_context_cache_index()
+    entry = index.get(prefix.digest)
+    if _usable(entry):
+        return entry[0]
+    with index.lock_for(prefix.digest):
+        entry = index.get(prefix.digest)
+        if _usable(entry):
+            return entry[0]
+        try:
+            if entry is not None:
+                try:
+                    cached = limiter.call(
+                        lambda: client.caches.update(
+                            name=entry[0], config=types.UpdateCachedContentConfig(ttl=f"{TTL_S}s")
+                        )
+                    )
+                except Exception:
+                    cached = _create(client, limiter, prefix)
+            else:
+                cached = _create(client, limiter, prefix)
+        except Exception as exc:
+            _record_failure(index, prefix, exc)
+            return None
+        index.put(prefix.digest, cached.name, _expiry_of(cached))
+        return cached.name
+
+
+def _create(client: Any, limiter: Any, prefix: Prefix) -> Any:
+    return limiter.call(
+        lambda: client.caches.create(model=prefix.model, config=prefix.config()), tokens=prefix.estimated_tokens
+    )
+
+
+async def _acreate(client: Any, limiter: Any, prefix: Prefix) -> Any:
+    return await limiter.acall(
+        lambda: client.aio.caches.create(model=prefix.model, config=prefix.config()), tokens=prefix.estimated_tokens
+    )
+
+
+async def aresolve(client: Any, limiter: Any, prefix: Prefix) -> Optional[str]:
+    """Async `resolve`."""
+    if not ENABLED or prefix.estimated_tokens < MIN_TOKENS:
+        return None
+    index = get_context_cache_index()
+    entry = index.get(prefix.digest)
+    if _usable(entry):
+        return entry[0]
+    async with index.alock_for(prefix.digest):
+        entry = index.get(prefix.digest)
+        if _usable(entry):
+            return entry[0]
+        try:
+            if entry is not None:
+                try:
+                    cached = await limiter.acall(
+                        lambda: client.aio.caches.update(
+                            name=entry[0], config=types.UpdateCachedContentConfig(ttl=f"{TTL_S}s")
+                        )
+                    )
+                except Exception:
+                    cached = await _acreate(client, limiter, prefix)
+            else:
+                cached = await _acreate(client, limiter, prefix)
+        except Exception as exc:
+            _record_failure(index, prefix, exc)
+            return None
+        index.put(prefix.digest, cached.name, _expiry_of(cached))
+        return cached.name
+
+
+def forget(prefix: Prefix) -> None:
+    """Drop the index entry, e.g. after Gemini reported the cache gone."""
+    get_context_cache_index().forget(prefix.digest)
+
+
+async def ainvalidate(client: Any, limiter: Any, prefix: Prefix) -> None:
+    """Delete the cache for a prefix that will not be used again (rubric replaced)."""
+    index = get_context_cache_index()
+    entry = index.get(prefix.digest)
+    index.forget(prefix.digest)
+    if entry is not None and entry[0] is not None:
+        try:
+            await limiter.acall(lambda: client.aio.caches.delete(name=entry[0]))
+        except Exception as exc:
+            # It expires on its own; deleting only stops the storage charge early
+            logger.info("Could not delete context cache %s: %s", entry[0], exc)
@@ -0,0 +1,180 @@
+import os
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Gemini keeps uploaded files for 48 hours; treat entries as stale a little early
+# so a file never expires between the lookup and the model call.
+DEFAULT_TTL_S = 48 * 3600
+EXPIRY_MARGIN_S = 15 * 60
+
+_HASH_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    """Remote Gemini file resolved through the local index."""
+
+    sha256: str
+    name: str
+    uri: str
+    mime_type: str
+    expires_at: float
+
+
+def file_sha256(path: str) -> str:
+    """Hex SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remote_name_for(sha256: str) -> str:
+    """Server-side file name derived from content (Gemini allows at most 40 chars)."""
+    return f"sha-{sha256[:36]}"
+
+
+def expiry_of(remote_file: Any) -> float:
+    """Epoch seconds at which a `genai` File expires (falls back to the default TTL)."""
+    expiration = getattr(remote_file, "expiration_time", None)
+    if expiration is not None:
+        return expiration.timestamp()
+    return time.time() + DEFAULT_TTL_S
+
+
+class _KeyLock:
+    """A threading lock that can live in a WeakValueDictionary (`threading.Lock` cannot)."""
+
+    __slots__ = ("_lock", "__weakref__")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "_KeyLock":
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._lock.release()
+
+
+class KeyedLocks:
+    """Per-key threading and asyncio locks.
+
+    A key's lock is dropped once no caller holds or waits on it, so the maps
+    do not grow with every distinct key.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: "weakref.WeakValueDictionary[str, _KeyLock]" = weakref.WeakValueDictionary()
+        self._alocks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def lock_for(self, key: str) -> _KeyLock:
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = _KeyLock()
+            return lock
+
+    def alock_for(self, key: str) -> asyncio.Lock:
+        with self._guard:
+            lock = self._alocks.get(key)
+            if lock is None:
+                lock = self._alocks[key] = asyncio.Lock()
+            return lock
+
+
+class RemoteFileIndex:
+    """Persistent SHA-256 -> Gemini file index backed by SQLite.
+
+    Lookups are local only, so a hit costs no network round-trip. Per-hash locks
+    (threading and asyncio flavours) make sure concurrent callers holding the
+    same bytes upload them once; SQLite takes care of other processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self._keyed = KeyedLocks()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS remote_files ("
+                " sha256 TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " uri TEXT NOT NULL,"
+                " mime_type TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, sha256: str) -> Optional[CachedFile]:
+        """Return the cached remote file if it is not about to expire."""
+        with self._conn_lock:
+            row = self._connection().execute(
+                "SELECT sha256, name, uri, mime_type, expires_at FROM remote_files WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+        if row is None:
+            return None
+        cached = CachedFile(*row)
+        if cached.expires_at - EXPIRY_MARGIN_S <= time.time():
+            return None
+        return cached
+
+    def put(self, sha256: str, remote_file: Any, mime_type: str) -> CachedFile:
+        cached = CachedFile(
+            sha256=sha256,
+            name=remote_file.name,
+            uri=remote_file.uri,
+            mime_type=getattr(remote_file, "mime_type", None) or mime_type,
+            expires_at=expiry_of(remote_file),
+        )
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO remote_files (sha256, name, uri, mime_type, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (cached.sha256, cached.name, cached.uri, cached.mime_type, cached.expires_at),
+            )
+            conn.commit()
+        return cached
+
+    def forget(self, sha256: str) -> None:
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM remote_files WHERE sha256 = ?", (sha256,))
+            conn.commit()
+
+    def lock_for(self, sha256: str) -> _KeyLock:
+        return self._keyed.lock_for(sha256)
+
+    def alock_for(self, sha256: str) -> asyncio.Lock:
+        return self._keyed.alock_for(sha256)
+
+
+_index: Optional[RemoteFileIndex] = None
+
+
+def get_file_index() -> RemoteFileIndex:
+    """Process-wide index; location configurable with GRADER_FILE_INDEX_PATH."""
+    global _index
+    if _index is None:
+        _index = RemoteFileIndex(os.getenv("GRADER_FILE_INDEX_PATH", "file_index.db"))
+    return _index
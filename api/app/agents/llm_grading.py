@@ -1,14 +1,112 @@
 import os
 import json
 import time
-import re
-from typing import Dict, Any, Optional, List
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Iterator, Sequence, Tuple
 
 # External deps
 from google import genai  # requires GEMINI_API_KEY or GOOGLE_API_KEY in env
-from langchain_google_genai import ChatGoogleGenerativeAI
+from google.genai import errors as genai_errors
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from .. import metrics
+from . import context_cache, structured_output
+from .clients import DEFAULT_MODEL, JSON_GENERATION_CONFIG, TEXT_GENERATION_CONFIG, get_client, get_llm
+from .file_cache import CachedFile, file_sha256, get_file_index, remote_name_for
+from .problems import problem_key, rubric_to_problem_structure, split_markdown_by_problem
+from .prompts import (
+    GRADING_SYSTEM_PROMPT,
+    GRADING_USER_PROMPT,
+    PREPROCESSING_SYSTEM_PROMPT,
+    PREPROCESSING_USER_PROMPT,
+    PROBLEM_EXTRACTION_SYSTEM_PROMPT,
+    PROBLEM_EXTRACTION_USER_PROMPT,
+    SINGLE_PASS_SYSTEM_PROMPT,
+    SINGLE_PASS_USER_PROMPT,
+)
+from .rate_limit import get_caches_limiter, get_files_limiter, get_limiter, reset as reset_limiters
+from .response_cache import cache_key, get_response_cache, usage_tokens
+from .rubric_diff import merge_graded
+from .structured_output import (
+    check_entry,
+    check_grades,
+    check_rubric,
+    grading_schema,
+    parse_json,
+    rubric_schema,
+    single_pass_schema,
+)
+
+
+# Upper bound on Gemini calls (uploads, polls and generations) in flight at once
+# across all async pipelines on one event loop. Override with GRADER_MAX_CONCURRENCY.
+MAX_CONCURRENCY = int(os.getenv("GRADER_MAX_CONCURRENCY", "16"))
+
+# Problems of one submission graded at the same time in per-problem mode.
+PROBLEM_CONCURRENCY = int(os.getenv("GRADER_PROBLEM_CONCURRENCY", "4"))
+
+# Stream grading answers and hand on each problem's grade as soon as its entry
+# is complete (for callers that pass `on_problem`). GRADER_STREAM_GRADES=0
+# waits for whole answers.
+STREAM_GRADES = os.getenv("GRADER_STREAM_GRADES", "1") != "0"
+
+# A semaphore is bound to the loop it is first used on; keep one per loop
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(limit: int) -> None:
+    """Resize the async concurrency pools. Takes effect for new waiters."""
+    global MAX_CONCURRENCY
+    if limit < 1:
+        raise ValueError("Concurrency limit must be at least 1")
+    MAX_CONCURRENCY = limit
+    _llm_semaphores.clear()
+    # Limiters size their AIMD window from MAX_CONCURRENCY
+    reset_limiters()
+
+
+def _llm_slots() -> asyncio.Semaphore:
+    """Return the running loop's semaphore guarding async Gemini calls."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+def _model_limiter(model: str):
+    return get_limiter(model, max_window=MAX_CONCURRENCY)
+
+
+def _files_limiter():
+    return get_files_limiter(max_window=MAX_CONCURRENCY)
+
+
+def _caches_limiter():
+    return get_caches_limiter(max_window=MAX_CONCURRENCY)
+
+
+# Rough pre-call token estimate for the TPM budget; reconciled with the
+# reported usage once the response arrives.
+_CHARS_PER_TOKEN = 4
+_EST_TOKENS_PER_FILE = 8 * 258  # about eight PDF pages
+_EST_OUTPUT_TOKENS = 1024
+
+
+def _estimate_tokens(messages: List[Any]) -> int:
+    total = _EST_OUTPUT_TOKENS
+    for message in messages:
+        content = message.content
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict) and part.get("type") == "media":
+                total += _EST_TOKENS_PER_FILE
+            else:
+                text = part.get("text", "") if isinstance(part, dict) else str(part)
+                total += len(text) // _CHARS_PER_TOKEN
+    return total
+
 
 def _ensure_api_key() -> None:
     """Raise a helpful error if the Gemini key is missing."""
@@ -18,27 +116,6 @@ def _ensure_api_key() -> None:
         )
 
 
-def _load_prompts() -> Dict[str, str]:
-    """Load prompt strings by importing directly from `prompts` module."""
-    from .prompts import (
-        PREPROCESSING_SYSTEM_PROMPT,
-        PREPROCESSING_USER_PROMPT,
-        PROBLEM_EXTRACTION_SYSTEM_PROMPT,
-        PROBLEM_EXTRACTION_USER_PROMPT,
-        GRADING_SYSTEM_PROMPT,
-        GRADING_USER_PROMPT,
-    )
-
-    return {
-        "PREPROCESSING_SYSTEM_PROMPT": PREPROCESSING_SYSTEM_PROMPT,
-        "PREPROCESSING_USER_PROMPT": PREPROCESSING_USER_PROMPT,
-        "PROBLEM_EXTRACTION_SYSTEM_PROMPT": PROBLEM_EXTRACTION_SYSTEM_PROMPT,
-        "PROBLEM_EXTRACTION_USER_PROMPT": PROBLEM_EXTRACTION_USER_PROMPT,
-        "GRADING_SYSTEM_PROMPT": GRADING_SYSTEM_PROMPT,
-        "GRADING_USER_PROMPT": GRADING_USER_PROMPT,
-    }
-
-
 def _detect_mime_type(path: str) -> str:
     ext = os.path.splitext(path.lower())[1]
     if ext == ".pdf":
@@ -46,186 +123,404 @@ def _detect_mime_type(path: str) -> str:
     return "application/octet-stream"
 
 
-def _sanitize_filename(filename: str) -> str:
-    """Sanitize filename to meet Google GenAI API requirements.
-    
-    File resource names may only contain lowercase alphanumeric characters or dashes (-) 
-    and cannot begin or end with a dash.
-    """
-    import re
-    
-    # Remove file extension
-    name_without_ext = os.path.splitext(filename)[0]
-    
-    # Convert to lowercase
-    sanitized = name_without_ext.lower()
-    
-    # Replace any non-alphanumeric characters (except dashes) with dashes
-    sanitized = re.sub(r'[^a-z0-9-]', '-', sanitized)
-    
-    # Remove multiple consecutive dashes
-    sanitized = re.sub(r'-+', '-', sanitized)
-    
-    # Remove leading and trailing dashes
-    sanitized = sanitized.strip('-')
-    
-    # Ensure it's not empty and add a fallback
-    if not sanitized:
-        sanitized = "file"
-    
-    # Ensure it doesn't start or end with dash
-    if sanitized.startswith('-'):
-        sanitized = 'file-' + sanitized[1:]
-    if sanitized.endswith('-'):
-        sanitized = sanitized[:-1] + '-file'
-    
-    return sanitized
-
-
-def _upload_file(client: genai.Client, file_path: str, *, mime_type: Optional[str] = None, timeout_s: int = 120) -> Any:
-    """Return an existing Google file if present; otherwise upload and wait until ACTIVE.
-
-    Matching is attempted by resource name 'files/<basename>'. If found and PROCESSING,
-    this function polls until ACTIVE (or timeout). If not found, it uploads with the
-    basename as the server-side name and then polls until ACTIVE.
+def _state_name(remote_file: Any) -> Optional[str]:
+    state = getattr(remote_file, "state", None)
+    return getattr(state, "name", None) if state else None
+
+
+def _is_processing(remote_file: Any) -> bool:
+    return _state_name(remote_file) == "PROCESSING"
+
+
+# Files usually turn ACTIVE within a second, so start polling fast and back off.
+_POLL_INITIAL_S = 0.25
+_POLL_MAX_S = 4.0
+
+
+def _poll_delays() -> Iterator[float]:
+    delay = _POLL_INITIAL_S
+    while True:
+        yield delay
+        delay = min(delay * 2, _POLL_MAX_S)
+
+
+def _has_code(exc: BaseException, code: int) -> bool:
+    return isinstance(exc, genai_errors.APIError) and exc.code == code
+
+
+def _check_not_failed(remote_file: Any, file_path: str) -> None:
+    if _state_name(remote_file) == "FAILED":
+        raise RuntimeError(f"File processing failed on the server: {file_path}")
+
+
+def _upload_file(
+    client: genai.Client,
+    file_path: str,
+    *,
+    mime_type: Optional[str] = None,
+    timeout_s: int = 120,
+    sha256: Optional[str] = None,
+) -> CachedFile:
+    """Return the Gemini file holding these bytes, uploading only when needed.
+
+    Files are keyed by the SHA-256 of their content in a local persistent index
+    (see `file_cache`). A fresh index hit returns without any network call. On a
+    miss (or once the remote copy has expired) the content-derived name is looked
+    up remotely, uploaded if absent, polled until ACTIVE and recorded. Pass
+    `sha256` when the caller already knows the digest to skip re-reading the file.
     """
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
 
-    original_filename = os.path.basename(file_path)
-    desired_name = _sanitize_filename(original_filename)
-    expected_resource_name = f"files/{desired_name}"
-    
-    # Log the filename transformation for debugging
-    if original_filename != desired_name:
-        print(f"Filename sanitized: '{original_filename}' -> '{desired_name}'")
+    started = time.perf_counter()
+    index = get_file_index()
+    digest = sha256 or file_sha256(file_path)
+    with index.lock_for(digest):
+        cached = index.get(digest)
+        if cached is not None:
+            metrics.observe_upload("index", time.perf_counter() - started)
+            return cached
 
-    # Try to reuse an existing file by name
-    existing = None
-    try:
-        existing = client.files.get(name=expected_resource_name)
-    except Exception:
-        existing = None
-
-    target = existing
-    if target is None:
         inferred_mime = mime_type or _detect_mime_type(file_path)
-        with open(file_path, "rb") as f:
-            target = client.files.upload(
-                file=f,
-                config={"mime_type": inferred_mime, "name": desired_name},
-            )
-
-    # Poll until ACTIVE if the API exposes a state
-    start = time.time()
-    current = target
-    while getattr(current, "state", None) and getattr(current.state, "name", None) == "PROCESSING":
-        if time.time() - start > timeout_s:
-            raise TimeoutError(f"Timed out waiting for file to process: {file_path}")
-        time.sleep(2)
-        current = client.files.get(name=current.name)
-    return current
-
-
-def _init_llm_json() -> ChatGoogleGenerativeAI:
-    """Chat model configured to return JSON directly."""
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite",
-        model_kwargs={
-            "generation_config": {
-                "response_mime_type": "application/json",
-                "thinkingConfig": {"thinkingBudget": 0},
-            }
-        },
-    )
+        remote_name = remote_name_for(digest)
+
+        limiter = _files_limiter()
+
+        def get_remote():
+            return client.files.get(name=f"files/{remote_name}")
+
+        def upload():
+            with open(file_path, "rb") as f:
+                return client.files.upload(
+                    file=f,
+                    config={
+                        "mime_type": inferred_mime,
+                        "name": remote_name,
+                        "display_name": os.path.basename(file_path),
+                    },
+                )
+
+        # The index may have been wiped while the remote copy is still alive
+        try:
+            target = limiter.call(get_remote)
+        except genai_errors.APIError as exc:
+            if not _has_code(exc, 404):
+                raise
+            target = None
+
+        source_found = target is not None
+        if target is None:
+            try:
+                target = limiter.call(upload)
+            except genai_errors.APIError as exc:
+                # Another process uploaded the same bytes since the lookup
+                if not _has_code(exc, 409):
+                    raise
+                target = limiter.call(get_remote)
+                source_found = True
+        metrics.observe_upload("remote" if source_found else "upload", time.perf_counter() - started)
+
+        # Poll until ACTIVE if the API exposes a state
+        start = time.time()
+        current = target
+        delays = _poll_delays()
+        while _is_processing(current):
+            if time.time() - start > timeout_s:
+                raise TimeoutError(f"Timed out waiting for file to process: {file_path}")
+            time.sleep(next(delays))
+            current = limiter.call(lambda: client.files.get(name=current.name))
+        if current is not target:
+            metrics.observe_active_wait(time.time() - start)
+        _check_not_failed(current, file_path)
+        return index.put(digest, current, inferred_mime)
+
+
+async def _aupload_file(
+    client: genai.Client,
+    file_path: str,
+    *,
+    mime_type: Optional[str] = None,
+    timeout_s: int = 120,
+    sha256: Optional[str] = None,
+) -> CachedFile:
+    """Async counterpart of `_upload_file` using `client.aio` and non-blocking polling."""
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
 
+    started = time.perf_counter()
+    index = get_file_index()
+    digest = sha256 or await asyncio.to_thread(file_sha256, file_path)
+    async with index.alock_for(digest):
+        cached = await asyncio.to_thread(index.get, digest)
+        if cached is not None:
+            metrics.observe_upload("index", time.perf_counter() - started)
+            return cached
 
-def _parse_json_output(content: str) -> Any:
-    """Parse model content into JSON, handling potential code fences."""
-    try:
-        return json.loads(content)
-    except Exception:
-        pass
-    m = re.search(r"```json\s*\n([\s\S]*?)\n```", content)
-    if m:
-        return json.loads(m.group(1))
-    # Sometimes models wrap as bare fenced block without language
-    m2 = re.search(r"```\s*\n([\s\S]*?)\n```", content)
-    if m2:
-        return json.loads(m2.group(1))
-    raise ValueError("Model did not return valid JSON content")
+        inferred_mime = mime_type or _detect_mime_type(file_path)
+        remote_name = remote_name_for(digest)
+
+        limiter = _files_limiter()
+
+        async def get_remote(name: str):
+            async with _llm_slots():
+                return await client.aio.files.get(name=name)
+
+        async def upload():
+            async with _llm_slots():
+                return await client.aio.files.upload(
+                    file=file_path,
+                    config={
+                        "mime_type": inferred_mime,
+                        "name": remote_name,
+                        "display_name": os.path.basename(file_path),
+                    },
+                )
+
+        try:
+            target = await limiter.acall(lambda: get_remote(f"files/{remote_name}"))
+        except genai_errors.APIError as exc:
+            if not _has_code(exc, 404):
+                raise
+            target = None
+
+        source_found = target is not None
+        if target is None:
+            try:
+                target = await limiter.acall(upload)
+            except genai_errors.APIError as exc:
+                # Another process uploaded the same bytes since the lookup
+                if not _has_code(exc, 409):
+                    raise
+                target = await limiter.acall(lambda: get_remote(f"files/{remote_name}"))
+                source_found = True
+        metrics.observe_upload("remote" if source_found else "upload", time.perf_counter() - started)
+
+        # Poll until ACTIVE without holding a concurrency slot while sleeping
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        current = target
+        delays = _poll_delays()
+        while _is_processing(current):
+            if loop.time() - start > timeout_s:
+                raise TimeoutError(f"Timed out waiting for file to process: {file_path}")
+            await asyncio.sleep(next(delays))
+            current = await limiter.acall(lambda: get_remote(current.name))
+        if current is not target:
+            metrics.observe_active_wait(loop.time() - start)
+        _check_not_failed(current, file_path)
+        return await asyncio.to_thread(index.put, digest, current, inferred_mime)
+
+
+def upload_files(
+    file_paths: Sequence[str],
+    *,
+    sha256s: Optional[Sequence[Optional[str]]] = None,
+) -> List[CachedFile]:
+    """Upload several files at once (threads), returning them in input order.
 
+    Each file is uploaded and polled on its own backoff schedule, so network
+    time overlaps and no file waits for a slower one to become ACTIVE.
+    """
+    _ensure_api_key()
+    client = get_client()
+    sha256s = list(sha256s) if sha256s is not None else [None] * len(file_paths)
+    if len(file_paths) <= 1:
+        return [_upload_file(client, path, sha256=digest) for path, digest in zip(file_paths, sha256s)]
+    with ThreadPoolExecutor(max_workers=min(len(file_paths), MAX_CONCURRENCY)) as pool:
+        futures = [pool.submit(_upload_file, client, path, sha256=digest) for path, digest in zip(file_paths, sha256s)]
+        return [future.result() for future in futures]
 
-from typing import Any, Dict, List
 
+async def aupload_files(
+    file_paths: Sequence[str],
+    *,
+    sha256s: Optional[Sequence[Optional[str]]] = None,
+) -> List[CachedFile]:
+    """Async `upload_files`: uploads run concurrently on the event loop."""
+    _ensure_api_key()
+    client = get_client()
+    sha256s = list(sha256s) if sha256s is not None else [None] * len(file_paths)
+    return list(
+        await asyncio.gather(
+            *(_aupload_file(client, path, sha256=digest) for path, digest in zip(file_paths, sha256s))
+        )
+    )
 
-def rubric_to_problem_structure(score_rubric: List[Dict[str, Any]]) -> Dict[str, Any]:
-    structure: List[Dict[str, Any]] = []
 
-    for problem in score_rubric or []:
-        if not isinstance(problem, dict):
-            continue
+def _llm_for(model: str, generation_config: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+    """Pooled model for `generation_config`, and the call kwargs for its response schema.
 
-        problem_entry: Dict[str, Any] = {}
+    Schemas are derived from each rubric, so they are passed per call rather
+    than pooling a model per schema.
+    """
+    config = dict(generation_config)
+    schema = config.pop("response_schema", None)
+    if schema is None:
+        return get_llm(model, config), {}
+    return get_llm(model, config), {"response_mime_type": config["response_mime_type"], "response_schema": schema}
 
-        if "id" in problem:
-            problem_entry["id"] = problem["id"]
-        if "name" in problem:
-            problem_entry["name"] = problem["name"]
 
-        if "description" in problem:
-            problem_entry["description"] = problem["description"]
+def _json_config(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON generation config constrained to `schema` (the key is part of the response cache key)."""
+    if not structured_output.SCHEMA_ENABLED:
+        return JSON_GENERATION_CONFIG
+    return {**JSON_GENERATION_CONFIG, "response_schema": schema}
 
-        items = problem.get("items")
-        if isinstance(items, list):
-            minimized_items: List[Dict[str, Any]] = []
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-                item_entry: Dict[str, Any] = {}
-                if "id" in item:
-                    item_entry["id"] = item["id"]
-                if "description" in item:
-                    item_entry["description"] = item["description"]
-                if item_entry:
-                    minimized_items.append(item_entry)
-            if minimized_items:
-                problem_entry["items"] = minimized_items
 
-        if problem_entry:
-            structure.append(problem_entry)
+def _generate(model: str, generation_config: Dict[str, Any], messages: List[Any], prefix_parts: int) -> Any:
+    """Run one model call, taking the prompt prefix from a context cache when there is one.
 
-    return structure
+    A cache that expired or was deleted since it was indexed is forgotten and
+    the call is repeated with the full messages.
+    """
+    llm, kwargs = _llm_for(model, generation_config)
+    if prefix_parts:
+        prefix, rest = context_cache.split_messages(model, messages, prefix_parts)
+        name = context_cache.resolve(get_client(), _caches_limiter(), prefix)
+        if name is not None:
+            try:
+                response = llm.invoke(rest, cached_content=name, **kwargs)
+                metrics.count_context_cache("cached")
+                return response
+            except Exception as exc:
+                if not context_cache.is_missing(exc):
+                    raise
+                context_cache.forget(prefix)
+                metrics.count_context_cache("expired")
+        metrics.count_context_cache("inline")
+    return llm.invoke(messages, **kwargs)
+
+
+async def _astream(llm: Any, messages: List[Any], on_text: Callable[[str], Awaitable[None]], **kwargs: Any) -> Any:
+    """Stream a model call, passing each piece of text to `on_text`.
+
+    Returns the chunks summed into one message, so content and usage metadata
+    read as they do for `ainvoke`.
+    """
+    response = None
+    async for chunk in llm.astream(messages, **kwargs):
+        response = chunk if response is None else response + chunk
+        if isinstance(chunk.content, str) and chunk.content:
+            await on_text(chunk.content)
+    if response is None:
+        raise ValueError("Model returned an empty stream")
+    return response
+
+
+async def _agenerate(
+    model: str,
+    generation_config: Dict[str, Any],
+    messages: List[Any],
+    prefix_parts: int,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Any:
+    """Async `_generate`; with `on_text` the answer is streamed into it as it is generated."""
+    llm, kwargs = _llm_for(model, generation_config)
+
+    async def send(request: List[Any], **extra: Any) -> Any:
+        if on_text is None:
+            return await llm.ainvoke(request, **extra, **kwargs)
+        return await _astream(llm, request, on_text, **extra, **kwargs)
+
+    if prefix_parts:
+        prefix, rest = context_cache.split_messages(model, messages, prefix_parts)
+        name = await context_cache.aresolve(get_client(), _caches_limiter(), prefix)
+        if name is not None:
+            try:
+                response = await send(rest, cached_content=name)
+                metrics.count_context_cache("cached")
+                return response
+            except Exception as exc:
+                if not context_cache.is_missing(exc):
+                    raise
+                context_cache.forget(prefix)
+                metrics.count_context_cache("expired")
+        metrics.count_context_cache("inline")
+    return await send(messages)
+
+
+def _invoke(
+    generation_config: Dict[str, Any],
+    messages: List[Any],
+    files: List[CachedFile],
+    *,
+    bypass_cache: bool = False,
+    model: str = DEFAULT_MODEL,
+    prefix_parts: int = 0,
+) -> str:
+    """Call the pooled model for `generation_config`, serving repeats from the response cache.
 
+    With `bypass_cache` the model is always called and the fresh answer replaces
+    any cached one (used for deliberate re-grades). Calls go through the model's
+    rate limiter (`rate_limit`), which also retries them when throttled.
+    `prefix_parts` leading text parts of the user turn are, with the system
+    prompt, the assignment-wide prefix sent from a context cache when possible.
+    """
+    cache = get_response_cache()
+    key = cache_key(model, generation_config, messages, [f.sha256 for f in files])
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    response = _model_limiter(model).call(
+        lambda: _generate(model, generation_config, messages, prefix_parts),
+        tokens=_estimate_tokens(messages),
+        usage_of=usage_tokens,
+    )
+    metrics.observe_model_call(model, response, time.perf_counter() - started)
+    cache.put(key, response.content, tokens=usage_tokens(response))
+    return response.content
 
 
-def preprocess(
-    problems_pdf_path: str,
+async def _ainvoke(
+    generation_config: Dict[str, Any],
+    messages: List[Any],
+    files: List[CachedFile],
     *,
-    optional_solution_or_rubric_text: Optional[str] = None,
-) -> Dict[str, Any]:
-    """Generate a rubric JSON using PREPROCESSING prompts.
-
-    Inputs:
-      - problems_pdf_path: required PDF containing the assignment problems.
-      - empty_assignment_pdf_path: required PDF template (blank assignment); used as extra context.
-      - optional_second_pdf_path: optional additional PDF (e.g., instructor notes).
-      - optional_solution_or_rubric_text: optional text containing solution keys or rubric hints.
+    bypass_cache: bool = False,
+    model: str = DEFAULT_MODEL,
+    prefix_parts: int = 0,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> str:
+    """Async `_invoke`; the model call runs inside the global concurrency pool.
 
-    Returns: dict parsed from model JSON output representing the scoring rubric.
+    With `on_text` the answer is streamed and each piece is awaited with it as
+    it arrives (a cached answer is passed whole); the complete text is still
+    returned and cached.
     """
-    _ensure_api_key()
-    prompts = _load_prompts()
-    client = genai.Client()
-
-    # Upload available files
-    uploads: List[Any] = []
-    uploads.append(_upload_file(client, problems_pdf_path))
+    cache = get_response_cache()
+    key = cache_key(model, generation_config, messages, [f.sha256 for f in files])
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        # SQLite reads and writes stay off the event loop
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            if on_text is not None:
+                await on_text(cached)
+            return cached
+
+    async def call():
+        async with _llm_slots():
+            return await _agenerate(model, generation_config, messages, prefix_parts, on_text)
+
+    started = time.perf_counter()
+    response = await _model_limiter(model).acall(call, tokens=_estimate_tokens(messages), usage_of=usage_tokens)
+    metrics.observe_model_call(model, response, time.perf_counter() - started)
+    await asyncio.to_thread(cache.put, key, response.content, tokens=usage_tokens(response))
+    return response.content
 
-    llm = _init_llm_json()
 
+def _preprocess_messages(
+    uploads: List[Any],
+    optional_solution_or_rubric_text: Optional[str],
+) -> List[Any]:
     human_content: List[Dict[str, Any]] = [
-        {"type": "text", "text": prompts["PREPROCESSING_USER_PROMPT"]},
+        {"type": "text", "text": PREPROCESSING_USER_PROMPT},
     ]
     # Include optional rubric/solution hints if provided
     if optional_solution_or_rubric_text:
@@ -239,59 +534,344 @@ def preprocess(
     for f in uploads:
         human_content.append({"type": "media", "file_uri": f.uri, "mime_type": "application/pdf"})
 
-    messages = [
-        SystemMessage(content=prompts["PREPROCESSING_SYSTEM_PROMPT"]),
+    return [
+        SystemMessage(content=PREPROCESSING_SYSTEM_PROMPT),
         HumanMessage(content=human_content),
     ]
 
-    response = llm.invoke(messages)
-        # todo write update call
 
-    return _parse_json_output(response.content)
+@metrics.timed_stage("preprocess", DEFAULT_MODEL)
+def preprocess(
+    problems_pdf_path: str,
+    *,
+    extra_pdf_paths: Sequence[str] = (),
+    optional_solution_or_rubric_text: Optional[str] = None,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Generate a rubric JSON using PREPROCESSING prompts.
+
+    Inputs:
+      - problems_pdf_path: required PDF containing the assignment problems.
+      - extra_pdf_paths: optional additional PDFs (e.g., blank template, instructor notes);
+        uploaded concurrently with the problems PDF.
+      - optional_solution_or_rubric_text: optional text containing solution keys or rubric hints.
+      - bypass_cache: call the model even if an identical request is in the response cache.
+      - pdf_sha256: digest of the PDF if already known (skips re-reading it).
+
+    Returns: the scoring rubric parsed from the model's JSON output. An answer
+    that is not a valid rubric even after local repair is asked for again, up
+    to GRADER_REASK_ATTEMPTS times.
+    """
+    _ensure_api_key()
+
+    # Upload available files
+    uploads: List[Any] = upload_files(
+        [problems_pdf_path, *extra_pdf_paths],
+        sha256s=[pdf_sha256] + [None] * len(extra_pdf_paths),
+    )
+
+    messages = _preprocess_messages(uploads, optional_solution_or_rubric_text)
+
+    config = _json_config(rubric_schema())
+    content = _invoke(config, messages, uploads, bypass_cache=bypass_cache)
+    for attempt in range(structured_output.REASK_ATTEMPTS + 1):
+        try:
+            return check_rubric(parse_json(content))
+        except ValueError:
+            if attempt == structured_output.REASK_ATTEMPTS:
+                raise
+        metrics.count_reasked("preprocess", 1)
+        content = _invoke(config, messages, uploads, bypass_cache=True)
+
+
+@metrics.timed_stage("preprocess", DEFAULT_MODEL)
+async def apreprocess(
+    problems_pdf_path: str,
+    *,
+    extra_pdf_paths: Sequence[str] = (),
+    optional_solution_or_rubric_text: Optional[str] = None,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Async variant of `preprocess`; runs on the event loop under the global concurrency pool."""
+    _ensure_api_key()
+
+    uploads: List[Any] = await aupload_files(
+        [problems_pdf_path, *extra_pdf_paths],
+        sha256s=[pdf_sha256] + [None] * len(extra_pdf_paths),
+    )
+
+    messages = _preprocess_messages(uploads, optional_solution_or_rubric_text)
+
+    config = _json_config(rubric_schema())
+    content = await _ainvoke(config, messages, uploads, bypass_cache=bypass_cache)
+    for attempt in range(structured_output.REASK_ATTEMPTS + 1):
+        try:
+            return check_rubric(parse_json(content))
+        except ValueError:
+            if attempt == structured_output.REASK_ATTEMPTS:
+                raise
+        metrics.count_reasked("preprocess", 1)
+        content = await _ainvoke(config, messages, uploads, bypass_cache=True)
+
+
+# Leading text parts of each user turn that are the same for every submission
+# of an assignment; with the system prompt they form the context-cached prefix.
+_EXTRACTION_PREFIX_PARTS = 2
+_GRADING_PREFIX_PARTS = 1
+_SINGLE_PASS_PREFIX_PARTS = 1
+
+_RUBRIC_PLACEHOLDER = "<PASTE THE RUBRIC JSON EXACTLY — include which items belong to 1a/1b/1c, with point values>"
+
+
+def _extraction_prefix(problem_structure: Dict[str, Any]) -> List[str]:
+    return [PROBLEM_EXTRACTION_USER_PROMPT, json.dumps({"problem_structure": problem_structure})]
+
+
+def _extraction_messages(
+    submission: Any,
+    problem_structure: Dict[str, Any],
+) -> List[Any]:
+    return [
+        SystemMessage(content=PROBLEM_EXTRACTION_SYSTEM_PROMPT),
+        HumanMessage(
+            content=[
+                *({"type": "text", "text": text} for text in _extraction_prefix(problem_structure)),
+                {"type": "media", "file_uri": submission.uri, "mime_type": "application/pdf"},
+            ]
+        ),
+    ]
 
 
+@metrics.timed_stage("extract", DEFAULT_MODEL)
 def extract_submission(
     submission_pdf_path: str,
     problem_structure: Dict[str, Any],
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
 ) -> str:
     """Extract a structured markdown of the student's solutions using the provided problem structure.
 
     Inputs:
       - submission_pdf_path: the student's submission PDF.
       - problem_structure: dict with problem and subproblem text descriptions.
+      - bypass_cache: call the model even if an identical request is in the response cache.
+      - pdf_sha256: digest of the PDF if already known (skips re-reading it).
 
     Returns: markdown string summarizing the student's submission by problem.
     """
     _ensure_api_key()
-    prompts = _load_prompts()
-    client = genai.Client()
-    submission = _upload_file(client, submission_pdf_path)
+    client = get_client()
+    submission = _upload_file(client, submission_pdf_path, sha256=pdf_sha256)
+
+    # For extraction we want markdown, not JSON, so use the text-configured model.
+    messages = _extraction_messages(submission, problem_structure)
+    return _invoke(
+        TEXT_GENERATION_CONFIG, messages, [submission], bypass_cache=bypass_cache, prefix_parts=_EXTRACTION_PREFIX_PARTS
+    )
 
-    llm = _init_llm_json()
 
-    # For extraction we want markdown, not JSON. Use a separate lightweight model configured for text.
-    # However we can keep the same client but override MIME type expectations by instantiating a fresh model.
-    llm_md = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", model_kwargs={"generation_config": {"thinkingConfig": {"thinkingBudget": 0}}})
+@metrics.timed_stage("extract", DEFAULT_MODEL)
+async def aextract_submission(
+    submission_pdf_path: str,
+    problem_structure: Dict[str, Any],
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+) -> str:
+    """Async variant of `extract_submission`."""
+    _ensure_api_key()
+    client = get_client()
+    submission = await _aupload_file(client, submission_pdf_path, sha256=pdf_sha256)
+
+    messages = _extraction_messages(submission, problem_structure)
+    return await _ainvoke(
+        TEXT_GENERATION_CONFIG, messages, [submission], bypass_cache=bypass_cache, prefix_parts=_EXTRACTION_PREFIX_PARTS
+    )
 
-    messages = [
-        SystemMessage(content=prompts["PROBLEM_EXTRACTION_SYSTEM_PROMPT"]),
+
+def _grading_texts(rubric: Any, student_markdown: str) -> Tuple[str, str]:
+    """The grading user prompt split at the student's markdown: (rubric prefix, markdown and rest)."""
+    rubric_json_str = json.dumps(rubric)
+    user_text = GRADING_USER_PROMPT
+
+    # Inject rubric and markdown if placeholders are present; otherwise append them.
+    if _RUBRIC_PLACEHOLDER in user_text or "{}" in user_text:
+        prefix, marker, rest = user_text.replace(_RUBRIC_PLACEHOLDER, rubric_json_str).partition("{}")
+        return prefix, (student_markdown if marker else "") + rest
+    prefix = (
+        f"{user_text}\n\nRubric JSON (verbatim):\n```json\n{rubric_json_str}\n```\n\n"
+        f"Student solutions (markdown):\n"
+    )
+    return prefix, student_markdown
+
+
+def _grading_messages(
+    rubric: Dict[str, Any],
+    student_markdown: str,
+    submission: Any,
+    submission_pdf_path: str,
+) -> List[Any]:
+    prefix, rest = _grading_texts(rubric, student_markdown)
+    return [
+        SystemMessage(content=GRADING_SYSTEM_PROMPT),
         HumanMessage(
             content=[
-                {"type": "text", "text": prompts["PROBLEM_EXTRACTION_USER_PROMPT"]},
-                {"type": "text", "text": json.dumps({"problem_structure": problem_structure})},
-                {"type": "media", "file_uri": submission.uri, "mime_type": "application/pdf"},
+                {"type": "text", "text": prefix},
+                {"type": "text", "text": rest},
+                {"type": "media", "file_uri": submission.uri, "mime_type": _detect_mime_type(str(submission_pdf_path))},
             ]
         ),
     ]
 
-    response = llm_md.invoke(messages)
-    return response.content
 
+def _checked_grades(content: str, rubric: Any) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(valid entries, problems to re-ask) of a grading answer; an unparseable one re-asks every problem."""
+    try:
+        return check_grades(parse_json(content), rubric)
+    except ValueError:
+        if not isinstance(rubric, list):
+            raise
+        return [], list(rubric)
 
+
+class _GradeStream:
+    """Grades of a streamed grading answer, handed to `on_problem` as each problem's entry closes.
+
+    Entries are validated and repaired one at a time (`check_entry`), so a
+    reviewer can open problem 1 while later problems are still generated.
+    Problems without a valid entry once the answer is complete are re-asked.
+    `depth` locates the grades array (2 inside a single-pass answer).
+    """
+
+    def __init__(
+        self, rubric: List[Dict[str, Any]], on_problem: Callable[[Dict[str, Any]], Awaitable[None]], depth: int = 1
+    ):
+        self.rubric = rubric
+        self.on_problem = on_problem
+        self.parser = structured_output.ArrayElementStream(depth)
+        self.graded: Dict[str, Dict[str, Any]] = {}
+        self.sent: set = set()
+        self.started = time.perf_counter()
+
+    async def feed(self, text: str) -> None:
+        for entry in self.parser.feed(text):
+            checked = check_entry(entry, self.rubric)
+            if checked is None or problem_key(checked["id"]) in self.graded:
+                continue
+            if not self.graded:
+                metrics.observe_first_problem(DEFAULT_MODEL, time.perf_counter() - self.started)
+            self.graded[problem_key(checked["id"])] = checked
+            await self.emit([checked])
+
+    async def emit(self, entries: List[Dict[str, Any]]) -> None:
+        """Hand on the entries not handed on while streaming (answers checked whole, re-asks)."""
+        for entry in entries:
+            key = problem_key(entry.get("id"))
+            if key not in self.sent:
+                self.sent.add(key)
+                await self.on_problem(entry)
+
+    def checked(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(streamed entries in rubric order, problems without one)."""
+        keys = [problem_key(problem["id"]) for problem in self.rubric]
+        graded = [self.graded[key] for key in keys if key in self.graded]
+        failed = [problem for problem, key in zip(self.rubric, keys) if key not in self.graded]
+        return graded, failed
+
+    def result(self, content: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Like `_checked_grades`; the whole answer is only parsed when no entry streamed."""
+        return self.checked() if self.graded else _checked_grades(content, self.rubric)
+
+
+def _grade_stream(
+    rubric: Any, on_problem: Optional[Callable[[Dict[str, Any]], Awaitable[None]]], depth: int = 1
+) -> Optional[_GradeStream]:
+    if on_problem is None or not isinstance(rubric, list):
+        return None
+    return _GradeStream(rubric, on_problem, depth)
+
+
+def _text_sink(stream: Optional[_GradeStream]) -> Optional[Callable[[str], Awaitable[None]]]:
+    return stream.feed if stream is not None and STREAM_GRADES else None
+
+
+def _reask_messages(
+    failed: List[Dict[str, Any]], rubric: Any, student_markdown: str, submission: Any, submission_pdf_path: str
+) -> List[Any]:
+    if len(failed) < len(rubric):
+        # A problem without its own section maps to the whole markdown; join each text once
+        sections = split_markdown_by_problem(student_markdown, failed)
+        student_markdown = "\n\n".join(dict.fromkeys(sections.values()))
+    return _grading_messages(failed, student_markdown, submission, submission_pdf_path)
+
+
+def _reask_failed(failed: List[Dict[str, Any]]) -> ValueError:
+    ids = ", ".join(str(problem.get("id")) for problem in failed)
+    return ValueError(f"No valid grade for problem(s) {ids} after {structured_output.REASK_ATTEMPTS} re-asks")
+
+
+def _reask_grades(
+    graded: List[Dict[str, Any]],
+    failed: List[Dict[str, Any]],
+    rubric: Any,
+    student_markdown: str,
+    submission: Any,
+    submission_pdf_path: str,
+) -> List[Dict[str, Any]]:
+    """Ask again for just the problems whose grade was missing or invalid, and merge the answers.
+
+    Re-asks bypass the response cache (it holds the answer that failed) and
+    send their prompt inline, since a subset of the rubric has no context cache.
+    """
+    for _ in range(structured_output.REASK_ATTEMPTS):
+        if not failed:
+            break
+        metrics.count_reasked("grade", len(failed))
+        messages = _reask_messages(failed, rubric, student_markdown, submission, submission_pdf_path)
+        content = _invoke(_json_config(grading_schema(failed)), messages, [submission], bypass_cache=True)
+        regraded, failed = _checked_grades(content, failed)
+        graded = merge_graded(graded, regraded, rubric)
+    if failed:
+        raise _reask_failed(failed)
+    return graded
+
+
+async def _areask_grades(
+    graded: List[Dict[str, Any]],
+    failed: List[Dict[str, Any]],
+    rubric: Any,
+    student_markdown: str,
+    submission: Any,
+    submission_pdf_path: str,
+    stream: Optional[_GradeStream] = None,
+) -> List[Dict[str, Any]]:
+    """Async `_reask_grades`; re-asked problems are handed on to `stream` as they are graded."""
+    for _ in range(structured_output.REASK_ATTEMPTS):
+        if not failed:
+            break
+        metrics.count_reasked("grade", len(failed))
+        messages = _reask_messages(failed, rubric, student_markdown, submission, submission_pdf_path)
+        content = await _ainvoke(_json_config(grading_schema(failed)), messages, [submission], bypass_cache=True)
+        regraded, failed = _checked_grades(content, failed)
+        graded = merge_graded(graded, regraded, rubric)
+        if stream is not None:
+            await stream.emit(regraded)
+    if failed:
+        raise _reask_failed(failed)
+    return graded
+
+
+@metrics.timed_stage("grade", DEFAULT_MODEL)
 def grade_submission(
     rubric: Dict[str, Any],
     student_markdown: str,
     submission_pdf_path: str,
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Grade the submission using rubric JSON, extracted markdown, and the PDF.
 
@@ -299,55 +879,350 @@ def grade_submission(
       - rubric: dict representing the scoring rubric (from preprocess)
       - student_markdown: markdown string of student's extracted answers (from extract_submission)
       - submission_pdf_path: path to the student's original PDF (as additional grounding)
+      - bypass_cache: call the model even if an identical request is in the response cache
+      - pdf_sha256: digest of the PDF if already known (skips re-reading it)
 
-    Returns: dict parsed from model JSON output containing detailed grades.
+    Returns: the graded problems, validated against the rubric with point sums
+    repaired locally. Problems whose grade is missing or invalid are asked for
+    again on their own (see `_reask_grades`).
     """
     _ensure_api_key()
-    prompts = _load_prompts()
-    client = genai.Client()
-    submission = _upload_file(client, submission_pdf_path)
+    client = get_client()
+    submission = _upload_file(client, submission_pdf_path, sha256=pdf_sha256)
 
-    llm = _init_llm_json()
+    messages = _grading_messages(rubric, student_markdown, submission, submission_pdf_path)
 
-    rubric_json_str = json.dumps(rubric)
-    user_text = prompts["GRADING_USER_PROMPT"]
-
-    # Try to inject rubric and markdown if placeholders are present; otherwise append them.
-    replaced = False
-    if "<PASTE THE RUBRIC JSON" in user_text:
-        user_text = user_text.replace(
-            "<PASTE THE RUBRIC JSON EXACTLY — include which items belong to 1a/1b/1c, with point values>",
-            rubric_json_str,
-        )
-        replaced = True
-    if "{}" in user_text:
-        user_text = user_text.replace("{}", student_markdown)
-        replaced = True
-    if not replaced:
-        user_text = (
-            f"{user_text}\n\nRubric JSON (verbatim):\n```json\n{rubric_json_str}\n```\n\n"
-            f"Student solutions (markdown):\n{student_markdown}"
+    content = _invoke(
+        _json_config(grading_schema(rubric)),
+        messages,
+        [submission],
+        bypass_cache=bypass_cache,
+        prefix_parts=_GRADING_PREFIX_PARTS,
+    )
+    graded, failed = _checked_grades(content, rubric)
+    return _reask_grades(graded, failed, rubric, student_markdown, submission, submission_pdf_path)
+
+
+@metrics.timed_stage("grade", DEFAULT_MODEL)
+async def agrade_submission(
+    rubric: Dict[str, Any],
+    student_markdown: str,
+    submission_pdf_path: str,
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+    on_problem: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Async variant of `grade_submission`.
+
+    `on_problem` is awaited with each problem's graded entry as soon as it is
+    complete: the answer is streamed (GRADER_STREAM_GRADES) and parsed one
+    problem at a time, so the first grades are usable long before the last.
+    """
+    _ensure_api_key()
+    client = get_client()
+    submission = await _aupload_file(client, str(submission_pdf_path), sha256=pdf_sha256)
+
+    messages = _grading_messages(rubric, student_markdown, submission, submission_pdf_path)
+
+    stream = _grade_stream(rubric, on_problem)
+    content = await _ainvoke(
+        _json_config(grading_schema(rubric)),
+        messages,
+        [submission],
+        bypass_cache=bypass_cache,
+        prefix_parts=_GRADING_PREFIX_PARTS,
+        on_text=_text_sink(stream),
+    )
+    if stream is None:
+        graded, failed = _checked_grades(content, rubric)
+    else:
+        graded, failed = stream.result(content)
+        await stream.emit(graded)
+    return await _areask_grades(graded, failed, rubric, student_markdown, submission, submission_pdf_path, stream)
+
+
+@metrics.timed_stage("grade_by_problem", DEFAULT_MODEL)
+async def agrade_submission_by_problem(
+    rubric: List[Dict[str, Any]],
+    student_markdown: str,
+    submission_pdf_path: str,
+    *,
+    max_concurrency: Optional[int] = None,
+    max_attempts: int = 3,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+    on_problem: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    problem_pdfs: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+) -> List[Dict[str, Any]]:
+    """Grade each rubric problem in its own concurrent model call and merge the results.
+
+    Each call sees only its problem's rubric entry and markdown section. Calls
+    run at most `max_concurrency` (default GRADER_PROBLEM_CONCURRENCY) at a time;
+    a failing call is retried on its own with exponential backoff, and an answer
+    still invalid after local repair is asked for again at once. When one
+    problem fails for good, the others are cancelled. The merged
+    output has the same shape as `grade_submission`, in rubric order.
+    `on_problem` is awaited with each problem's graded entry as it finishes.
+    `problem_pdfs` maps problem ids to a `(path, sha256)` PDF holding just that
+    problem's pages (see `page_segments`); other problems get the whole PDF.
+    """
+    if not isinstance(rubric, list):
+        return await agrade_submission(
+            rubric, student_markdown, submission_pdf_path, bypass_cache=bypass_cache, pdf_sha256=pdf_sha256
         )
 
-    messages = [
-        SystemMessage(content=prompts["GRADING_SYSTEM_PROMPT"]),
+    _ensure_api_key()
+    whole = (str(submission_pdf_path), pdf_sha256)
+    sources = {str(problem.get("id")): (problem_pdfs or {}).get(str(problem.get("id")), whole) for problem in rubric}
+    distinct = list(dict.fromkeys(sources.values()))
+    uploads = dict(zip(distinct, await aupload_files([path for path, _ in distinct], sha256s=[d for _, d in distinct])))
+    sections = split_markdown_by_problem(student_markdown, rubric)
+    limit = asyncio.Semaphore(max_concurrency or PROBLEM_CONCURRENCY)
+
+    async def grade_problem(problem: Dict[str, Any]) -> List[Dict[str, Any]]:
+        submission = uploads[sources[str(problem.get("id"))]]
+        messages = _grading_messages([problem], sections[str(problem.get("id"))], submission, submission_pdf_path)
+        config = _json_config(grading_schema([problem]))
+        for attempt in range(1, max_attempts + 1):
+            try:
+                async with limit:
+                    content = await _ainvoke(
+                        config,
+                        messages,
+                        [submission],
+                        # A retry must not be served the answer that just failed
+                        bypass_cache=bypass_cache or attempt > 1,
+                        prefix_parts=_GRADING_PREFIX_PARTS,
+                    )
+            except Exception:
+                if attempt == max_attempts:
+                    raise
+                await asyncio.sleep(2 ** (attempt - 1))
+                continue
+            graded, failed = _checked_grades(content, [problem])
+            if not failed:
+                break
+            if attempt == max_attempts:
+                raise ValueError(f"No valid grade for problem {problem.get('id')} after {max_attempts} attempts")
+            metrics.count_reasked("grade", 1)
+        if on_problem is not None:
+            for entry in graded:
+                await on_problem(entry)
+        return graded
+
+    tasks = [asyncio.create_task(grade_problem(problem)) for problem in rubric]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed problem fails the submission: stop the others before they
+        # spend more model calls or report grades over the restored ones
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return [entry for graded in results for entry in graded]
+
+
+def _single_pass_text(rubric: Any, problem_structure: Dict[str, Any]) -> str:
+    return (
+        SINGLE_PASS_USER_PROMPT
+        .replace("<PROBLEM STRUCTURE JSON>", json.dumps(problem_structure))
+        .replace("<RUBRIC JSON>", json.dumps(rubric))
+    )
+
+
+def _single_pass_messages(
+    rubric: Dict[str, Any],
+    problem_structure: Dict[str, Any],
+    submission: Any,
+    submission_pdf_path: str,
+) -> List[Any]:
+    return [
+        SystemMessage(content=SINGLE_PASS_SYSTEM_PROMPT),
         HumanMessage(
             content=[
-                {"type": "text", "text": user_text},
+                {"type": "text", "text": _single_pass_text(rubric, problem_structure)},
                 {"type": "media", "file_uri": submission.uri, "mime_type": _detect_mime_type(str(submission_pdf_path))},
             ]
         ),
     ]
 
-    response = llm.invoke(messages)
-    return _parse_json_output(response.content)
+
+def _split_single_pass_output(
+    content: str, rubric: Any, stream: Optional[_GradeStream] = None
+) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(extraction markdown, valid grades, problems to re-ask) of a single-pass answer.
+
+    Grades already checked while the answer streamed are taken from `stream`.
+    """
+    parsed = parse_json(content)
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("grades"), list):
+        raise ValueError("Single-pass output is missing the 'grades' key")
+    if stream is not None and stream.graded:
+        graded, failed = stream.checked()
+    else:
+        graded, failed = check_grades(parsed["grades"], rubric)
+    return parsed.get("extraction") or "", graded, failed
+
+
+@metrics.timed_stage("grade_single_pass", DEFAULT_MODEL)
+def grade_submission_single_pass(
+    rubric: Dict[str, Any],
+    problem_structure: Dict[str, Any],
+    submission_pdf_path: str,
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Extract and grade a submission with a single model call.
+
+    Inputs:
+      - rubric: dict representing the scoring rubric (from preprocess)
+      - problem_structure: output of rubric_to_problem_structure for the same rubric
+      - submission_pdf_path: the student's submission PDF
+      - bypass_cache: call the model even if an identical request is in the response cache
+      - pdf_sha256: digest of the PDF if already known (skips re-reading it)
+
+    Returns: {"student_markdown": <str>, "graded_content": <list>} with the same
+    shapes as extract_submission and grade_submission produce. Problems whose
+    grade is missing or invalid are re-graded from the extraction with a
+    grading call for just those problems.
+    """
+    _ensure_api_key()
+    client = get_client()
+    submission = _upload_file(client, str(submission_pdf_path), sha256=pdf_sha256)
+
+    messages = _single_pass_messages(rubric, problem_structure, submission, submission_pdf_path)
+
+    config = _json_config(single_pass_schema(rubric))
+    content = _invoke(
+        config, messages, [submission], bypass_cache=bypass_cache, prefix_parts=_SINGLE_PASS_PREFIX_PARTS
+    )
+    for attempt in range(structured_output.REASK_ATTEMPTS + 1):
+        try:
+            student_markdown, graded, failed = _split_single_pass_output(content, rubric)
+            break
+        except ValueError:
+            if attempt == structured_output.REASK_ATTEMPTS:
+                raise
+        # Without an extraction there is nothing to re-grade from; repeat the whole call
+        metrics.count_reasked("grade_single_pass", len(rubric) if isinstance(rubric, list) else 1)
+        content = _invoke(config, messages, [submission], bypass_cache=True, prefix_parts=_SINGLE_PASS_PREFIX_PARTS)
+    graded = _reask_grades(graded, failed, rubric, student_markdown, submission, submission_pdf_path)
+    return {"student_markdown": student_markdown, "graded_content": graded}
+
+
+@metrics.timed_stage("grade_single_pass", DEFAULT_MODEL)
+async def agrade_submission_single_pass(
+    rubric: Dict[str, Any],
+    problem_structure: Dict[str, Any],
+    submission_pdf_path: str,
+    *,
+    bypass_cache: bool = False,
+    pdf_sha256: Optional[str] = None,
+    on_problem: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Async variant of `grade_submission_single_pass`.
+
+    `on_problem` is awaited with each problem's graded entry as soon as it is
+    complete; the grades follow the extraction in the streamed answer.
+    """
+    _ensure_api_key()
+    client = get_client()
+    submission = await _aupload_file(client, str(submission_pdf_path), sha256=pdf_sha256)
+
+    messages = _single_pass_messages(rubric, problem_structure, submission, submission_pdf_path)
+
+    config = _json_config(single_pass_schema(rubric))
+    stream = _grade_stream(rubric, on_problem, depth=2)
+    content = await _ainvoke(
+        config,
+        messages,
+        [submission],
+        bypass_cache=bypass_cache,
+        prefix_parts=_SINGLE_PASS_PREFIX_PARTS,
+        on_text=_text_sink(stream),
+    )
+    for attempt in range(structured_output.REASK_ATTEMPTS + 1):
+        try:
+            # Repeated calls are not streamed; their answer is checked whole
+            streamed = stream if attempt == 0 else None
+            student_markdown, graded, failed = _split_single_pass_output(content, rubric, streamed)
+            break
+        except ValueError:
+            if attempt == structured_output.REASK_ATTEMPTS:
+                raise
+        # Without an extraction there is nothing to re-grade from; repeat the whole call
+        metrics.count_reasked("grade_single_pass", len(rubric) if isinstance(rubric, list) else 1)
+        content = await _ainvoke(config, messages, [submission], bypass_cache=True, prefix_parts=_SINGLE_PASS_PREFIX_PARTS)
+    if stream is not None:
+        await stream.emit(graded)
+    graded = await _areask_grades(graded, failed, rubric, student_markdown, submission, submission_pdf_path, stream)
+    return {"student_markdown": student_markdown, "graded_content": graded}
+
+
+def _context_prefixes(
+    rubric: Any, problem_structure: Dict[str, Any], grading_modes: Sequence[str], model: str = DEFAULT_MODEL
+) -> List[context_cache.Prefix]:
+    """Prompt prefixes the given grading modes send for an assignment's rubric."""
+    prefixes: Dict[str, context_cache.Prefix] = {}
+
+    def add(system: str, parts: List[str]) -> None:
+        prefix = context_cache.Prefix(model=model, system=system, parts=tuple(parts))
+        prefixes.setdefault(prefix.digest, prefix)
+
+    for mode in grading_modes:
+        if mode == "single_pass":
+            add(SINGLE_PASS_SYSTEM_PROMPT, [_single_pass_text(rubric, problem_structure)])
+            continue
+        add(PROBLEM_EXTRACTION_SYSTEM_PROMPT, _extraction_prefix(problem_structure))
+        graded = [[problem] for problem in rubric] if mode == "per_problem" and isinstance(rubric, list) else [rubric]
+        for entry in graded:
+            add(GRADING_SYSTEM_PROMPT, [_grading_texts(entry, "")[0]])
+    return list(prefixes.values())
+
+
+async def awarm_context_caches(rubric: Any, problem_structure: Dict[str, Any], grading_mode: str) -> int:
+    """Create the context caches an assignment's calls in `grading_mode` will use.
+
+    Prefixes too short to cache are skipped. Returns the number of caches that
+    are live afterwards; grading works the same (inline) when it is zero.
+    """
+    if not context_cache.ENABLED:
+        return 0
+    _ensure_api_key()
+    client = get_client()
+    prefixes = _context_prefixes(rubric, problem_structure, [grading_mode])
+    names = await asyncio.gather(*(context_cache.aresolve(client, _caches_limiter(), prefix) for prefix in prefixes))
+    return sum(1 for name in names if name is not None)
+
+
+async def ainvalidate_context_caches(rubric: Any, problem_structure: Dict[str, Any]) -> None:
+    """Delete the context caches built from a rubric that has been replaced."""
+    _ensure_api_key()
+    client = get_client()
+    prefixes = _context_prefixes(rubric, problem_structure, ["two_stage", "single_pass", "per_problem"])
+    await asyncio.gather(*(context_cache.ainvalidate(client, _caches_limiter(), prefix) for prefix in prefixes))
 
 
 __all__ = [
     "preprocess",
     "extract_submission",
     "grade_submission",
+    "apreprocess",
+    "aextract_submission",
+    "agrade_submission",
+    "grade_submission_single_pass",
+    "agrade_submission_by_problem",
+    "split_markdown_by_problem",
+    "agrade_submission_single_pass",
     "rubric_to_problem_structure",
+    "set_max_concurrency",
+    "upload_files",
+    "aupload_files",
+    "awarm_context_caches",
+    "ainvalidate_context_caches",
 ]
 
 
@@ -0,0 +1,221 @@
+"""Local page segmentation of submission PDFs.
+
+Reads the PDF's text layer with pypdf (no network), finds where each problem's
+answer starts and writes per-problem page subsets, so model calls attach only
+the pages that matter instead of the whole submission.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .file_cache import file_sha256
+from .problems import problem_key
+
+logger = logging.getLogger(__name__)
+
+PAGE_SEGMENTS_ENABLED = os.getenv("GRADER_PAGE_SEGMENTS", "1") != "0"
+SEGMENT_DIR = Path(os.getenv("GRADER_SEGMENT_DIR", "uploads/segments"))
+
+# Gemini bills every PDF page as 258 input tokens, whatever is on it
+TOKENS_PER_PAGE = 258
+# Less text than this per page on average means a scan without a text layer
+MIN_TEXT_CHARS_PER_PAGE = 20
+# Text before the first problem heading shorter than this is a cover page and
+# is dropped; anything longer is kept with every problem.
+COVER_MAX_CHARS = 300
+# A heading with less text above it on its page starts the page
+TOP_OF_PAGE_CHARS = 40
+
+_LABEL = r"(?:problem|question|exercise|prob\.?|q)\s*#?\s*"
+
+
+@dataclass(frozen=True)
+class PdfPart:
+    """A PDF on disk holding some pages (1-based) of a submission."""
+
+    path: str
+    sha256: str
+    pages: Tuple[int, ...]
+    size: int
+
+
+@dataclass(frozen=True)
+class Segmentation:
+    source: PdfPart
+    # Pages belonging to any problem; the whole source when nothing can be dropped
+    relevant: PdfPart
+    # Per problem id; problems that were not located get `relevant`
+    problems: Dict[str, PdfPart]
+
+    def report(self, attached: Sequence[PdfPart], page_numbers: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        """Savings when the model calls attach `attached` instead of the whole PDF each time.
+
+        `page_numbers` gives the original page number of each source page when
+        the source is an optimized copy with blank pages left out.
+        """
+        page_count = len(self.source.pages)
+        uploaded = {part.sha256: part.size for part in attached}
+        number = (lambda page: page_numbers[page - 1]) if page_numbers else (lambda page: page)
+        return {
+            "pages": page_count,
+            "relevant_pages": len(self.relevant.pages),
+            "problem_pages": {pid: [number(page) for page in part.pages] for pid, part in self.problems.items()},
+            "pdf_tokens": sum(len(part.pages) for part in attached) * TOKENS_PER_PAGE,
+            "tokens_saved": sum(page_count - len(part.pages) for part in attached) * TOKENS_PER_PAGE,
+            "uploaded_bytes": sum(uploaded.values()),
+            "bytes_saved": self.source.size - sum(uploaded.values()),
+        }
+
+
+def _heading_patterns(key: str) -> Tuple[re.Pattern, re.Pattern]:
+    # "1" must not match "10" or "1.2"
+    number = re.escape(key) + r"(?!\.?\d)"
+    labelled = re.compile(rf"^[ \t]*{_LABEL}{number}", re.IGNORECASE | re.MULTILINE)
+    bare = re.compile(rf"^[ \t]*{number}[ \t]*[.):]", re.MULTILINE)
+    return labelled, bare
+
+
+def _find_starts(texts: List[str], keys: Dict[str, List[str]]) -> Dict[str, Tuple[int, int]]:
+    """(page index, offset) of each problem's first heading.
+
+    Labelled headings ("Problem 2", "Q2") are preferred; bare numbers ("2.")
+    are only used when the document has no labelled heading at all.
+    """
+    patterns = {pid: [_heading_patterns(key) for key in candidates] for pid, candidates in keys.items()}
+    for style in (0, 1):
+        starts: Dict[str, Tuple[int, int]] = {}
+        for pid, options in patterns.items():
+            for page, text in enumerate(texts):
+                matches = [m.start() for pair in options if (m := pair[style].search(text))]
+                if matches:
+                    starts[pid] = (page, min(matches))
+                    break
+        if starts:
+            return starts
+    return {}
+
+
+def map_pages(texts: List[str], problem_structure: List[Dict[str, Any]]) -> Tuple[Dict[str, List[int]], List[int]]:
+    """Map problem ids to the 1-based pages holding their answers.
+
+    Returns the located problems' pages and the pages shared by all problems
+    (substantial text before the first heading). A problem runs from its
+    heading to the next problem's heading, sharing a page when the next one
+    starts mid-page.
+    """
+    keys: Dict[str, List[str]] = {}
+    for problem in problem_structure or []:
+        if not isinstance(problem, dict) or "id" not in problem:
+            continue
+        candidates = [problem_key(problem["name"])] if problem.get("name") else []
+        keys[str(problem["id"])] = list(dict.fromkeys(candidates + [problem_key(problem["id"])]))
+
+    starts = _find_starts(texts, keys)
+    if not starts:
+        return {}, []
+    ordered = sorted(starts.items(), key=lambda item: item[1])
+
+    pages: Dict[str, List[int]] = {}
+    for idx, (pid, (page, _)) in enumerate(ordered):
+        last = len(texts) - 1
+        if idx + 1 < len(ordered):
+            next_page, next_offset = ordered[idx + 1][1]
+            top_of_page = len(texts[next_page][:next_offset].strip()) < TOP_OF_PAGE_CHARS
+            last = next_page - 1 if top_of_page and next_page > page else next_page
+        pages[pid] = list(range(page + 1, last + 2))
+
+    first_page, first_offset = ordered[0][1]
+    preamble = "".join(texts[:first_page]) + texts[first_page][:first_offset]
+    shared = list(range(1, first_page + 1)) if len(preamble.strip()) > COVER_MAX_CHARS else []
+    return pages, shared
+
+
+def _page_label(pages: Sequence[int]) -> str:
+    """'1-3_7' for pages 1, 2, 3 and 7; hashed when too long for a file name."""
+    ranges: List[str] = []
+    start = prev = pages[0]
+    for page in [*pages[1:], None]:
+        if page is not None and page == prev + 1:
+            prev = page
+            continue
+        ranges.append(str(start) if start == prev else f"{start}-{prev}")
+        if page is not None:
+            start = prev = page
+    label = "_".join(ranges)
+    return label if len(label) <= 64 else hashlib.sha256(label.encode()).hexdigest()[:16]
+
+
+def _write_part(reader: Any, source: PdfPart, pages: Sequence[int]) -> PdfPart:
+    """Write `pages` of the source to SEGMENT_DIR, reusing an earlier copy."""
+    from pypdf import PdfWriter
+
+    pages = tuple(pages)
+    if pages == source.pages:
+        return source
+    path = SEGMENT_DIR / f"{source.sha256[:16]}-{_page_label(pages)}.pdf"
+    if path.exists():
+        return PdfPart(str(path), file_sha256(str(path)), pages, path.stat().st_size)
+
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    data = buffer.getvalue()
+    SEGMENT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return PdfPart(str(path), hashlib.sha256(data).hexdigest(), pages, len(data))
+
+
+def segment_pdf(
+    pdf_path: str,
+    problem_structure: List[Dict[str, Any]],
+    *,
+    sha256: Optional[str] = None,
+) -> Optional[Segmentation]:
+    """Split a submission into per-problem page subsets.
+
+    Returns None when segmentation is disabled (GRADER_PAGE_SEGMENTS=0), the PDF
+    cannot be read, has no usable text layer (scans) or no problem heading is
+    found; callers then attach the whole PDF as before.
+    """
+    if not PAGE_SEGMENTS_ENABLED or not problem_structure:
+        return None
+    # Imported here so the API starts without loading pypdf
+    from pypdf import PdfReader
+
+    try:
+        reader = PdfReader(pdf_path)
+        texts = [page.extract_text() or "" for page in reader.pages]
+    except Exception:
+        logger.warning("Could not read the text layer of %s", pdf_path, exc_info=True)
+        return None
+    if not texts or sum(len(text.strip()) for text in texts) < MIN_TEXT_CHARS_PER_PAGE * len(texts):
+        return None
+
+    pages, shared = map_pages(texts, problem_structure)
+    if not pages:
+        return None
+
+    all_pages = tuple(range(1, len(texts) + 1))
+    source = PdfPart(str(pdf_path), sha256 or file_sha256(str(pdf_path)), all_pages, os.path.getsize(pdf_path))
+    ids = [str(problem["id"]) for problem in problem_structure if isinstance(problem, dict) and "id" in problem]
+    if len(pages) < len(ids):
+        # An unlocated problem may be answered anywhere
+        relevant = source
+    else:
+        relevant = _write_part(reader, source, sorted(set(shared).union(*pages.values())))
+
+    problems = {
+        pid: _write_part(reader, source, sorted(set(shared) | set(pages[pid]))) if pid in pages else relevant
+        for pid in ids
+    }
+    return Segmentation(source=source, relevant=relevant, problems=problems)
@@ -0,0 +1,280 @@
+"""Local size optimization of scanned submission PDFs before they are uploaded.
+
+Phone scans are often tens of megabytes of full-resolution JPEGs, sent to
+Gemini once per model call. This stage writes an optimized copy with pypdf and
+Pillow (no network), next to the original that reviewers see:
+
+- embedded images are downsampled to GRADER_PDF_TARGET_DPI and re-encoded as
+  JPEG (kept only where that is smaller);
+- blank pages (no text, no drawing, no ink on their images) are dropped;
+- objects no page uses any more are left out.
+
+Copies are content-addressed by the source's SHA-256 and the settings, so every
+call and re-grade of a submission reuses the same file.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import metrics
+from .file_cache import file_sha256
+from .page_segments import TOKENS_PER_PAGE
+
+logger = logging.getLogger(__name__)
+
+PDF_OPTIMIZE_ENABLED = os.getenv("GRADER_PDF_OPTIMIZE", "1") != "0"
+OPTIMIZED_DIR = Path(os.getenv("GRADER_OPTIMIZED_DIR", "uploads/optimized"))
+# Smaller PDFs are uploaded as they are
+MIN_BYTES = int(float(os.getenv("GRADER_PDF_OPTIMIZE_MIN_MB", "2")) * 2**20)
+TARGET_DPI = int(os.getenv("GRADER_PDF_TARGET_DPI", "150"))
+JPEG_QUALITY = int(os.getenv("GRADER_PDF_JPEG_QUALITY", "75"))
+
+# The copy is only used when it is at least this much smaller than the source
+MIN_SAVING = 0.1
+# Encoded images below this size are left alone
+MIN_IMAGE_BYTES = 32 * 1024
+# Images are downsampled only when above the target by more than this factor
+DPI_TOLERANCE = 1.1
+
+# Blank-page detection: a pixel darker than INK_LEVEL is ink, and a page is
+# blank when no cell of a BLANK_GRID x BLANK_GRID grid over its images holds
+# more than BLANK_CELL_INK ink (scanner noise and dust stay below it, a
+# handwritten character does not).
+INK_LEVEL = 160
+BLANK_GRID = 16
+BLANK_CELL_INK = 0.02
+# Content-stream operators that place images rather than draw
+_PLACEMENT_OPS = {b"q", b"Q", b"cm", b"Do", b"gs", b"re", b"W", b"W*", b"n", b"rg", b"g", b"f"}
+_MAX_DRAWING_OPS = 4
+
+
+@dataclass(frozen=True)
+class OptimizedPdf:
+    """An optimized copy of a submission PDF."""
+
+    path: str
+    sha256: str
+    size: int
+    source_size: int
+    # 1-based source pages in the copy, and the blank ones left out
+    kept_pages: Tuple[int, ...]
+    dropped_pages: Tuple[int, ...]
+    images_resampled: int
+    images_reencoded: int
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "original_bytes": self.source_size,
+            "optimized_bytes": self.size,
+            "bytes_saved": self.source_size - self.size,
+            "pages": len(self.kept_pages) + len(self.dropped_pages),
+            "dropped_pages": list(self.dropped_pages),
+            "tokens_saved": len(self.dropped_pages) * TOKENS_PER_PAGE,
+            "images_resampled": self.images_resampled,
+            "images_reencoded": self.images_reencoded,
+        }
+
+
+def _pillow() -> Any:
+    """PIL.Image, imported on first use so it stays out of startup; None if not installed."""
+    try:
+        from PIL import Image
+    except ImportError:  # the stage is skipped without Pillow
+        return None
+    return Image
+
+
+def _page_inches(page: Any) -> float:
+    """Longer side of the page in inches."""
+    return max(float(page.mediabox.width), float(page.mediabox.height)) / 72
+
+
+def _page_images(page: Any) -> Tuple[List[Tuple[str, Any]], bool]:
+    """(name, reference) of the page's image XObjects, and whether it also draws form XObjects."""
+    from pypdf.generic import IndirectObject
+
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    images: List[Tuple[str, Any]] = []
+    forms = False
+    for name, ref in (xobjects.get_object().items() if xobjects is not None else ()):
+        if isinstance(ref, IndirectObject) and ref.get_object().get("/Subtype") == "/Image":
+            images.append((name, ref))
+        else:
+            forms = True
+    return images, forms
+
+
+def _decode(page: Any, name: str, xobject: Any, longest: int) -> Any:
+    """The image of an XObject, at no less than `longest` pixels on its longer side.
+
+    JPEGs are decoded with Pillow's DCT scaling (1/2, 1/4 or 1/8 size), which is
+    much faster than a full decode; other images are decoded by pypdf.
+    """
+    from PIL import Image
+
+    filters = xobject.get("/Filter")
+    if filters == "/DCTDecode" or (isinstance(filters, list) and list(filters) == ["/DCTDecode"]):
+        image = Image.open(io.BytesIO(xobject._data))
+        if image.mode in ("RGB", "L"):
+            scale = longest / max(image.size)
+            image.draft(image.mode, (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+            image.load()
+            return image
+    return page.images[name].image
+
+
+def _has_ink(image: Any) -> bool:
+    from PIL import Image, ImageOps
+
+    gray = ImageOps.grayscale(image)
+    gray = gray.reduce(max(1, max(gray.size) // 800))
+    ink = gray.point(lambda value: 255 if value < INK_LEVEL else 0)
+    grid = (min(BLANK_GRID, ink.width), min(BLANK_GRID, ink.height))
+    # Each grid pixel is the mean ink of its cell
+    return ink.resize(grid, Image.BOX).getextrema()[1] > 255 * BLANK_CELL_INK
+
+
+def _is_blank(page: Any, images: List[Tuple[str, Any]], forms: bool) -> bool:
+    from pypdf.generic import ContentStream
+
+    if forms or (page.extract_text() or "").strip() or "/Annots" in page:
+        return False
+    contents = page.get_contents()
+    if contents is not None:
+        operations = ContentStream(contents, page.pdf).operations
+        if sum(op not in _PLACEMENT_OPS for _, op in operations) > _MAX_DRAWING_OPS:
+            return False
+    return not any(_has_ink(_decode(page, name, ref.get_object(), 800)) for name, ref in images)
+
+
+def _shrink(page: Any, name: str, xobject: Any) -> Optional[bool]:
+    """Re-encode one image as JPEG in place; True if it was also downsampled, None if left alone."""
+    from PIL import Image
+    from pypdf.generic import NameObject, NumberObject
+
+    encoded = len(xobject._data or b"")
+    if encoded < MIN_IMAGE_BYTES or xobject.get("/BitsPerComponent") == 1:
+        return None
+    if any(key in xobject for key in ("/SMask", "/Mask", "/ImageMask", "/Decode")):
+        return None
+    width, height = int(xobject["/Width"]), int(xobject["/Height"])
+    # Resolution if drawn over the whole page; a lower bound for smaller placements
+    dpi = max(width, height) / _page_inches(page) if _page_inches(page) > 0 else 0
+    resampled = dpi > TARGET_DPI * DPI_TOLERANCE
+    longest = round(max(width, height) * TARGET_DPI / dpi) if resampled else max(width, height)
+    image = _decode(page, name, xobject, longest)
+    if image.mode not in ("RGB", "L", "CMYK", "P"):
+        return None
+    image = image.convert("L" if image.mode == "L" else "RGB")
+    if max(image.size) > longest:
+        scale = longest / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=JPEG_QUALITY)
+    if buffer.tell() >= encoded * (1 - MIN_SAVING):
+        return None
+    # pypdf cannot re-encode DCT streams itself; swap the encoded bytes and describe them
+    for key in ("/DecodeParms", "/Intent"):
+        xobject.pop(key, None)
+    xobject.update(
+        {
+            NameObject("/Filter"): NameObject("/DCTDecode"),
+            NameObject("/Width"): NumberObject(image.width),
+            NameObject("/Height"): NumberObject(image.height),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray" if image.mode == "L" else "/DeviceRGB"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        }
+    )
+    xobject._data = buffer.getvalue()
+    return resampled
+
+
+def _optimize(pdf_path: str, output: Path) -> Optional[OptimizedPdf]:
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter(clone_from=PdfReader(pdf_path))
+    seen: set = set()
+    blank: List[int] = []
+    page_images = []
+    for number, page in enumerate(writer.pages, start=1):
+        images, forms = _page_images(page)
+        if _is_blank(page, images, forms):
+            blank.append(number)
+        page_images.append(images)
+    # A submission is never reduced to nothing
+    dropped = tuple(blank) if len(blank) < len(writer.pages) else ()
+    kept = tuple(number for number in range(1, len(writer.pages) + 1) if number not in dropped)
+    resampled = reencoded = 0
+    for number in kept:
+        page = writer.pages[number - 1]
+        for name, ref in page_images[number - 1]:
+            if ref.idnum in seen:
+                continue
+            seen.add(ref.idnum)
+            shrunk = _shrink(page, name, ref.get_object())
+            if shrunk is not None:
+                reencoded += 1
+                resampled += shrunk
+    for number in reversed(dropped):
+        del writer.pages[number - 1]
+    for page in writer.pages:
+        for key in ("/Thumb", "/PieceInfo"):
+            page.pop(key, None)
+        page.compress_content_streams()
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    data = buffer.getvalue()
+    source_size = os.path.getsize(pdf_path)
+    if len(data) > source_size * (1 - MIN_SAVING):
+        return None
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(f".{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, output)
+    return OptimizedPdf(
+        str(output), hashlib.sha256(data).hexdigest(), len(data), source_size, kept, dropped, resampled, reencoded
+    )
+
+
+def optimize_pdf(pdf_path: str, *, sha256: Optional[str] = None) -> Optional[OptimizedPdf]:
+    """The optimized copy of a submission PDF, written on first use.
+
+    Returns None when the stage is disabled (GRADER_PDF_OPTIMIZE=0), Pillow is
+    not installed, the PDF is under GRADER_PDF_OPTIMIZE_MIN_MB, cannot be read,
+    or would not get at least MIN_SAVING smaller; callers then use the original.
+    That outcome is remembered too, so a PDF is only ever processed once.
+    """
+    if not PDF_OPTIMIZE_ENABLED or _pillow() is None or os.path.getsize(pdf_path) < MIN_BYTES:
+        return None
+    sha256 = sha256 or file_sha256(pdf_path)
+    output = OPTIMIZED_DIR / f"{sha256[:16]}-{TARGET_DPI}dpi-q{JPEG_QUALITY}.pdf"
+    record = output.with_suffix(".json")
+    if record.exists():
+        fields = json.loads(record.read_text())
+        if fields is None or not output.exists():
+            return None
+        fields["kept_pages"], fields["dropped_pages"] = tuple(fields["kept_pages"]), tuple(fields["dropped_pages"])
+        return OptimizedPdf(**fields)
+
+    try:
+        optimized = _optimize(pdf_path, output)
+    except Exception:
+        logger.warning("Could not optimize %s; uploading it as it is", pdf_path, exc_info=True)
+        return None
+    OPTIMIZED_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = record.with_name(f".{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(asdict(optimized) if optimized else None))
+    os.replace(tmp, record)
+    if optimized is not None:
+        metrics.count_pdf_bytes_saved(optimized.source_size - optimized.size)
+    return optimized
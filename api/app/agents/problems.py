@@ -0,0 +1,76 @@
+"""Rubric and extraction-markdown helpers that need no model client.
+
+Kept apart from `llm_grading` so routers, exports and rubric diffs can use
+them without importing google-genai and langchain at startup.
+"""
+import re
+from typing import Any, Dict, List
+
+
+def rubric_to_problem_structure(score_rubric: List[Dict[str, Any]]) -> Dict[str, Any]:
+    structure: List[Dict[str, Any]] = []
+
+    for problem in score_rubric or []:
+        if not isinstance(problem, dict):
+            continue
+
+        problem_entry: Dict[str, Any] = {}
+
+        if "id" in problem:
+            problem_entry["id"] = problem["id"]
+        if "name" in problem:
+            problem_entry["name"] = problem["name"]
+
+        if "description" in problem:
+            problem_entry["description"] = problem["description"]
+
+        items = problem.get("items")
+        if isinstance(items, list):
+            minimized_items: List[Dict[str, Any]] = []
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                item_entry: Dict[str, Any] = {}
+                if "id" in item:
+                    item_entry["id"] = item["id"]
+                if "description" in item:
+                    item_entry["description"] = item["description"]
+                if item_entry:
+                    minimized_items.append(item_entry)
+            if minimized_items:
+                problem_entry["items"] = minimized_items
+
+        if problem_entry:
+            structure.append(problem_entry)
+
+    return structure
+
+
+_PROBLEM_HEADING = re.compile(r"^##(?!#)\s*(.+?)\s*$", re.MULTILINE)
+
+
+def problem_key(text: str) -> str:
+    """Normalise 'Problem 3', 'problem 3:' or '3' to '3' for matching headings to rubric entries."""
+    m = re.search(r"(\d+(?:\.\d+)*)", str(text))
+    return m.group(1) if m else str(text).strip().lower()
+
+
+def split_markdown_by_problem(student_markdown: str, rubric: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Split extraction markdown into per-problem sections keyed by rubric problem id.
+
+    Sections are the level-2 headings produced by the extraction prompt
+    ("## Problem 1"). A problem without a matching section maps to the whole
+    markdown so it can still be graded.
+    """
+    headings = list(_PROBLEM_HEADING.finditer(student_markdown or ""))
+    sections: Dict[str, str] = {}
+    for idx, m in enumerate(headings):
+        end = headings[idx + 1].start() if idx + 1 < len(headings) else len(student_markdown)
+        sections.setdefault(problem_key(m.group(1)), student_markdown[m.start():end].strip())
+
+    by_problem: Dict[str, str] = {}
+    for problem in rubric or []:
+        pid = str(problem.get("id"))
+        section = sections.get(problem_key(problem.get("name", ""))) or sections.get(problem_key(pid))
+        by_problem[pid] = section if section is not None else student_markdown
+    return by_problem
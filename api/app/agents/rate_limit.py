@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Quota defaults (per model, per process); override per model with GRADER_RATE_LIMITS,
+# e.g. '{"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}'.
+DEFAULT_RPM = float(os.getenv("GRADER_RATE_LIMIT_RPM", "1000"))
+DEFAULT_TPM = float(os.getenv("GRADER_RATE_LIMIT_TPM", "1000000"))
+FILES_RPM = float(os.getenv("GRADER_FILES_RPM", "600"))
+CACHES_RPM = float(os.getenv("GRADER_CACHES_RPM", "600"))
+MAX_THROTTLE_RETRIES = int(os.getenv("GRADER_THROTTLE_RETRIES", "5"))
+
+# AIMD tuning: +1 slot per window of successes, halve on throttling
+DECREASE_FACTOR = 0.5
+MIN_WINDOW = 1.0
+# Without a Retry-After hint, pause this long after a 429
+DEFAULT_THROTTLE_PAUSE_S = 5.0
+
+_WAIT_STEP_S = 0.05
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s"),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+)
+
+
+class Throttled(Exception):
+    """Raised when a call is still throttled after MAX_THROTTLE_RETRIES retries."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_throttle(exc: BaseException) -> bool:
+    """True for quota errors from genai, google-api-core or LangChain wrappers of them."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if _status_code(exc) == 429 or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests"):
+            return True
+        text = str(exc)
+        # genai errors read "429 RESOURCE_EXHAUSTED. {...}"
+        if "RESOURCE_EXHAUSTED" in text or text.split(" ", 1)[0] == "429":
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header or RetryInfo details."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    text = f"{getattr(exc, 'details', '')} {exc} {exc.__cause__ or ''}"
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class RateLimiter:
+    """Client-side budget for one model (or the file API).
+
+    Requests and estimated tokens are drawn from per-minute token buckets, and
+    in-flight calls are capped by an AIMD window: each success widens it by
+    1/window (about +1 per window of successes), each 429 halves it and pauses
+    new calls for the server's Retry-After. Throughput therefore settles just
+    under the quota instead of oscillating into errors. Thread-safe; usable
+    from both sync and async callers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        rpm: float,
+        tpm: Optional[float] = None,
+        max_window: float = 16,
+        initial_window: Optional[float] = None,
+    ):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_window = max(max_window, MIN_WINDOW)
+        self.window = initial_window or max(MIN_WINDOW, self.max_window / 2)
+        self._lock = threading.Lock()
+        self._requests = rpm
+        self._tokens = tpm or 0.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._stats = {"calls": 0, "throttled": 0, "retried": 0, "waited_s": 0.0}
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and budget, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self.window):
+                return _WAIT_STEP_S
+            if self._requests < 1:
+                return (1 - self._requests) * 60 / self.rpm
+            # A request larger than the whole bucket waits for a full bucket, then runs into debt
+            needed = min(tokens, self.tpm) if self.tpm else 0
+            if self.tpm and self._tokens < needed:
+                return (needed - self._tokens) * 60 / self.tpm
+            self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            self._in_flight += 1
+            return 0.0
+
+    def _release(self, *, estimated: int, actual: Optional[int], throttled: Optional[BaseException]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._stats["calls"] += 1
+            if throttled is not None:
+                self._stats["throttled"] += 1
+                self.window = max(MIN_WINDOW, self.window * DECREASE_FACTOR)
+                pause = retry_after(throttled) or DEFAULT_THROTTLE_PAUSE_S
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                # The failed request still counted against the server's quota
+                return
+            self.window = min(self.max_window, self.window + 1 / self.window)
+            if self.tpm and actual is not None:
+                self._tokens -= actual - estimated
+
+    def _record_wait(self, waited: float) -> None:
+        if waited:
+            with self._lock:
+                self._stats["waited_s"] += waited
+
+    @contextmanager
+    def slot(self, tokens: int = 0) -> Iterator[Dict[str, Any]]:
+        """Blocking acquire; set `usage["tokens"]` inside the block to reconcile the estimate."""
+        started = time.monotonic()
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(min(wait, 1.0))
+        self._record_wait(time.monotonic() - started)
+        usage: Dict[str, Any] = {}
+        try:
+            yield usage
+        except BaseException as exc:
+            self._release(estimated=tokens, actual=None, throttled=exc if is_throttle(exc) else None)
+            raise
+        self._release(estimated=tokens, actual=usage.get("tokens"), throttled=None)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        """Async `slot`; waits without blocking the event loop."""
+        started = time.monotonic()
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(min(wait, 1.0))
+        self._record_wait(time.monotonic() - started)
+        usage: Dict[str, Any] = {}
+        try:
+            yield usage
+        except BaseException as exc:
+            self._release(estimated=tokens, actual=None, throttled=exc if is_throttle(exc) else None)
+            raise
+        self._release(estimated=tokens, actual=usage.get("tokens"), throttled=None)
+
+    def call(self, fn: Callable[[], T], *, tokens: int = 0, usage_of: Optional[Callable[[T], int]] = None) -> T:
+        """Run `fn` under the limiter, retrying it when throttled."""
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            try:
+                with self.slot(tokens) as usage:
+                    result = fn()
+                    if usage_of is not None:
+                        usage["tokens"] = usage_of(result)
+                    return result
+            except Exception as exc:
+                if not is_throttle(exc):
+                    raise
+                if attempt == MAX_THROTTLE_RETRIES:
+                    raise Throttled(f"{self.name}: still throttled after {attempt} retries") from exc
+                self._count_retry()
+        raise AssertionError("unreachable")
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        tokens: int = 0,
+        usage_of: Optional[Callable[[T], int]] = None,
+    ) -> T:
+        """Async `call`; `fn` is a zero-argument coroutine factory (called once per attempt)."""
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            try:
+                async with self.aslot(tokens) as usage:
+                    result = await fn()
+                    if usage_of is not None:
+                        usage["tokens"] = usage_of(result)
+                    return result
+            except Exception as exc:
+                if not is_throttle(exc):
+                    raise
+                if attempt == MAX_THROTTLE_RETRIES:
+                    raise Throttled(f"{self.name}: still throttled after {attempt} retries") from exc
+                self._count_retry()
+        raise AssertionError("unreachable")
+
+    def _count_retry(self) -> None:
+        with self._lock:
+            self._stats["retried"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                **self._stats,
+                "window": round(self.window, 2),
+                "in_flight": self._in_flight,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests_available": round(self._requests, 1),
+                "tokens_available": round(self._tokens) if self.tpm else None,
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _overrides() -> Dict[str, Dict[str, float]]:
+    raw = os.getenv("GRADER_RATE_LIMITS")
+    return json.loads(raw) if raw else {}
+
+
+def get_limiter(model: str, *, max_window: float) -> RateLimiter:
+    """Process-wide limiter for `model`; created on first use."""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limits = _overrides().get(model, {})
+            limiter = RateLimiter(
+                model,
+                rpm=float(limits.get("rpm", DEFAULT_RPM)),
+                tpm=float(limits.get("tpm", DEFAULT_TPM)),
+                max_window=max_window,
+            )
+            _limiters[model] = limiter
+        return limiter
+
+
+def get_files_limiter(*, max_window: float) -> RateLimiter:
+    """Limiter for file API calls (upload/get), which have their own request quota."""
+    with _limiters_lock:
+        limiter = _limiters.get("files")
+        if limiter is None:
+            limiter = _limiters["files"] = RateLimiter("files", rpm=FILES_RPM, max_window=max_window)
+        return limiter
+
+
+def get_caches_limiter(*, max_window: float) -> RateLimiter:
+    """Limiter for context cache API calls (create/update/delete).
+
+    It is separate from the model limiters: caches are resolved while a model
+    call already holds a slot of those.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get("caches")
+        if limiter is None:
+            limiter = _limiters["caches"] = RateLimiter("caches", rpm=CACHES_RPM, max_window=max_window)
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def reset() -> None:
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,213 @@
+import os
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import zstandard
+
+# Bumped whenever the key derivation or stored payload changes shape.
+_KEY_VERSION = 1
+
+
+def _normalize_content(content: Any) -> Any:
+    """Drop remote file URIs from message content; files are keyed by their hashes instead."""
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "media":
+                parts.append({"type": "media", "mime_type": part.get("mime_type")})
+            else:
+                parts.append(part)
+        return parts
+    return content
+
+
+def cache_key(
+    model: str,
+    generation_config: Optional[Dict[str, Any]],
+    messages: List[Any],
+    file_hashes: List[str],
+) -> str:
+    """Content address of a model call: model, config, prompts, user content and attached file hashes."""
+    payload = {
+        "v": _KEY_VERSION,
+        "model": model,
+        "config": generation_config or {},
+        "messages": [{"role": m.type, "content": _normalize_content(m.content)} for m in messages],
+        "files": list(file_hashes),
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of model responses with TTL and LRU/size-based eviction.
+
+    Responses are zstd-compressed in SQLite. Each entry also remembers the
+    token count of the original call so hits can be reported as quota saved.
+    """
+
+    def __init__(self, path: str, *, max_bytes: int, ttl_s: float, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "tokens_saved": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " tokens INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_created_at ON responses (created_at)")
+            self._init_total_size(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _init_total_size(conn: sqlite3.Connection) -> None:
+        """Keep the total size of all entries in a metadata row, updated by triggers.
+
+        This works across every process sharing the file. The table is summed
+        only when the row is missing, e.g. for a cache written before the row
+        existed.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN"
+            " UPDATE meta SET value = value + NEW.size WHERE name = 'total_size'; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN"
+            " UPDATE meta SET value = value - OLD.size WHERE name = 'total_size'; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses BEGIN"
+            " UPDATE meta SET value = value - OLD.size + NEW.size WHERE name = 'total_size'; END"
+        )
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'total_size'").fetchone() is None:
+            conn.execute(
+                "INSERT INTO meta (name, value) SELECT 'total_size', COALESCE(SUM(size), 0) FROM responses"
+            )
+        conn.commit()
+
+    @staticmethod
+    def _total_size(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, tokens, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl_s:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._stats["hits"] += 1
+            self._stats["tokens_saved"] += row[1]
+        return self._decompressor.decompress(row[0]).decode("utf-8")
+
+    def put(self, key: str, content: str, *, tokens: int = 0) -> None:
+        if not self.enabled:
+            return
+        blob = self._compressor.compress(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # An upsert, not INSERT OR REPLACE: REPLACE deletes without firing the size trigger
+            conn.execute(
+                "INSERT INTO responses (key, value, size, tokens, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                " tokens = excluded.tokens, created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                (key, blob, len(blob), tokens, now, now),
+            )
+            self._stats["stores"] += 1
+            self._evict(conn, now)
+            conn.commit()
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then least recently used ones until under `max_bytes`."""
+        expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,)).rowcount
+        self._stats["evictions"] += max(expired, 0)
+        total = self._total_size(conn)
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._stats["evictions"] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            entries, size = (0, 0)
+            if self.enabled:
+                conn = self._connection()
+                entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                size = self._total_size(conn)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(
+            enabled=self.enabled,
+            entries=entries,
+            size_bytes=size,
+            max_bytes=self.max_bytes,
+            hit_rate=(stats["hits"] / lookups) if lookups else 0.0,
+        )
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache configured from GRADER_RESPONSE_CACHE_* env vars."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            os.getenv("GRADER_RESPONSE_CACHE_PATH", "response_cache.db"),
+            max_bytes=int(float(os.getenv("GRADER_RESPONSE_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            ttl_s=float(os.getenv("GRADER_RESPONSE_CACHE_TTL_S", str(7 * 24 * 3600))),
+            enabled=os.getenv("GRADER_RESPONSE_CACHE", "1") != "0",
+        )
+    return _cache
+
+
+def usage_tokens(response: Any) -> int:
+    """Total token count reported by a LangChain AI message, or 0 if absent."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens") or 0)
+
@@ -0,0 +1,65 @@
+"""Which problems of a rubric changed, and which grades they make stale.
+
+Problems are matched by id and compared by a digest of their canonical JSON,
+so reordering problems or reformatting the rubric is not a change. Each graded
+submission records the digests of the problems it was graded against
+(`rubric_digests`); after an edit only problems whose digest moved need a new
+grading call, and the stored extraction can be reused for them.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from .problems import problem_key
+
+
+def problem_digests(rubric: Any) -> Dict[str, str]:
+    """Problem id -> digest of that problem's rubric entry."""
+    if not isinstance(rubric, list):
+        return {}
+    digests: Dict[str, str] = {}
+    for problem in rubric:
+        if isinstance(problem, dict) and "id" in problem:
+            encoded = json.dumps(problem, sort_keys=True, ensure_ascii=False).encode("utf-8")
+            digests[str(problem["id"])] = hashlib.sha256(encoded).hexdigest()
+    return digests
+
+
+def diff_rubrics(old: Any, new: Any) -> Dict[str, List[str]]:
+    """Problem ids that were `changed`, `added`, `removed` or `unchanged` from `old` to `new`."""
+    before, after = problem_digests(old), problem_digests(new)
+    return {
+        "changed": [pid for pid in after if pid in before and before[pid] != after[pid]],
+        "added": [pid for pid in after if pid not in before],
+        "removed": [pid for pid in before if pid not in after],
+        "unchanged": [pid for pid in after if before.get(pid) == after[pid]],
+    }
+
+
+def stale_problems(graded_digests: Optional[Dict[str, str]], rubric: Any) -> Optional[List[str]]:
+    """Problems of `rubric` whose grade was made against another version of them.
+
+    None when the submission has no recorded digests (graded before they were
+    kept), meaning only a full re-grade is safe.
+    """
+    if graded_digests is None:
+        return None
+    return [pid for pid, digest in problem_digests(rubric).items() if graded_digests.get(pid) != digest]
+
+
+def merge_graded(
+    graded_content: Any, regraded: List[Dict[str, Any]], rubric: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Replace the entries of re-graded problems and drop problems no longer in the rubric.
+
+    Entries are matched on their problem id and returned in rubric order.
+    """
+    by_problem: Dict[str, Dict[str, Any]] = {}
+    for entry in [*(graded_content if isinstance(graded_content, list) else []), *regraded]:
+        if isinstance(entry, dict) and "id" in entry:
+            by_problem[problem_key(entry["id"])] = entry
+    return [
+        by_problem[problem_key(problem.get("id"))]
+        for problem in rubric
+        if problem_key(problem.get("id")) in by_problem
+    ]
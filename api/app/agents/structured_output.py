@@ -0,0 +1,420 @@
+"""Response schemas for the model's JSON answers, and local validation and repair.
+
+JSON calls send a response schema (Gemini structured output) built from the
+rubric: grades may only name the rubric's problems and items, so the model is
+steered away from inventing or renaming them. Answers are still validated with
+pydantic here, since schemas do not stop truncated output (token limits), old
+cached answers or point sums that do not add up.
+
+`parse_json` recovers JSON from fenced, prose-wrapped or truncated output;
+`ArrayElementStream` reads the grades of a streamed answer one problem at a
+time, as each entry closes. `check_grades` repairs what can be decided locally (problem scores that are
+not the sum of their items, totals that differ from the rubric, scores out of
+range) and returns the rubric problems whose entry is missing or invalid, so
+the caller re-asks the model for just those problems.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from .. import metrics
+from .problems import problem_key
+
+# Send a response schema with JSON calls; set GRADER_RESPONSE_SCHEMA=0 to rely on the prompt alone.
+SCHEMA_ENABLED = os.getenv("GRADER_RESPONSE_SCHEMA", "1") != "0"
+
+# Follow-up calls for problems whose grade is still missing or invalid after
+# local repair (only those problems are sent again).
+REASK_ATTEMPTS = int(os.getenv("GRADER_REASK_ATTEMPTS", "2"))
+
+Number = Union[int, float]
+
+
+class RubricItem(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Union[str, int]
+    description: str = ""
+    points: Number
+
+
+class RubricProblem(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Union[str, int]
+    name: str
+    description: str = ""
+    items: List[RubricItem]
+    total: Optional[Number] = None
+
+
+class GradedItem(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    item: Union[str, int]
+    score: Optional[Number]
+    total_possible_score: Optional[Number] = None
+    explanation: str = ""
+    confidence: Optional[Number] = None
+
+
+class GradedProblem(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Union[str, int]
+    name: str = ""
+    items: List[GradedItem]
+    score: Optional[Number]
+    total_score: Optional[Number] = None
+    explanation: str = ""
+    confidence: Optional[Number] = None
+
+
+# -- Response schemas (JSON-schema dicts; converted to Gemini's Schema by langchain-google-genai)
+
+def _nullable(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+
+def _string(values: List[str]) -> Dict[str, Any]:
+    return {"type": "string", "enum": values} if values else {"type": "string"}
+
+
+def _problems(rubric: Any) -> List[Dict[str, Any]]:
+    return [p for p in rubric if isinstance(p, dict) and "id" in p] if isinstance(rubric, list) else []
+
+
+def rubric_schema() -> Dict[str, Any]:
+    """Schema of the rubric `preprocess` extracts."""
+    item = {
+        "type": "object",
+        "properties": {"id": {"type": "string"}, "description": {"type": "string"}, "points": {"type": "number"}},
+        "required": ["id", "description", "points"],
+    }
+    problem = {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            "name": {"type": "string"},
+            "description": {"type": "string"},
+            "items": {"type": "array", "items": item},
+            "total": {"type": "number"},
+        },
+        "required": ["id", "name", "description", "items", "total"],
+        "propertyOrdering": ["id", "name", "description", "items", "total"],
+    }
+    return {"type": "array", "items": problem}
+
+
+def grading_schema(rubric: Any) -> Dict[str, Any]:
+    """Schema of the grades for `rubric`: one entry per problem, ids and item ids from the rubric."""
+    problems = _problems(rubric)
+    item_ids = list(dict.fromkeys(str(i.get("id")) for p in problems for i in p.get("items") or [] if "id" in i))
+    item = {
+        "type": "object",
+        "properties": {
+            "item": _string(item_ids),
+            "score": _nullable({"type": "number"}),
+            "total_possible_score": {"type": "number"},
+            "explanation": {"type": "string"},
+            "confidence": {"type": "number"},
+        },
+        "required": ["item", "score", "total_possible_score", "explanation", "confidence"],
+        "propertyOrdering": ["item", "score", "total_possible_score", "explanation", "confidence"],
+    }
+    # Items come first so the problem score is written after the item scores it sums
+    order = ["id", "name", "items", "score", "total_score", "explanation", "confidence"]
+    problem = {
+        "type": "object",
+        "properties": {
+            "id": _string([str(p["id"]) for p in problems]),
+            "name": _string([str(p["name"]) for p in problems if "name" in p]),
+            "items": {"type": "array", "items": item},
+            "score": _nullable({"type": "number"}),
+            "total_score": {"type": "number"},
+            "explanation": {"type": "string"},
+            "confidence": {"type": "number"},
+        },
+        "required": order,
+        "propertyOrdering": order,
+    }
+    schema: Dict[str, Any] = {"type": "array", "items": problem}
+    if problems:
+        schema["minItems"] = schema["maxItems"] = len(problems)
+    return schema
+
+
+def single_pass_schema(rubric: Any) -> Dict[str, Any]:
+    """Schema of a single-pass answer: the extraction markdown, then the grades."""
+    return {
+        "type": "object",
+        "properties": {"extraction": {"type": "string"}, "grades": grading_schema(rubric)},
+        "required": ["extraction", "grades"],
+        "propertyOrdering": ["extraction", "grades"],
+    }
+
+
+# -- Parsing
+
+_FENCED_JSON = re.compile(r"```json\s*\n([\s\S]*?)(?:\n```|$)")
+_FENCED = re.compile(r"```\s*\n([\s\S]*?)(?:\n```|$)")
+_CLOSERS = {"{": "}", "[": "]"}
+# Truncation repair tries at most this many cut points, longest first
+_MAX_CUTS = 64
+
+
+def _loads(text: str) -> Tuple[bool, Any]:
+    try:
+        return True, json.loads(text)
+    except ValueError:
+        return False, None
+
+
+def _close_truncated(text: str) -> Tuple[bool, Any]:
+    """Parse JSON cut off mid-way: drop the incomplete tail and close the open brackets.
+
+    Candidates end after a complete value (a closing bracket, or before a comma)
+    and are tried from the longest, so as much of the answer as possible is kept.
+    """
+    stack: List[str] = []
+    cuts: List[Tuple[int, str]] = []
+    in_string = escaped = False
+    for pos, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return False, None
+            cuts.append((pos + 1, "".join(reversed(stack))))
+        elif char == "," and stack:
+            cuts.append((pos, "".join(reversed(stack))))
+    if not stack and not in_string:
+        return False, None
+    for end, closers in reversed(cuts[-_MAX_CUTS:]):
+        ok, value = _loads(text[:end] + closers)
+        if ok:
+            return True, value
+    return False, None
+
+
+def parse_json(content: str) -> Any:
+    """Parse a model answer as JSON, recovering fenced, prose-wrapped and truncated output.
+
+    Recoveries are counted in `grader_json_parse_fallbacks_total`; raises
+    ValueError when nothing usable is left.
+    """
+    ok, value = _loads(content)
+    if ok:
+        return value
+    text, outcome = content, "prose"
+    for pattern, fenced in ((_FENCED_JSON, "fenced_json"), (_FENCED, "fenced")):
+        m = pattern.search(content)
+        if m:
+            text, outcome = m.group(1), fenced
+            break
+    starts = [pos for pos in (text.find("["), text.find("{")) if pos >= 0]
+    if starts:
+        text = text[min(starts):]
+        ok, value = _loads(text)
+        if not ok:
+            # Trailing prose after the JSON value
+            try:
+                value, _ = json.JSONDecoder().raw_decode(text)
+                ok = True
+            except ValueError:
+                pass
+        if not ok:
+            ok, value = _close_truncated(text)
+            outcome = "truncated" if ok else outcome
+        if ok:
+            metrics.count_json_fallback(outcome)
+            return value
+    metrics.count_json_fallback("invalid")
+    raise ValueError("Model did not return valid JSON content")
+
+
+class ArrayElementStream:
+    """Incremental parser returning the objects of a JSON array as each one closes.
+
+    `depth` is the number of brackets around the array's elements: 1 for a
+    top-level array, 2 for the `grades` array of a single-pass answer. Text
+    before the first bracket (a code fence) is skipped, and an element that is
+    not valid JSON is dropped.
+    """
+
+    def __init__(self, depth: int = 1):
+        self._depth = depth
+        self._stack: List[str] = []
+        self._in_string = self._escaped = False
+        self._element: Optional[List[str]] = None
+
+    def feed(self, text: str) -> List[Any]:
+        """The elements completed by the next piece of the answer."""
+        done: List[Any] = []
+        for char in text:
+            if self._element is not None:
+                self._element.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                if char == "{" and self._element is None and self._stack[-1:] == ["["] and len(self._stack) == self._depth:
+                    self._element = [char]
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if self._element is not None and len(self._stack) == self._depth:
+                    ok, value = _loads("".join(self._element))
+                    self._element = None
+                    if ok:
+                        done.append(value)
+        return done
+
+
+# -- Validation and repair
+
+def _number(value: Any) -> Optional[float]:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _sum(values: List[Any]) -> Optional[Number]:
+    numbers = [_number(v) for v in values]
+    if not numbers or any(n is None for n in numbers):
+        return None
+    return round(sum(numbers), 6)
+
+
+def _differs(value: Any, expected: Number) -> bool:
+    number = _number(value)
+    return number is None or abs(number - expected) > 1e-6
+
+
+def check_rubric(data: Any) -> List[Dict[str, Any]]:
+    """Validate a preprocessed rubric; a problem's `total` is set to the sum of its item points.
+
+    Raises ValueError if the answer is not a list of valid rubric problems.
+    """
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not data:
+        raise ValueError("Rubric output is not a list of problems")
+    try:
+        problems = [RubricProblem.model_validate(entry).model_dump() for entry in data]
+    except ValidationError as exc:
+        raise ValueError(f"Rubric output does not match the schema: {exc.error_count()} errors") from exc
+    for problem in problems:
+        total = _sum([item["points"] for item in problem["items"]])
+        if total is not None and _differs(problem["total"], total):
+            metrics.count_output_repair("rubric_total")
+            problem["total"] = total
+    return problems
+
+
+def _as_entries(data: Any) -> List[Any]:
+    if isinstance(data, dict):
+        return data["grades"] if isinstance(data.get("grades"), list) else [data]
+    return data if isinstance(data, list) else []
+
+
+def _repair_entry(entry: Dict[str, Any], problem: Dict[str, Any]) -> Dict[str, Any]:
+    """Fix item totals, out-of-range and mis-summed scores against the rubric problem."""
+    points = {str(item.get("id")): _number(item.get("points")) for item in problem.get("items") or []}
+    for item in entry["items"]:
+        possible = points.get(str(item["item"]))
+        if possible is not None and _differs(item.get("total_possible_score"), possible):
+            metrics.count_output_repair("total")
+            item["total_possible_score"] = possible
+        score, possible = _number(item["score"]), _number(item.get("total_possible_score"))
+        if score is not None and possible is not None and not 0 <= score <= possible:
+            metrics.count_output_repair("out_of_range")
+            item["score"] = min(max(score, 0), possible)
+
+    expected_total = _number(problem.get("total"))
+    if expected_total is None:
+        expected_total = _sum([item.get("total_possible_score") for item in entry["items"]])
+    if expected_total is not None and _differs(entry.get("total_score"), expected_total):
+        metrics.count_output_repair("total")
+        entry["total_score"] = expected_total
+    # Null when any item is indeterminate, as the prompt asks; only numeric sums are repaired
+    summed = _sum([item["score"] for item in entry["items"]])
+    if summed is not None and _differs(entry["score"], summed):
+        metrics.count_output_repair("score_sum")
+        entry["score"] = summed
+    return entry
+
+
+def check_grades(data: Any, rubric: Any) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Validate and repair grading output against `rubric`.
+
+    Returns (valid entries in rubric order, rubric problems to re-ask): a
+    problem is re-asked when it has no entry, or its entry fails validation.
+    Entries for problems not in the rubric are dropped. Without a list rubric
+    the entries are only checked to be objects.
+    """
+    entries = _as_entries(data)
+    problems = _problems(rubric)
+    if not problems:
+        return [entry for entry in entries if isinstance(entry, dict)], []
+    by_problem: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        if isinstance(entry, dict) and "id" in entry:
+            by_problem.setdefault(problem_key(entry["id"]), entry)
+    graded: List[Dict[str, Any]] = []
+    failed: List[Dict[str, Any]] = []
+    for problem in problems:
+        entry = by_problem.get(problem_key(problem["id"]))
+        try:
+            if entry is None:
+                raise ValueError("missing")
+            checked = GradedProblem.model_validate(entry).model_dump()
+            if problem.get("items") and not checked["items"]:
+                raise ValueError("no items")
+        except (ValidationError, ValueError):
+            failed.append(problem)
+            continue
+        graded.append(_repair_entry(checked, problem))
+    return graded, failed
+
+
+def check_entry(entry: Any, rubric: Any) -> Optional[Dict[str, Any]]:
+    """One streamed grade entry validated and repaired against its rubric problem, or None."""
+    if not isinstance(entry, dict) or "id" not in entry:
+        return None
+    key = problem_key(entry["id"])
+    problem = next((p for p in _problems(rubric) if problem_key(p["id"]) == key), None)
+    if problem is None:
+        return None
+    graded, _ = check_grades([entry], [problem])
+    return graded[0] if graded else None
+
+
+__all__ = [
+    "ArrayElementStream",
+    "REASK_ATTEMPTS",
+    "SCHEMA_ENABLED",
+    "check_entry",
+    "check_grades",
+    "check_rubric",
+    "grading_schema",
+    "parse_json",
+    "rubric_schema",
+    "single_pass_schema",
+]
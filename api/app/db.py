@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import orjson
+import zstandard
+from sqlalchemy import LargeBinary, event
+from sqlalchemy.types import TypeDecorator
+from sqlmodel import Session, create_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///grader.db")
+
+_connect_args = {"check_same_thread": False, "timeout": 30} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, connect_args=_connect_args)
+
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets several uvicorn workers read while one writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON value stored as zstd-compressed orjson bytes."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    _compressor = zstandard.ZstdCompressor(level=3)
+    _decompressor = zstandard.ZstdDecompressor()
+
+    def process_bind_param(self, value: Any, dialect) -> Any:
+        if value is None:
+            return None
+        return self._compressor.compress(orjson.dumps(value))
+
+    def process_result_value(self, value: Any, dialect) -> Any:
+        if value is None:
+            return None
+        return orjson.loads(self._decompressor.decompress(value))
+
+
+def get_session() -> Session:
+    return Session(engine, expire_on_commit=False)
+
+
+def init_db() -> None:
+    """Bring the schema up to date with Alembic (skip with GRADER_AUTO_MIGRATE=0)."""
+    if os.getenv("GRADER_AUTO_MIGRATE", "1") == "0":
+        return
+    from alembic import command
+    from alembic.config import Config
+
+    api_dir = Path(__file__).resolve().parent.parent
+    config = Config(str(api_dir / "alembic.ini"))
+    config.set_main_option("script_location", str(api_dir / "alembic"))
+    config.set_main_option("sqlalchemy.url", DATABASE_URL)
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, "head")
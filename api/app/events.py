@@ -0,0 +1,189 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+import orjson
+from sqlalchemy import delete, func
+from sqlmodel import select
+
+from .db import get_session
+from .models import Event, utcnow
+
+# Stages pushed for a submission, in order: uploaded -> extracting -> grading -> done | failed
+TERMINAL_STAGES = ("done", "failed")
+# Stage a subscriber starts from, given the stored submission status
+STAGE_FOR_STATUS = {"pending": "uploaded", "grading": "grading", "graded": "done", "failed": "failed"}
+
+KEEPALIVE_S = 15.0
+# Keep proxies from buffering or caching the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Events are also written to the database so API processes see the progress of
+# jobs run by separate workers (set GRADER_EVENT_RELAY=0 for a single process).
+RELAY_ENABLED = os.getenv("GRADER_EVENT_RELAY", "1") != "0"
+RELAY_INTERVAL_S = float(os.getenv("GRADER_EVENT_RELAY_INTERVAL_S", "0.25"))
+RELAY_RETENTION_S = 600
+# Identifies this process so it skips its own events when reading them back
+ORIGIN = uuid.uuid4().hex
+# Events buffered per subscriber before the slowest clients start dropping them
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def submission_topic(submission_id: str) -> str:
+    return f"submission:{submission_id}"
+
+
+def assignment_topic(assignment_id: str) -> str:
+    return f"assignment:{assignment_id}"
+
+
+class EventBus:
+    """In-process publish/subscribe hub for grading progress.
+
+    Publishers (the background grading tasks) call `publish` with a topic per
+    audience; every subscriber of those topics gets the event on its own queue.
+    `publish` may be called from any thread; delivery happens on the event loop.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outgoing: List[Tuple[Dict[str, Any], Tuple[str, ...]]] = []
+        self._outgoing_lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any], *topics: str) -> None:
+        event = {"ts": time.time(), **event}
+        if RELAY_ENABLED:
+            with self._outgoing_lock:
+                self._outgoing.append((event, topics))
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event, topics)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event, topics)
+
+    def drain_outgoing(self) -> List[Tuple[Dict[str, Any], Tuple[str, ...]]]:
+        with self._outgoing_lock:
+            outgoing, self._outgoing = self._outgoing, []
+        return outgoing
+
+    def _deliver(self, event: Dict[str, Any], topics: Sequence[str]) -> None:
+        for topic in topics:
+            for queue in tuple(self._subscribers.get(topic, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Slow consumer; it can resynchronize from the REST endpoints
+                    pass
+
+    @asynccontextmanager
+    async def subscribe(self, topic: str) -> AsyncIterator[asyncio.Queue]:
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+
+bus = EventBus()
+
+
+def _exchange(outgoing, after_id: Optional[int], prune: bool) -> Tuple[Optional[int], List[Event]]:
+    """Write this process's events and read everyone else's newer than `after_id`."""
+    with get_session() as session:
+        written = [Event(origin=ORIGIN, topics=list(topics), payload=event) for event, topics in outgoing]
+        session.add_all(written)
+        if prune:
+            session.exec(delete(Event).where(Event.created_at < utcnow() - timedelta(seconds=RELAY_RETENTION_S)))
+        session.commit()
+        if after_id is None:
+            # Start from the present; history is available through the REST endpoints
+            return session.exec(select(func.max(Event.id))).one() or 0, []
+        rows = session.exec(
+            select(Event).where(Event.id > after_id, Event.origin != ORIGIN).order_by(Event.id)
+        ).all()
+        # Only ids this exchange has seen: rows committed elsewhere after the query are read next time
+        last_id = max([after_id, *(event.id for event in written), *(row.id for row in rows[-1:])])
+        return last_id, list(rows)
+
+
+async def run_relay() -> None:
+    """Mirror events between processes through the `events` table; run as a task."""
+    if not RELAY_ENABLED:
+        return
+    last_id: Optional[int] = None
+    last_prune = time.monotonic()
+    try:
+        while True:
+            prune = time.monotonic() - last_prune > RELAY_RETENTION_S / 10
+            if prune:
+                last_prune = time.monotonic()
+            last_id, rows = await asyncio.to_thread(_exchange, bus.drain_outgoing(), last_id, prune)
+            for row in rows:
+                bus._deliver(row.payload, row.topics)
+            await asyncio.sleep(RELAY_INTERVAL_S)
+    finally:
+        outgoing = bus.drain_outgoing()
+        if outgoing:
+            _exchange(outgoing, last_id, False)
+
+
+def publish_submission_event(submission_id: str, assignment_id: Optional[str], **event: Any) -> None:
+    """Publish to the submission's stream and, when known, its assignment's stream."""
+    event = {"submission_id": submission_id, **event}
+    topics = [submission_topic(submission_id)]
+    if assignment_id:
+        event["assignment_id"] = assignment_id
+        topics.append(assignment_topic(assignment_id))
+    bus.publish(event, *topics)
+
+
+def format_sse(event: Dict[str, Any]) -> bytes:
+    """Encode one event as a Server-Sent Events frame (`event:` is the event's type)."""
+    return f"event: {event.get('type', 'message')}\ndata: {orjson.dumps(event).decode()}\n\n".encode()
+
+
+async def sse_stream(
+    request: Any,
+    queue: asyncio.Queue,
+    *,
+    snapshot: Optional[Dict[str, Any]] = None,
+    until_terminal: bool = False,
+) -> AsyncIterator[bytes]:
+    """Yield SSE frames from `queue` until the client disconnects.
+
+    `snapshot` is sent first so a late subscriber starts from the current state.
+    With `until_terminal` the stream ends after a done/failed stage event.
+    """
+    if snapshot is not None:
+        yield format_sse(snapshot)
+        if until_terminal and snapshot.get("stage") in TERMINAL_STAGES:
+            return
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_S)
+        except asyncio.TimeoutError:
+            if await request.is_disconnected():
+                return
+            yield b": keepalive\n\n"
+            continue
+        yield format_sse(event)
+        if until_terminal and event.get("type") == "stage" and event.get("stage") in TERMINAL_STAGES:
+            return
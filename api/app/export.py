@@ -0,0 +1,123 @@
+"""Gradebook export: one flat row per submission, streamed as CSV or NDJSON.
+
+Columns follow the assignment's rubric, so the CSV header is known before the
+first row: each problem's score and total, then each rubric item's score.
+Submissions are read in keyset-paged chunks and encoded as they arrive, so
+memory stays flat whatever the class size.
+"""
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import orjson
+
+from app import store
+from app.agents.problems import problem_key
+from app.models import Submission
+
+# Submissions read (and graded_content blobs decompressed) per query
+EXPORT_CHUNK = 200
+# Encoded output is yielded in pieces of about this many bytes
+_FLUSH_BYTES = 64 * 1024
+
+BASE_COLUMNS = ("submission_id", "student_name", "status", "updated_at", "total_score", "total_possible")
+_EXPORT_FIELDS = ("id", "student_name", "status", "updated_at", "graded_content")
+
+
+def export_columns(rubric: Any) -> List[str]:
+    columns = list(BASE_COLUMNS)
+    for problem in rubric if isinstance(rubric, list) else []:
+        pid = str(problem.get("id"))
+        columns += [f"problem_{pid}_score", f"problem_{pid}_total"]
+        for item in problem.get("items") or []:
+            columns.append(f"problem_{pid}_item_{item.get('id')}_score")
+    return columns
+
+
+def _number(value: Any) -> Optional[float]:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def flatten_grades(record: Dict[str, Any], rubric: Any) -> Dict[str, Any]:
+    """Export row for a submission record; problems or items without a grade are None."""
+    entries = {
+        problem_key(entry["id"]): entry
+        for entry in record.get("graded_content") or []
+        if isinstance(entry, dict) and "id" in entry
+    }
+    row: Dict[str, Any] = {
+        "submission_id": record["id"],
+        "student_name": record.get("student_name"),
+        "status": record.get("status"),
+        "updated_at": record.get("updated_at"),
+        "total_score": None,
+        "total_possible": None,
+    }
+    scores: List[float] = []
+    possible: List[float] = []
+    for problem in rubric if isinstance(rubric, list) else []:
+        pid = str(problem.get("id"))
+        entry = entries.get(problem_key(pid)) or {}
+        score = _number(entry.get("score"))
+        total = _number(entry.get("total_score", problem.get("total")))
+        row[f"problem_{pid}_score"] = score
+        row[f"problem_{pid}_total"] = total
+        if score is not None:
+            scores.append(score)
+        if total is not None:
+            possible.append(total)
+        items = {str(item.get("item")): item for item in entry.get("items") or [] if isinstance(item, dict)}
+        for item in problem.get("items") or []:
+            row[f"problem_{pid}_item_{item.get('id')}_score"] = _number(items.get(str(item.get("id")), {}).get("score"))
+    if entries:
+        row["total_score"] = sum(scores)
+        row["total_possible"] = sum(possible)
+    return row
+
+
+def _utc_naive(moment: datetime) -> datetime:
+    # Timestamps are stored as naive UTC
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def iter_export_rows(assignment_id: str, rubric: Any, since: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """Flattened rows of the assignment's submissions (updated after `since`), oldest first."""
+    store.write_buffer.flush()
+    filters = [Submission.assignment_id == assignment_id]
+    if since is not None:
+        filters.append(Submission.updated_at > _utc_naive(since))
+    after = None
+    while True:
+        keys = store.page_keys(Submission, filters, after=after, limit=EXPORT_CHUNK)
+        page = keys[:EXPORT_CHUNK]
+        for record in store.load_rows(Submission, [row_id for row_id, _, _ in page], _EXPORT_FIELDS):
+            yield flatten_grades(record, rubric)
+        if len(keys) <= EXPORT_CHUNK:
+            return
+        after = (page[-1][1], page[-1][0])
+
+
+def stream_csv(columns: Sequence[str], rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= _FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def stream_ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    pending = bytearray()
+    for row in rows:
+        pending += orjson.dumps(row)
+        pending += b"\n"
+        if len(pending) >= _FLUSH_BYTES:
+            yield bytes(pending)
+            pending.clear()
+    if pending:
+        yield bytes(pending)
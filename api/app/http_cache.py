@@ -0,0 +1,110 @@
+import base64
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import orjson
+from fastapi import Request, status
+from fastapi.responses import ORJSONResponse, Response
+from sqlmodel import SQLModel
+
+from app import store
+
+# Clients may reuse a list page only after revalidating it with If-None-Match.
+LIST_CACHE_CONTROL = "private, no-cache"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def compute_etag(*parts: Any) -> str:
+    """Strong ETag over the orjson encoding of `parts`."""
+    digest = hashlib.blake2b(orjson.dumps(parts, default=str), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def not_modified(etag: str, cache_control: str = LIST_CACHE_CONTROL) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
+
+
+def cached_json(content: Any, etag: str, status_code: int = status.HTTP_200_OK) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=status_code,
+        content=content,
+        headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL},
+    )
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = orjson.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """Inverse of `encode_cursor`; raises ValueError for malformed cursors."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str], default: Sequence[str]) -> List[str]:
+    """Comma-separated `fields` query parameter -> column list (`id` is always included)."""
+    if not fields:
+        return list(default)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+
+def paged_response(
+    request: Request,
+    model: Type[SQLModel],
+    key: str,
+    *,
+    filters: Sequence[Any] = (),
+    fields: Optional[str] = None,
+    allowed_fields: Sequence[str],
+    default_fields: Sequence[str],
+    computed: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Response:
+    """One keyset-paginated, projected page of `model` as `{key: [...], "next_cursor": ...}`.
+
+    The ETag is derived from the page's ids and `updated_at` stamps, so an
+    unchanged page is answered with 304 before any heavy column is read.
+    """
+    try:
+        columns = parse_fields(fields, allowed_fields, default_fields)
+        after = decode_cursor(cursor)
+    except ValueError as exc:
+        return ORJSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"message": str(exc)})
+
+    keys = store.page_keys(model, filters, after=after, limit=limit)
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+    next_cursor = encode_cursor(keys[-1][1], keys[-1][0]) if has_more else None
+
+    etag = compute_etag(key, request.url.query, [(row_id, updated_at) for row_id, _, updated_at in keys])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    rows = store.load_rows(model, [row_id for row_id, _, _ in keys], columns, computed)
+    return cached_json({key: rows, "next_cursor": next_cursor}, etag)
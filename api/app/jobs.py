@@ -0,0 +1,169 @@
+import os
+import random
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, or_, update
+from sqlmodel import select
+
+from .db import get_session
+from .models import Job, utcnow
+
+# Priority lanes: instructor re-grades jump ahead of single uploads, which jump
+# ahead of bulk batch work. Lower numbers are claimed first.
+LANES = {"regrade": 0, "interactive": 10, "bulk": 20}
+
+MAX_ATTEMPTS = int(os.getenv("GRADER_JOB_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_S = float(os.getenv("GRADER_JOB_BACKOFF_BASE_S", "5"))
+BACKOFF_MAX_S = float(os.getenv("GRADER_JOB_BACKOFF_MAX_S", "300"))
+
+# Called after every enqueue so in-process workers can wake up immediately
+_enqueue_listeners: List[Callable[[], None]] = []
+
+
+def add_enqueue_listener(callback: Callable[[], None]) -> None:
+    _enqueue_listeners.append(callback)
+
+
+def remove_enqueue_listener(callback: Callable[[], None]) -> None:
+    if callback in _enqueue_listeners:
+        _enqueue_listeners.remove(callback)
+
+
+def enqueue_many(kind: str, payloads: Iterable[Dict[str, Any]], *, lane: str = "interactive") -> List[int]:
+    """Queue one job per payload in a single transaction; returns the job ids."""
+    with get_session() as session:
+        rows = [Job(kind=kind, payload=payload, priority=LANES[lane], max_attempts=MAX_ATTEMPTS) for payload in payloads]
+        session.add_all(rows)
+        session.commit()
+        ids = [row.id for row in rows]
+    for callback in tuple(_enqueue_listeners):
+        callback()
+    return ids
+
+
+def enqueue(kind: str, payload: Dict[str, Any], *, lane: str = "interactive") -> int:
+    return enqueue_many(kind, [payload], lane=lane)[0]
+
+
+def _claimable(now):
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        # A worker died or stalled mid-job; its lease ran out
+        and_(Job.status == "running", Job.lease_expires_at < now, Job.attempts < Job.max_attempts),
+    )
+
+
+def claim(worker_id: str, lease_s: float, kinds: Optional[Iterable[str]] = None) -> Optional[Job]:
+    """Lease the most urgent runnable job to `worker_id`, or return None.
+
+    The conditional UPDATE only succeeds for one claimant, so any number of
+    worker processes can poll the same table.
+    """
+    kinds = list(kinds) if kinds is not None else None
+    with get_session() as session:
+        for _ in range(5):
+            now = utcnow()
+            statement = select(Job.id).where(_claimable(now))
+            if kinds is not None:
+                statement = statement.where(Job.kind.in_(kinds))
+            job_id = session.exec(statement.order_by(Job.priority, Job.run_at, Job.id).limit(1)).first()
+            if job_id is None:
+                return None
+            result = session.exec(
+                update(Job)
+                .where(Job.id == job_id, _claimable(now))
+                .values(
+                    status="running",
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_s),
+                    attempts=Job.attempts + 1,
+                    updated_at=now,
+                )
+            )
+            session.commit()
+            if result.rowcount == 1:
+                return session.get(Job, job_id)
+    return None
+
+
+def _update_owned(job: Job, **values: Any) -> bool:
+    """Update `job` only while it is still leased to the same worker."""
+    with get_session() as session:
+        result = session.exec(
+            update(Job)
+            .where(Job.id == job.id, Job.status == "running", Job.lease_owner == job.lease_owner)
+            .values(**values, updated_at=utcnow())
+        )
+        session.commit()
+        return result.rowcount == 1
+
+
+def heartbeat(job: Job, lease_s: float) -> bool:
+    """Extend the lease; False means the job was taken over and the result will be discarded."""
+    return _update_owned(job, lease_expires_at=utcnow() + timedelta(seconds=lease_s))
+
+
+def complete(job: Job) -> bool:
+    return _update_owned(job, status="done", lease_owner=None, lease_expires_at=None, last_error=None)
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with equal jitter: half fixed, half random."""
+    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def fail(job: Job, error: str, *, retry: bool = True) -> Optional[float]:
+    """Record a failed attempt. Returns the retry delay, or None once attempts are exhausted (or `retry` is False)."""
+    if not retry or job.attempts >= job.max_attempts:
+        _update_owned(job, status="failed", lease_owner=None, lease_expires_at=None, last_error=error)
+        return None
+    delay = backoff_delay(job.attempts)
+    _update_owned(
+        job,
+        status="queued",
+        run_at=utcnow() + timedelta(seconds=delay),
+        lease_owner=None,
+        lease_expires_at=None,
+        last_error=error,
+    )
+    return delay
+
+
+def defer(job: Job, delay_s: float) -> None:
+    """Put a job back without counting the attempt (e.g. its inputs are not ready yet)."""
+    _update_owned(
+        job,
+        status="queued",
+        run_at=utcnow() + timedelta(seconds=delay_s),
+        attempts=job.attempts - 1,
+        lease_owner=None,
+        lease_expires_at=None,
+    )
+
+
+def reap_expired() -> List[Job]:
+    """Fail running jobs whose lease expired on their last attempt; returns them."""
+    now = utcnow()
+    with get_session() as session:
+        rows = session.exec(
+            select(Job).where(
+                Job.status == "running",
+                Job.lease_expires_at < now,
+                Job.attempts >= Job.max_attempts,
+            )
+        ).all()
+        for row in rows:
+            row.status = "failed"
+            row.last_error = row.last_error or "Lease expired"
+            row.lease_owner = None
+            row.updated_at = now
+            session.add(row)
+        session.commit()
+        return list(rows)
+
+
+def count_by_status() -> Dict[str, int]:
+    with get_session() as session:
+        return dict(session.exec(select(Job.status, func.count()).group_by(Job.status)).all())
@@ -1,12 +1,66 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from .routers import assignments, submissions
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .routers import assignments, submissions, batches
+from . import metrics
+from .agents.rate_limit import limiter_stats
+from .agents.response_cache import get_response_cache
+from .db import init_db
+from .events import run_relay
+from .jobs import count_by_status
+from .store import write_buffer
+from .worker import Worker
+
+# Run one job worker inside the API process; set to 0 when `python -m app.worker`
+# processes are deployed separately.
+EMBEDDED_WORKER = os.getenv("GRADER_EMBEDDED_WORKER", "1") != "0"
+
+# The model stack (google-genai, langchain) is imported on first use so the API
+# starts serving quickly; preload it in a thread after startup so the first
+# job or rubric edit does not block the event loop on the import.
+PRELOAD_AGENTS = os.getenv("GRADER_PRELOAD_AGENTS", "1") != "0"
+
+logger = logging.getLogger(__name__)
+
+
+async def _preload_agents() -> None:
+    try:
+        await asyncio.to_thread(importlib.import_module, "app.agents.llm_grading")
+    except Exception:
+        # Surfaces again, with the job that needs it, on first use
+        logger.exception("Preloading the grading agents failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    metrics.register_state_collector()
+    background = [asyncio.create_task(write_buffer.run()), asyncio.create_task(run_relay())]
+    if PRELOAD_AGENTS:
+        background.append(asyncio.create_task(_preload_agents()))
+    if EMBEDDED_WORKER:
+        background.append(asyncio.create_task(Worker().run()))
+    yield
+    for task in reversed(background):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
 
 app = FastAPI(
     title="AI Assignment Grader",
     description="AI assignment grading",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -25,6 +79,7 @@ app.add_middleware(
 
 app.include_router(assignments.router)
 app.include_router(submissions.router)
+app.include_router(batches.router)
 
 # Mount static files for serving uploaded files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -32,3 +87,27 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 @app.get("/")
 async def root():
     return {"message": "AI Assignment Grader API is running!"}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and size of the LLM response cache."""
+    return await asyncio.to_thread(get_response_cache().stats)
+
+
+@app.get("/rate-limits/stats")
+async def rate_limit_stats():
+    """AIMD window, remaining budget and throttling counters per model and for the file API."""
+    return limiter_stats()
+
+
+@app.get("/jobs/stats")
+def job_stats():
+    """Number of queued, running, done and failed jobs."""
+    return count_by_status()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics: stage/model-call latency, tokens, uploads, JSON fallbacks, queue depth."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,261 @@
+"""Prometheus metrics for the grading pipeline, served at GET /metrics.
+
+Model-call metrics carry `model` and `assignment` labels. The assignment comes
+from a context variable set by the pipeline entry points (`for_assignment`),
+so code deep in `llm_grading` needs no extra arguments. File uploads are
+shared across models and are labelled by assignment only.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Standalone workers serve their own metrics on this port when set
+WORKER_METRICS_PORT = int(os.getenv("GRADER_WORKER_METRICS_PORT", "0"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+_assignment: ContextVar[str] = ContextVar("grader_assignment", default="")
+
+STAGE_SECONDS = Histogram(
+    "grader_stage_seconds",
+    "Latency of pipeline stages (preprocess, extract, grade, ...), including uploads and retries",
+    ["stage", "model", "assignment"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "grader_stage_errors_total",
+    "Pipeline stages that raised",
+    ["stage", "model", "assignment"],
+)
+MODEL_CALL_SECONDS = Histogram(
+    "grader_model_call_seconds",
+    "Latency of model calls that reached Gemini (cache misses), including throttling waits",
+    ["model", "assignment"],
+    buckets=LATENCY_BUCKETS,
+)
+INPUT_TOKENS = Histogram(
+    "grader_input_tokens",
+    "Input tokens per model call, from the response usage metadata",
+    ["model", "assignment"],
+    buckets=TOKEN_BUCKETS,
+)
+OUTPUT_TOKENS = Histogram(
+    "grader_output_tokens",
+    "Output tokens per model call, from the response usage metadata",
+    ["model", "assignment"],
+    buckets=TOKEN_BUCKETS,
+)
+CACHED_INPUT_TOKENS = Histogram(
+    "grader_cached_input_tokens",
+    "Input tokens per model call served from a context cache (part of grader_input_tokens)",
+    ["model", "assignment"],
+    buckets=TOKEN_BUCKETS,
+)
+FIRST_PROBLEM_SECONDS = Histogram(
+    "grader_first_problem_seconds",
+    "Time from the start of a streamed grading call to its first graded problem",
+    ["model", "assignment"],
+    buckets=LATENCY_BUCKETS,
+)
+CONTEXT_CACHE_CALLS = Counter(
+    "grader_context_cache_calls_total",
+    "Model calls with a cacheable prompt prefix, by how it was sent (cached, inline, expired)",
+    ["outcome", "assignment"],
+)
+UPLOAD_SECONDS = Histogram(
+    "grader_file_upload_seconds",
+    "Time to resolve a PDF to a Gemini file, by where it was found (index, remote, upload)",
+    ["source", "assignment"],
+    buckets=LATENCY_BUCKETS,
+)
+ACTIVE_WAIT_SECONDS = Histogram(
+    "grader_file_active_wait_seconds",
+    "Time spent polling an uploaded file until it became ACTIVE",
+    ["assignment"],
+    buckets=LATENCY_BUCKETS,
+)
+PDF_BYTES_SAVED = Counter(
+    "grader_pdf_bytes_saved_total",
+    "Bytes removed from submission PDFs by the local optimization stage (downsampled images, blank pages)",
+    ["assignment"],
+)
+PAGE_RENDERS = Counter(
+    "grader_page_renders_total",
+    "Submission pages rasterized for the grading view, by the post-upload job (upload) or on request",
+    ["trigger"],
+)
+JSON_PARSE_FALLBACKS = Counter(
+    "grader_json_parse_fallbacks_total",
+    "Model outputs that were not plain JSON, by how they were recovered (fenced_json, fenced, prose, truncated, invalid)",
+    ["outcome", "assignment"],
+)
+OUTPUT_REPAIRS = Counter(
+    "grader_output_repairs_total",
+    "Values in model answers fixed locally, by kind (score_sum, total, out_of_range, rubric_total)",
+    ["kind", "assignment"],
+)
+REASKED_PROBLEMS = Counter(
+    "grader_reasked_problems_total",
+    "Rubric problems sent to the model again because their answer was missing or invalid",
+    ["stage", "assignment"],
+)
+JOB_SECONDS = Histogram(
+    "grader_job_seconds",
+    "Duration of queue jobs by kind and outcome (done, retry, failed, deferred, lease_lost)",
+    ["kind", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+JOBS_RUNNING = Gauge("grader_jobs_running", "Jobs running in this process", ["kind"])
+
+
+def current_assignment() -> str:
+    return _assignment.get()
+
+
+@contextmanager
+def for_assignment(assignment_id: Optional[str]) -> Iterator[None]:
+    """Label metrics recorded inside the block (and tasks it starts) with `assignment_id`."""
+    token = _assignment.set(assignment_id or "")
+    try:
+        yield
+    finally:
+        _assignment.reset(token)
+
+
+@contextmanager
+def track_stage(stage: str, model: str) -> Iterator[None]:
+    labels = (stage, model, current_assignment())
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(*labels).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(*labels).observe(time.perf_counter() - start)
+
+
+def timed_stage(stage: str, model: str) -> Callable[[Callable], Callable]:
+    """Decorator form of `track_stage` for sync and async functions."""
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with track_stage(stage, model):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with track_stage(stage, model):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def observe_model_call(model: str, response: Any, seconds: float) -> None:
+    assignment = current_assignment()
+    MODEL_CALL_SECONDS.labels(model, assignment).observe(seconds)
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        INPUT_TOKENS.labels(model, assignment).observe(usage["input_tokens"])
+    if usage.get("output_tokens") is not None:
+        OUTPUT_TOKENS.labels(model, assignment).observe(usage["output_tokens"])
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached:
+        CACHED_INPUT_TOKENS.labels(model, assignment).observe(cached)
+
+
+def observe_first_problem(model: str, seconds: float) -> None:
+    FIRST_PROBLEM_SECONDS.labels(model, current_assignment()).observe(seconds)
+
+
+def observe_upload(source: str, seconds: float) -> None:
+    UPLOAD_SECONDS.labels(source, current_assignment()).observe(seconds)
+
+
+def observe_active_wait(seconds: float) -> None:
+    ACTIVE_WAIT_SECONDS.labels(current_assignment()).observe(seconds)
+
+
+def count_pdf_bytes_saved(saved: int) -> None:
+    PDF_BYTES_SAVED.labels(current_assignment()).inc(saved)
+
+
+def count_page_render(trigger: str) -> None:
+    PAGE_RENDERS.labels(trigger).inc()
+
+
+def count_context_cache(outcome: str) -> None:
+    CONTEXT_CACHE_CALLS.labels(outcome, current_assignment()).inc()
+
+
+def count_json_fallback(outcome: str) -> None:
+    JSON_PARSE_FALLBACKS.labels(outcome, current_assignment()).inc()
+
+
+def count_output_repair(kind: str) -> None:
+    OUTPUT_REPAIRS.labels(kind, current_assignment()).inc()
+
+
+def count_reasked(stage: str, problems: int) -> None:
+    REASKED_PROBLEMS.labels(stage, current_assignment()).inc(problems)
+
+
+class _StateCollector:
+    """Queue depth and in-flight model calls, read when Prometheus scrapes."""
+
+    def describe(self):
+        # Lets the registry check names without querying the database
+        yield GaugeMetricFamily("grader_jobs", "", labels=["status"])
+        yield GaugeMetricFamily("grader_model_calls_in_flight", "", labels=["model"])
+        yield GaugeMetricFamily("grader_rate_limit_window", "", labels=["model"])
+
+    def collect(self):
+        from .agents.rate_limit import limiter_stats
+        from .jobs import count_by_status
+
+        jobs = GaugeMetricFamily("grader_jobs", "Jobs in the queue by status", labels=["status"])
+        for status, count in count_by_status().items():
+            jobs.add_metric([status], count)
+        yield jobs
+
+        in_flight = GaugeMetricFamily(
+            "grader_model_calls_in_flight",
+            "Gemini calls in flight in this process, per model limiter (and 'files')",
+            labels=["model"],
+        )
+        window = GaugeMetricFamily(
+            "grader_rate_limit_window", "Current AIMD concurrency window per model limiter", labels=["model"]
+        )
+        for name, stats in limiter_stats().items():
+            in_flight.add_metric([name], stats["in_flight"])
+            window.add_metric([name], stats["window"])
+        yield in_flight
+        yield window
+
+
+_collector_lock = threading.Lock()
+_collector_registered = False
+
+
+def register_state_collector() -> None:
+    """Expose queue depth and in-flight calls; safe to call more than once."""
+    global _collector_registered
+    with _collector_lock:
+        if not _collector_registered:
+            REGISTRY.register(_StateCollector())
+            _collector_registered = True
@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import JSON, Column, Index
+from sqlmodel import Field, SQLModel
+
+from .db import CompressedJSON
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Assignment(SQLModel, table=True):
+    __tablename__ = "assignments"
+
+    id: str = Field(primary_key=True)
+    name: str
+    file_path: str
+    grading_mode: str = "two_stage"
+    # Recorded while the upload is streamed to disk
+    sha256: Optional[str] = None
+    size_bytes: Optional[int] = None
+    rubric: Optional[Any] = Field(default=None, sa_column=Column(CompressedJSON))
+    problem_structure: Optional[Any] = Field(default=None, sa_column=Column(CompressedJSON))
+    # Why rubric preprocessing failed for good; its waiting submissions fail too
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class Submission(SQLModel, table=True):
+    __tablename__ = "submissions"
+    __table_args__ = (
+        Index("ix_submissions_assignment_id_status", "assignment_id", "status"),
+    )
+
+    id: str = Field(primary_key=True)
+    assignment_id: str = Field(foreign_key="assignments.id")
+    student_name: str
+    file_path: str
+    sha256: Optional[str] = Field(default=None, index=True)
+    size_bytes: Optional[int] = None
+    batch_id: Optional[str] = Field(default=None, index=True)
+    # pending -> grading -> graded | failed
+    status: str = Field(default="pending", index=True)
+    graded_content: Optional[Any] = Field(default=None, sa_column=Column(CompressedJSON))
+    # Pages attached per problem and the tokens/bytes that saved (see page_segments)
+    segmentation: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    # Bytes and blank pages removed from the uploaded copy (see pdf_optimize)
+    optimization: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    # Extracted markdown, whole and split per problem, reused by partial re-grades
+    extraction: Optional[Any] = Field(default=None, sa_column=Column(CompressedJSON))
+    # Digest of each rubric problem the grades were made against (see rubric_diff)
+    rubric_digests: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class Job(SQLModel, table=True):
+    """Unit of background work claimed by workers under a lease (see app.jobs)."""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "priority", "run_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    payload: Any = Field(default=None, sa_column=Column(JSON, nullable=False))
+    # Lower runs first; see app.jobs.LANES
+    priority: int = 10
+    # queued -> running -> done | failed
+    status: str = "queued"
+    attempts: int = 0
+    max_attempts: int = 3
+    run_at: datetime = Field(default_factory=utcnow)
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class Event(SQLModel, table=True):
+    """Progress event published by one process and relayed to the others (see app.events)."""
+
+    __tablename__ = "events"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    origin: str
+    topics: Any = Field(default=None, sa_column=Column(JSON, nullable=False))
+    payload: Any = Field(default=None, sa_column=Column(JSON, nullable=False))
+    created_at: datetime = Field(default_factory=utcnow, index=True)
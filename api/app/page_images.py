@@ -0,0 +1,178 @@
+"""Server-rendered page images for the grading view.
+
+The grading view used to download each whole submission PDF and render it in
+the browser, which is slow for large scans. Here pages are rasterized with
+pdfium into WebP at two widths: a thumbnail for page navigation and a preview
+for reading. A reviewer then downloads only the pages they look at.
+
+A `render_pages` job renders every page after upload. A page the job has not
+reached yet is rendered when it is first requested. Images are
+content-addressed by the PDF's SHA-256 and the rendering settings, so they
+never change once written.
+"""
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from . import metrics
+from .agents.file_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+PAGE_IMAGES_ENABLED = os.getenv("GRADER_PAGE_IMAGES", "1") != "0"
+PAGE_IMAGE_DIR = Path(os.getenv("GRADER_PAGE_IMAGE_DIR", "uploads/pages"))
+# Image width in pixels per size
+SIZES = {
+    "thumb": int(os.getenv("GRADER_PAGE_THUMB_PX", "200")),
+    "preview": int(os.getenv("GRADER_PAGE_PREVIEW_PX", "1200")),
+}
+WEBP_QUALITY = int(os.getenv("GRADER_PAGE_WEBP_QUALITY", "80"))
+
+# Images behind a versioned URL never change; private, since they show student work
+PAGE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# WebP encoder effort (0-6): 2 encodes twice as fast as the default 4, for ~3% more bytes
+WEBP_METHOD = 2
+# Long pages (receipts, stitched scans) are capped at this height-to-width ratio
+MAX_ASPECT = 3
+
+# pdfium is not thread-safe: renders from the job and from requests take turns
+_pdfium_lock = threading.Lock()
+
+
+def _pdfium() -> Any:
+    """pypdfium2, imported on first use so it stays out of startup; None if not installed."""
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    return pypdfium2
+
+
+def _pillow() -> Any:
+    """PIL.Image, imported on first use like `_pdfium`; None if not installed."""
+    try:
+        from PIL import Image
+    except ImportError:  # page images are unavailable without Pillow
+        return None
+    return Image
+
+
+@dataclass(frozen=True)
+class PageSet:
+    """The cached page images of one PDF."""
+
+    sha256: str
+    directory: Path
+    # (width, height) of each page in PDF points
+    page_sizes: Tuple[Tuple[float, float], ...]
+
+    @property
+    def version(self) -> str:
+        """Tag of the PDF's content for image URLs."""
+        return self.sha256[:16]
+
+    def path(self, page: int, size: str) -> Path:
+        return self.directory / f"{size}{SIZES[size]}-{page}.webp"
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def page_set(pdf_path: str, *, sha256: Optional[str] = None) -> Optional[PageSet]:
+    """The page images of a PDF, with its page sizes read on first use.
+
+    Returns None when page images are disabled (GRADER_PAGE_IMAGES=0),
+    pypdfium2 or Pillow is not installed, or the PDF cannot be read.
+    """
+    pdfium = _pdfium()
+    if not PAGE_IMAGES_ENABLED or _pillow() is None or pdfium is None:
+        return None
+    try:
+        sha256 = sha256 or file_sha256(pdf_path)
+        directory = PAGE_IMAGE_DIR / f"{sha256[:16]}-q{WEBP_QUALITY}"
+        record = directory / "pages.json"
+        if not record.exists():
+            with _pdfium_lock:
+                document = pdfium.PdfDocument(pdf_path)
+                try:
+                    sizes = [document.get_page_size(index) for index in range(len(document))]
+                finally:
+                    document.close()
+            _write(record, json.dumps(sizes).encode())
+        sizes = json.loads(record.read_text())
+    except Exception:
+        logger.warning("Could not read the pages of %s", pdf_path, exc_info=True)
+        return None
+    return PageSet(sha256, directory, tuple((width, height) for width, height in sizes))
+
+
+def _render(pdf_path: str, pages: PageSet, page: int, sizes: Iterable[str], trigger: str) -> None:
+    """Rasterize one page once, at the largest of `sizes`, and write each size from it."""
+    sizes = sorted(sizes, key=SIZES.get, reverse=True)
+    width, height = pages.page_sizes[page - 1]
+    scale = min(SIZES[sizes[0]] / width, MAX_ASPECT * SIZES[sizes[0]] / height)
+    pdfium, Image = _pdfium(), _pillow()
+    with _pdfium_lock:
+        document = pdfium.PdfDocument(pdf_path)
+        try:
+            pdf_page = document[page - 1]
+            bitmap = pdf_page.render(scale=scale, draw_annots=True, may_draw_forms=True)
+            # A copy, so the bitmap is released under the lock too
+            image = bitmap.to_pil().convert("RGB")
+            bitmap.close()
+            pdf_page.close()
+        finally:
+            document.close()
+
+    for size in sizes:
+        if image.width > SIZES[size]:
+            scale = SIZES[size] / image.width
+            image = image.resize((SIZES[size], max(1, round(image.height * scale))), Image.LANCZOS, reducing_gap=3.0)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=WEBP_METHOD)
+        _write(pages.path(page, size), buffer.getvalue())
+    metrics.count_page_render(trigger)
+
+
+def render_page(pdf_path: str, pages: PageSet, page: int, size: str) -> Path:
+    """Path of one page image (1-based `page`), rendered now if it is not cached yet."""
+    path = pages.path(page, size)
+    if not path.exists():
+        # Both sizes come from one rasterization
+        _render(pdf_path, pages, page, [name for name in SIZES if not pages.path(page, name).exists()], "request")
+    return path
+
+
+def render_pages(pdf_path: str, *, sha256: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Render every page of a PDF at every size, skipping cached images.
+
+    This is the stage run after upload. It returns the page count and bytes
+    written, or None when page images are unavailable (see `page_set`).
+    """
+    pages = page_set(pdf_path, sha256=sha256)
+    if pages is None:
+        return None
+    rendered = 0
+    for page in range(1, len(pages.page_sizes) + 1):
+        missing = [size for size in SIZES if not pages.path(page, size).exists()]
+        if missing:
+            _render(pdf_path, pages, page, missing, "upload")
+            rendered += 1
+    return {
+        "pages": len(pages.page_sizes),
+        "rendered": rendered,
+        "bytes": {
+            size: sum(pages.path(page, size).stat().st_size for page in range(1, len(pages.page_sizes) + 1))
+            for size in SIZES
+        },
+    }
@@ -1,102 +1,161 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, status, Form
-from starlette.responses import JSONResponse as JsonResponse
+from fastapi import APIRouter, Body, UploadFile, File, Query, Request, status, Form
+from starlette.responses import JSONResponse as JsonResponse, StreamingResponse
+from datetime import datetime, timezone
 from pathlib import Path
-import random
-import shutil
-import re
-from typing import Optional
-from app.agents.llm_grading import preprocess, rubric_to_problem_structure
+import logging
+from typing import Optional, Dict, Any, Iterator, List
+from app.agents.problems import rubric_to_problem_structure
+from app.agents.rubric_diff import diff_rubrics, problem_digests, stale_problems
+from app import jobs, store
+from app.export import export_columns, iter_export_rows, stream_csv, stream_ndjson
+from app.events import SSE_HEADERS, assignment_topic, bus, sse_stream
+from app.http_cache import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paged_response
+from app.models import Assignment, Submission
+from app.uploads import UploadRejected, rejection_response, sanitize_filename, save_upload
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/assignments", tags=["assignments"])
 
 UPLOAD_DIR = Path("uploads/assignments")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-# In-memory store for assignments
-assignments = {}
-
-def _sanitize_filename(filename: str) -> str:
-    """Sanitize filename to be safe for filesystem and API usage."""
-    # Remove or replace problematic characters
-    sanitized = re.sub(r'[<>:"/\\|?*]', '-', filename)
-    # Remove multiple consecutive dashes
-    sanitized = re.sub(r'-+', '-', sanitized)
-    # Remove leading and trailing dashes
-    sanitized = sanitized.strip('-')
-    # Ensure it's not empty
-    if not sanitized:
-        sanitized = "file"
-    return sanitized
-
-def process_rubric(file_id: str, file_path: Path):
+# "two_stage": extract markdown, then grade it (two model calls per submission).
+# "single_pass": extract and grade in one structured response.
+# "per_problem": extract, then grade every problem in its own concurrent call.
+GRADING_MODES = ("two_stage", "single_pass", "per_problem")
+DEFAULT_GRADING_MODE = "two_stage"
+
+# Columns returned by the list endpoint unless `fields` asks for others
+ASSIGNMENT_LIST_FIELDS = ("id", "name", "file_path", "grading_mode", "has_rubric", "has_problem_structure", "updated_at")
+# Computed in SQL so listing never decompresses the rubric blobs
+_ASSIGNMENT_FLAGS = {
+    "has_rubric": Assignment.rubric.is_not(None),
+    "has_problem_structure": Assignment.problem_structure.is_not(None),
+}
+# Graded submissions read per query when planning a re-grade
+REGRADE_CHUNK = 500
+
+async def _swap_context_caches(previous: Dict[str, Any], rubric: Any, problem_structure: Dict[str, Any]) -> int:
+    """Cache the new rubric's prompt prefixes and delete those of the one it replaced.
+
+    Both are best effort (calls fall back to sending the prompt inline), so
+    neither can fail the caller: the rubric is already stored. Returns the
+    number of live caches.
+    """
+    from app.agents import llm_grading
+
+    try:
+        if previous.get("rubric") is not None and previous["rubric"] != rubric:
+            await llm_grading.ainvalidate_context_caches(previous["rubric"], previous.get("problem_structure") or {})
+        return await llm_grading.awarm_context_caches(rubric, problem_structure, previous.get("grading_mode", DEFAULT_GRADING_MODE))
+    except Exception:
+        logger.warning("Could not swap the context caches of a replaced rubric", exc_info=True)
+        return 0
+
+async def process_rubric(
+    file_id: str,
+    file_path: Path,
+    pdf_sha256: Optional[str] = None,
+    final_attempt: bool = True,
+):
     """
-    Preprocess the uploaded PDF and store the rubric in the assignments dict.
+    Preprocess the uploaded PDF and store the rubric on the assignment record.
+    Progress is pushed as `rubric` events on the assignment's event stream;
+    failures the job queue will retry are reported as `retrying`.
     """
-    rubric_dict = preprocess(
-        problems_pdf_path=str(file_path),
-        optional_solution_or_rubric_text=None,
-    )
+    # Imported on first use so the API starts without loading the model stack
+    from app.agents import llm_grading
 
-    problem_structure = rubric_to_problem_structure(rubric_dict)
+    topic = assignment_topic(file_id)
+    bus.publish({"type": "rubric", "assignment_id": file_id, "stage": "preprocessing"}, topic)
+    try:
+        rubric_dict = await llm_grading.apreprocess(
+            problems_pdf_path=str(file_path),
+            optional_solution_or_rubric_text=None,
+            pdf_sha256=pdf_sha256,
+        )
+
+        problem_structure = rubric_to_problem_structure(rubric_dict)
+    except Exception as exc:
+        stage = "failed" if final_attempt else "retrying"
+        if final_attempt:
+            # Submissions waiting for the rubric fail instead of waiting forever
+            store.update_assignment(file_id, error=str(exc))
+        bus.publish({"type": "rubric", "assignment_id": file_id, "stage": stage, "error": str(exc)}, topic)
+        raise
 
-    assignments[file_id]["rubric"] = rubric_dict
-    assignments[file_id]["problem_structure"] = problem_structure
+    previous = store.get_assignment(file_id) or {}
+    store.update_assignment(file_id, rubric=rubric_dict, problem_structure=problem_structure, error=None)
+    cached = await _swap_context_caches(previous, rubric_dict, problem_structure)
+    bus.publish({"type": "rubric", "assignment_id": file_id, "stage": "done", "context_caches": cached}, topic)
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_rubric(
-    background_tasks: BackgroundTasks,
+async def create_rubric(
     file: UploadFile = File(...),
-    name: str = Form(...)
+    name: str = Form(...),
+    grading_mode: str = Form(DEFAULT_GRADING_MODE),
 ):
-    file_id = str(random.randint(1, 999))
-    sanitized_filename = _sanitize_filename(file.filename)
+    if grading_mode not in GRADING_MODES:
+        return JsonResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"grading_mode must be one of {', '.join(GRADING_MODES)}"}
+        )
+
+    file_id = store.new_id(Assignment)
+    sanitized_filename = sanitize_filename(file.filename)
     saved_path = UPLOAD_DIR / f"{file_id}-{sanitized_filename}"
-    
-    with saved_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Store basic assignment info first
-    assignments[file_id] = {
-        "id": file_id,
-        "name": name,
-        "file_path": str(saved_path),
-        "rubric": None,
-        "problem_structure": None  # Will be filled by background task
-    }
+    try:
+        stored = await save_upload(file, saved_path)
+    except UploadRejected as exc:
+        return rejection_response(exc)
 
-    # Schedule preprocessing in the background
-    background_tasks.add_task(
-        process_rubric,
-        file_id=file_id,
-        file_path=saved_path
+    # Store basic assignment info first; rubric and problem_structure are
+    # filled in by the background task
+    store.create_assignment(
+        id=file_id,
+        name=name,
+        file_path=str(saved_path),
+        grading_mode=grading_mode,
+        sha256=stored.sha256,
+        size_bytes=stored.size,
     )
 
+    # Preprocessing runs on a worker; see app.worker
+    jobs.enqueue("preprocess_rubric", {"assignment_id": file_id})
+
     return JsonResponse(
         status_code=status.HTTP_201_CREATED,
         content={"assignment_id": file_id, "message": "Rubric uploaded. Processing in background."}
     )
 
 @router.get("/", status_code=status.HTTP_200_OK)
-def list_assignments():
-    """List all assignments with their basic info."""
-    assignment_list = []
-    for assignment_id, assignment in assignments.items():
-        assignment_list.append({
-            "id": assignment_id,
-            "name": assignment.get("name", f"Assignment {assignment_id}"),
-            "file_path": assignment.get("file_path", ""),
-            "has_rubric": assignment.get("rubric") is not None,
-            "has_problem_structure": assignment.get("problem_structure") is not None,
-        })
-    
-    return JsonResponse(
-        status_code=status.HTTP_200_OK,
-        content={"assignments": assignment_list}
+def list_assignments(
+    request: Request,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """List assignments, oldest first, with their basic info.
+
+    `rubric` and `problem_structure` are only returned when requested with
+    `fields`. Paginated and cacheable like `GET /submissions/`.
+    """
+    return paged_response(
+        request,
+        Assignment,
+        "assignments",
+        fields=fields,
+        allowed_fields=store.columns_of(Assignment) + tuple(_ASSIGNMENT_FLAGS),
+        default_fields=ASSIGNMENT_LIST_FIELDS,
+        computed=_ASSIGNMENT_FLAGS,
+        cursor=cursor,
+        limit=limit,
     )
 
 @router.get("/{assignment_id}", status_code=status.HTTP_200_OK)
 def get_rubric(assignment_id: str):
-    assignment = assignments.get(assignment_id)
+    assignment = store.get_assignment(assignment_id)
     if not assignment:
         return JsonResponse(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -107,3 +166,212 @@ def get_rubric(assignment_id: str):
         status_code=status.HTTP_200_OK,
         content=assignment
     )
+
+
+@router.get("/{assignment_id}/events")
+async def assignment_events(assignment_id: str, request: Request):
+    """Server-Sent Events stream for a whole assignment.
+
+    Carries `rubric` events from preprocessing plus the `stage` and `problem`
+    events of every submission to the assignment. Open until the client leaves.
+    """
+    if store.get_assignment(assignment_id) is None:
+        return JsonResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+
+    async def stream():
+        async with bus.subscribe(assignment_topic(assignment_id)) as queue:
+            assignment = store.get_assignment(assignment_id)
+            snapshot = {
+                "type": "snapshot",
+                "assignment_id": assignment_id,
+                "has_rubric": assignment.get("rubric") is not None,
+            }
+            async for frame in sse_stream(request, queue, snapshot=snapshot):
+                yield frame
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/{assignment_id}/export")
+def export_grades(
+    assignment_id: str,
+    export_format: str = Query("csv", alias="format"),
+    since: Optional[datetime] = None,
+):
+    """Stream the gradebook: one row per submission with per-problem and per-item scores.
+
+    `format` is `csv` (header from the rubric) or `ndjson`. `since` keeps only
+    submissions updated after that time; the `X-Export-As-Of` header is the
+    value to pass as `since` on the next incremental sync.
+    """
+    if export_format not in ("csv", "ndjson"):
+        return JsonResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "format must be csv or ndjson"}
+        )
+    assignment = store.get_assignment(assignment_id)
+    if not assignment:
+        return JsonResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+
+    # Taken before reading, so rows updated while streaming are sent again next time
+    as_of = datetime.now(timezone.utc).isoformat()
+    rubric = assignment.get("rubric")
+    rows = iter_export_rows(assignment_id, rubric, since)
+    if export_format == "csv":
+        body, media_type = stream_csv(export_columns(rubric), rows), "text/csv; charset=utf-8"
+    else:
+        body, media_type = stream_ndjson(rows), "application/x-ndjson"
+    headers = {
+        "X-Export-As-Of": as_of,
+        "Content-Disposition": f'attachment; filename="assignment-{assignment_id}-grades.{export_format}"',
+    }
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@router.put("/{assignment_id}", status_code=status.HTTP_200_OK)
+def update_assignment(assignment_id: str, payload: Dict[str, Any]):
+    """Update an assignment's `name` and/or `grading_mode`."""
+    assignment = store.get_assignment(assignment_id)
+    if not assignment:
+        return JsonResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+
+    if "grading_mode" in payload and payload["grading_mode"] not in GRADING_MODES:
+        return JsonResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"grading_mode must be one of {', '.join(GRADING_MODES)}"}
+        )
+
+    # Only update allowed fields to avoid unexpected changes
+    allowed_fields = {"name", "grading_mode"}
+    updates = {key: value for key, value in payload.items() if key in allowed_fields}
+    assignment = store.update_assignment(assignment_id, **updates)
+
+    return JsonResponse(status_code=status.HTTP_200_OK, content=assignment)
+
+
+def _rubric_error(rubric: Any) -> Optional[str]:
+    if not isinstance(rubric, list) or not rubric:
+        return "rubric must be a non-empty list of problems"
+    ids = [problem.get("id") if isinstance(problem, dict) else None for problem in rubric]
+    if any(pid is None for pid in ids):
+        return "every problem needs an id"
+    if len({str(pid) for pid in ids}) != len(ids):
+        return "problem ids must be unique"
+    return None
+
+
+@router.put("/{assignment_id}/rubric", status_code=status.HTTP_200_OK)
+async def replace_rubric(assignment_id: str, payload: Dict[str, Any]):
+    """Replace an assignment's rubric (`{"rubric": [...]}`), e.g. to fix one item.
+
+    Returns which problems changed. Existing grades are kept until
+    `POST /{assignment_id}/regrade` re-grades the problems that changed.
+    """
+    assignment = store.get_assignment(assignment_id)
+    if not assignment:
+        return JsonResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+    rubric = payload.get("rubric")
+    error = _rubric_error(rubric)
+    if error is not None:
+        return JsonResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"message": error})
+
+    problem_structure = rubric_to_problem_structure(rubric)
+    store.update_assignment(assignment_id, rubric=rubric, problem_structure=problem_structure)
+    cached = await _swap_context_caches(assignment, rubric, problem_structure)
+    bus.publish(
+        {"type": "rubric", "assignment_id": assignment_id, "stage": "done", "context_caches": cached},
+        assignment_topic(assignment_id),
+    )
+    return JsonResponse(
+        status_code=status.HTTP_200_OK,
+        content={"assignment_id": assignment_id, "diff": diff_rubrics(assignment.get("rubric"), rubric)}
+    )
+
+
+def _graded_submissions(assignment_id: str) -> Iterator[Dict[str, Any]]:
+    """Id, rubric digests and an extraction flag of each graded submission, a chunk at a time.
+
+    The extraction and grades are loaded by the re-grade job itself.
+    """
+    filters = [Submission.assignment_id == assignment_id, Submission.status == "graded"]
+    computed = {"has_extraction": Submission.extraction.is_not(None)}
+    after = None
+    while True:
+        keys = store.page_keys(Submission, filters, after=after, limit=REGRADE_CHUNK)
+        page = keys[:REGRADE_CHUNK]
+        ids = [row_id for row_id, _, _ in page]
+        yield from store.load_rows(Submission, ids, ("id", "rubric_digests", "has_extraction"), computed)
+        if len(keys) <= REGRADE_CHUNK:
+            return
+        after = (page[-1][1], page[-1][0])
+
+
+@router.post("/{assignment_id}/regrade", status_code=status.HTTP_202_ACCEPTED)
+def regrade_assignment(assignment_id: str, payload: Optional[Dict[str, Any]] = Body(None)):
+    """Re-grade the graded submissions of an assignment after a rubric edit.
+
+    Each submission re-grades only the problems whose rubric entry differs from
+    the one it was graded against (or the `problems` listed in the body),
+    reusing its stored extraction; grades of removed problems are dropped.
+    Submissions graded before extractions were kept get a full re-grade.
+    """
+    assignment = store.get_assignment(assignment_id)
+    if not assignment:
+        return JsonResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+    rubric = assignment.get("rubric")
+    if rubric is None:
+        return JsonResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"message": "Rubric is still being processed"}
+        )
+
+    current = problem_digests(rubric)
+    requested: Optional[List[str]] = None
+    if payload and payload.get("problems") is not None:
+        requested = [str(pid) for pid in payload["problems"]]
+        unknown = [pid for pid in requested if pid not in current]
+        if unknown:
+            return JsonResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": f"Unknown problems: {', '.join(unknown)}"}
+            )
+
+    payloads: List[Dict[str, Any]] = []
+    counts = {"partial": 0, "full": 0, "unchanged": 0, "problems_regraded": 0}
+    for submission in _graded_submissions(assignment_id):
+        stale = stale_problems(submission.get("rubric_digests"), rubric)
+        if stale is None or not submission["has_extraction"]:
+            payloads.append({"submission_id": submission["id"], "problems": None})
+            counts["full"] += 1
+            continue
+        problems = requested if requested is not None else stale
+        removed = any(pid not in current for pid in submission["rubric_digests"])
+        if not problems and not removed:
+            counts["unchanged"] += 1
+            continue
+        payloads.append({"submission_id": submission["id"], "problems": problems, "previous_status": "graded"})
+        counts["partial"] += 1
+        counts["problems_regraded"] += len(problems)
+
+    if payloads:
+        # Instructor re-grades jump ahead of queued batch work
+        jobs.enqueue_many("regrade_problems", payloads, lane="regrade")
+    return JsonResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"assignment_id": assignment_id, "queued": len(payloads), **counts}
+    )
@@ -0,0 +1,210 @@
+from fastapi import APIRouter, UploadFile, File, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import random
+import re
+import zipfile
+from pathlib import Path
+from typing import Optional, List, Tuple
+from app import jobs, store
+from app.events import publish_submission_event
+from app.uploads import (
+    MAX_UPLOAD_BYTES,
+    StoredFile,
+    UploadRejected,
+    new_submission_id,
+    rejection_response,
+    sanitize_filename,
+    save_stream,
+    save_upload,
+    too_large,
+)
+from .submissions import UPLOAD_DIR
+
+router = APIRouter(prefix="/assignments", tags=["submissions"])
+
+# Progress counters reported for each submission status of a batch
+_STATUS_COUNTERS = {"pending": "queued", "grading": "in_progress", "graded": "completed", "failed": "failed"}
+
+
+def _student_name_from_filename(filename: str) -> str:
+    """Derive a student name from an uploaded file name, e.g. 'jane_doe-hw1.pdf' -> 'jane doe hw1'."""
+    stem = Path(filename).stem
+    name = re.sub(r"[_\-.]+", " ", stem).strip()
+    return name or "Unknown student"
+
+
+def _is_pdf_member(info: zipfile.ZipInfo) -> bool:
+    name = info.filename
+    if info.is_dir() or not name.lower().endswith(".pdf"):
+        return False
+    # Skip macOS resource forks and hidden files
+    parts = Path(name).parts
+    return not any(part == "__MACOSX" or part.startswith(".") for part in parts)
+
+
+def _reserve_id(taken: set) -> str:
+    submission_id = new_submission_id()
+    while submission_id in taken:
+        submission_id = new_submission_id()
+    taken.add(submission_id)
+    return submission_id
+
+
+def _discard(items: List[Tuple[str, str, StoredFile]]) -> None:
+    for _, _, stored in items:
+        stored.path.unlink(missing_ok=True)
+
+
+def _extract_zip(archive_file, taken: set) -> List[Tuple[str, str, StoredFile]]:
+    """Stream every PDF in the archive to disk. Returns (submission_id, student_name, file) tuples."""
+    extracted: List[Tuple[str, str, StoredFile]] = []
+    try:
+        with zipfile.ZipFile(archive_file) as zf:
+            for info in zf.infolist():
+                if not _is_pdf_member(info):
+                    continue
+                # Declared size lets oversized members fail before anything is inflated
+                if info.file_size > MAX_UPLOAD_BYTES:
+                    raise too_large(MAX_UPLOAD_BYTES)
+                filename = Path(info.filename).name
+                submission_id = _reserve_id(taken)
+                path = UPLOAD_DIR / f"{submission_id}-{sanitize_filename(filename)}"
+                with zf.open(info) as src:
+                    stored = save_stream(src, path)
+                extracted.append((submission_id, _student_name_from_filename(filename), stored))
+    except BaseException:
+        _discard(extracted)
+        raise
+    return extracted
+
+
+async def _save_files(files: List[UploadFile], taken: set) -> List[Tuple[str, str, StoredFile]]:
+    saved: List[Tuple[str, str, StoredFile]] = []
+    try:
+        for upload in files:
+            if not upload.filename or not upload.filename.lower().endswith(".pdf"):
+                continue
+            submission_id = _reserve_id(taken)
+            path = UPLOAD_DIR / f"{submission_id}-{sanitize_filename(upload.filename)}"
+            stored = await save_upload(upload, path)
+            saved.append((submission_id, _student_name_from_filename(upload.filename), stored))
+    except BaseException:
+        _discard(saved)
+        raise
+    return saved
+
+
+@router.post("/{assignment_id}/submissions:batch", status_code=status.HTTP_202_ACCEPTED)
+async def create_submission_batch(
+    assignment_id: str,
+    archive: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File([]),
+):
+    """
+    Accept a ZIP of PDFs (`archive`) and/or a multipart list of PDFs (`files`)
+    and grade them as one batch. Student names come from the file names.
+    """
+    assignment = store.get_assignment(assignment_id)
+    if not assignment:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Assignment not found"}
+        )
+
+    batch_id = str(random.randint(1, 999999))
+    while store.count_submissions_by_status(batch_id):
+        batch_id = str(random.randint(1, 999999))
+
+    items: List[Tuple[str, str, StoredFile]] = []
+    taken: set = set()
+    try:
+        if files:
+            items += await _save_files(files, taken)
+        if archive is not None:
+            items += await run_in_threadpool(_extract_zip, archive.file, taken)
+    except zipfile.BadZipFile:
+        _discard(items)
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "Archive is not a valid ZIP file"}
+        )
+    except UploadRejected as exc:
+        _discard(items)
+        return rejection_response(exc)
+
+    if not items:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": "No PDF files found in upload"}
+        )
+
+    store.create_submissions(
+        {
+            "id": submission_id,
+            "assignment_id": assignment_id,
+            "student_name": student_name,
+            "file_path": str(stored.path),
+            "sha256": stored.sha256,
+            "size_bytes": stored.size,
+            "batch_id": batch_id,
+        }
+        for submission_id, student_name, stored in items
+    )
+    submission_files = {submission_id: stored for submission_id, _, stored in items}
+    for submission_id in submission_files:
+        publish_submission_event(submission_id, assignment_id, type="stage", stage="uploaded", batch_id=batch_id)
+
+    # Batch work runs in the bulk lane so single uploads and re-grades are not stuck behind it.
+    # The prefetch job is claimed first and uploads every PDF concurrently.
+    jobs.enqueue("prefetch_uploads", {"submission_ids": list(submission_files)}, lane="bulk")
+    jobs.enqueue_many(
+        "grade_submission",
+        ({"submission_id": submission_id} for submission_id in submission_files),
+        lane="bulk",
+    )
+    jobs.enqueue_many(
+        "render_pages",
+        ({"submission_id": submission_id} for submission_id in submission_files),
+        lane="bulk",
+    )
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "batch_id": batch_id,
+            "submission_ids": list(submission_files),
+            "message": f"{len(items)} submissions received. Grading in progress."
+        }
+    )
+
+
+@router.get("/{assignment_id}/submissions:batch/{batch_id}", status_code=status.HTTP_200_OK)
+def get_submission_batch(assignment_id: str, batch_id: str):
+    """Per-batch progress counters, derived from the batch's submission statuses."""
+    counts = store.count_submissions_by_status(batch_id)
+    batch_submissions = store.list_submissions(assignment_id=assignment_id, batch_id=batch_id) if counts else []
+    if not batch_submissions:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Batch not found"}
+        )
+
+    batch = {
+        "id": batch_id,
+        "assignment_id": assignment_id,
+        "total": len(batch_submissions),
+        **{counter: counts.get(state, 0) for state, counter in _STATUS_COUNTERS.items()},
+        "submission_ids": [submission["id"] for submission in batch_submissions],
+        "errors": {
+            submission["id"]: submission["error"]
+            for submission in batch_submissions
+            if submission["status"] == "failed"
+        },
+    }
+    batch["status"] = "done" if batch["queued"] + batch["in_progress"] == 0 else "running"
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=batch
+    )
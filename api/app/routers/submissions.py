@@ -1,129 +1,501 @@
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, status
-from fastapi.responses import JSONResponse
-import random
-import shutil
-import re
+from fastapi import APIRouter, UploadFile, File, Form, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+import asyncio
 from pathlib import Path
-from typing import Optional, Dict, Any
-from .assignments import assignments
-from app.agents.llm_grading import extract_submission, grade_submission
+from typing import Optional, Dict, Any, List, Literal
+from .assignments import DEFAULT_GRADING_MODE
+from app import jobs, page_images, store
+from app.events import SSE_HEADERS, STAGE_FOR_STATUS, bus, publish_submission_event, sse_stream, submission_topic
+from app.http_cache import (
+    DEFAULT_PAGE_SIZE,
+    LIST_CACHE_CONTROL,
+    MAX_PAGE_SIZE,
+    compute_etag,
+    etag_matches,
+    not_modified,
+    paged_response,
+)
+from app.models import Submission
+from app.uploads import UploadRejected, new_submission_id, rejection_response, sanitize_filename, save_upload
+from app.agents.page_segments import PdfPart, Segmentation, segment_pdf
+from app.agents.pdf_optimize import optimize_pdf
+from app.agents.problems import split_markdown_by_problem
+from app.agents.rubric_diff import merge_graded, problem_digests
 
 router = APIRouter(prefix="/submissions", tags=["submissions"])
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# In-memory store for submissions
-submissions = {}
-
-def _sanitize_filename(filename: str) -> str:
-    """Sanitize filename to be safe for filesystem and API usage."""
-    # Remove or replace problematic characters
-    sanitized = re.sub(r'[<>:"/\\|?*]', '-', filename)
-    # Remove multiple consecutive dashes
-    sanitized = re.sub(r'-+', '-', sanitized)
-    # Remove leading and trailing dashes
-    sanitized = sanitized.strip('-')
-    # Ensure it's not empty
-    if not sanitized:
-        sanitized = "file"
-    return sanitized
-
-def process_submission(submission_id: str, submission_path: Path, rubric: Dict[str, Any], problem_structure: Dict[str, Any]):
+# Columns returned by the list endpoint unless `fields` asks for others
+SUBMISSION_LIST_FIELDS = ("id", "assignment_id", "student_name", "file_path", "status", "updated_at")
+
+def _attached_parts(segments: Segmentation, grading_mode: str) -> List[PdfPart]:
+    """PDFs attached by each model call `process_submission` makes in `grading_mode`."""
+    if grading_mode == "single_pass":
+        return [segments.relevant]
+    if grading_mode == "per_problem":
+        return [segments.relevant, *segments.problems.values()]
+    return [segments.relevant, segments.relevant]
+
+def _extraction_record(student_md: str, rubric: Any) -> Dict[str, Any]:
+    """Stored extraction: the whole markdown and its section per rubric problem."""
+    problems = split_markdown_by_problem(student_md, rubric) if isinstance(rubric, list) else {}
+    return {"markdown": student_md, "problems": problems}
+
+async def process_submission(
+    submission_id: str,
+    submission_path: Path,
+    rubric: Dict[str, Any],
+    problem_structure: Dict[str, Any],
+    bypass_cache: bool = False,
+    grading_mode: str = DEFAULT_GRADING_MODE,
+    pdf_sha256: Optional[str] = None,
+    assignment_id: Optional[str] = None,
+    final_attempt: bool = True,
+):
     """
-    Extract and grade submission, store result in the submissions dict.
+    Extract and grade submission, store the result on the submission record.
+
+    Runs on the event loop; model calls are bounded by the per-loop pool in llm_grading.
+    `bypass_cache` forces fresh model calls instead of cached responses (re-grades).
+    `grading_mode` is the assignment's mode; "single_pass" uses one model call,
+    "per_problem" grades the problems concurrently after extraction.
+    `pdf_sha256` is the digest recorded at upload, so the file is not hashed again.
+    Large PDFs (scans) are first optimized locally: images downsampled, blank
+    pages dropped (see `pdf_optimize`). The copy is what the model calls attach
+    and the bytes saved are recorded as `optimization`; the original is kept.
+    When the PDF has a text layer, model calls attach only the pages of its
+    problems (per problem in "per_problem" mode); the savings are recorded as
+    `segmentation` on the submission. The extracted markdown is kept as
+    `extraction` and the rubric problems graded as `rubric_digests`, so a
+    later rubric edit can re-grade just the changed problems (`regrade_problems`).
+    Status goes pending -> grading -> graded, or failed (the error is re-raised).
+    When the job queue will retry (`final_attempt` False) a failure puts the
+    submission back to pending instead.
+    Stage transitions and per-problem results are pushed to the event streams.
+    Each problem's grade is also stored as soon as it is complete (grading
+    answers are streamed), so `graded_content` fills in while the status is
+    still "grading"; a failed run restores the grades it started from.
     """
-    student_md = extract_submission(
-        submission_pdf_path=str(submission_path),
-        problem_structure=problem_structure
-    )
+    # Imported on first use so the API starts without loading the model stack
+    from app.agents import llm_grading
+
+    def publish(**event: Any):
+        publish_submission_event(submission_id, assignment_id, **event)
+
+    progress: Dict[str, Any] = {}
+
+    async def on_problem(entry: Dict[str, Any]):
+        publish(type="problem", entry=entry)
+        if not isinstance(rubric, list):
+            return
+        if "graded" not in progress:
+            record = store.get_submission(submission_id) or {}
+            progress["previous"], progress["graded"] = record.get("graded_content"), []
+        progress["graded"] = merge_graded(progress["graded"], [entry], rubric)
+        store.queue_submission_update(submission_id, graded_content=progress["graded"])
+
+    store.queue_submission_update(submission_id, status="grading", error=None)
+    try:
+        optimized = await asyncio.to_thread(optimize_pdf, str(submission_path), sha256=pdf_sha256)
+        if optimized is not None:
+            report = optimized.report()
+            store.queue_submission_update(submission_id, optimization=report)
+            publish(type="optimization", **report)
+            submission_path, pdf_sha256 = Path(optimized.path), optimized.sha256
+
+        segments = await asyncio.to_thread(segment_pdf, str(submission_path), problem_structure, sha256=pdf_sha256)
+        problem_pdfs = None
+        if segments is not None:
+            page_numbers = optimized.kept_pages if optimized is not None else None
+            report = segments.report(_attached_parts(segments, grading_mode), page_numbers)
+            store.queue_submission_update(submission_id, segmentation=report)
+            publish(type="segmentation", **report)
+            # Pages outside every problem (cover sheets) are never sent
+            submission_path, pdf_sha256 = Path(segments.relevant.path), segments.relevant.sha256
+            problem_pdfs = {pid: (part.path, part.sha256) for pid, part in segments.problems.items()}
 
-    graded_content = grade_submission(
-        rubric=rubric,
-        student_markdown=student_md,
-        submission_pdf_path=submission_path
+        if grading_mode == "single_pass":
+            publish(type="stage", stage="grading")
+            result = await llm_grading.agrade_submission_single_pass(
+                rubric=rubric,
+                problem_structure=problem_structure,
+                submission_pdf_path=submission_path,
+                bypass_cache=bypass_cache,
+                pdf_sha256=pdf_sha256,
+                on_problem=on_problem,
+            )
+            graded_content = result["graded_content"]
+            store.queue_submission_update(
+                submission_id, extraction=_extraction_record(result["student_markdown"], rubric)
+            )
+        else:
+            publish(type="stage", stage="extracting")
+            student_md = await llm_grading.aextract_submission(
+                submission_pdf_path=str(submission_path),
+                problem_structure=problem_structure,
+                bypass_cache=bypass_cache,
+                pdf_sha256=pdf_sha256,
+            )
+            store.queue_submission_update(submission_id, extraction=_extraction_record(student_md, rubric))
+
+            publish(type="stage", stage="grading")
+            if grading_mode == "per_problem":
+                graded_content = await llm_grading.agrade_submission_by_problem(
+                    rubric=rubric,
+                    student_markdown=student_md,
+                    submission_pdf_path=submission_path,
+                    bypass_cache=bypass_cache,
+                    pdf_sha256=pdf_sha256,
+                    on_problem=on_problem,
+                    problem_pdfs=problem_pdfs,
+                )
+            else:
+                graded_content = await llm_grading.agrade_submission(
+                    rubric=rubric,
+                    student_markdown=student_md,
+                    submission_pdf_path=submission_path,
+                    bypass_cache=bypass_cache,
+                    pdf_sha256=pdf_sha256,
+                    on_problem=on_problem,
+                )
+    except Exception as exc:
+        if "graded" in progress:
+            store.queue_submission_update(submission_id, graded_content=progress["previous"])
+        if final_attempt:
+            store.queue_submission_update(submission_id, status="failed", error=str(exc))
+            publish(type="stage", stage="failed", error=str(exc))
+        else:
+            store.queue_submission_update(submission_id, status="pending", error=str(exc))
+            publish(type="stage", stage="retrying", error=str(exc))
+        raise
+
+    store.queue_submission_update(
+        submission_id, status="graded", graded_content=graded_content, rubric_digests=problem_digests(rubric)
     )
+    publish(type="stage", stage="done")
+
+async def regrade_problems(
+    submission_id: str,
+    submission_path: Path,
+    rubric: List[Dict[str, Any]],
+    problem_structure: Dict[str, Any],
+    extraction: Dict[str, Any],
+    graded_content: Any,
+    rubric_digests: Dict[str, str],
+    problem_ids: List[str],
+    grading_mode: str = DEFAULT_GRADING_MODE,
+    pdf_sha256: Optional[str] = None,
+    assignment_id: Optional[str] = None,
+    final_attempt: bool = True,
+    previous_status: str = "graded",
+):
+    """
+    Re-grade only `problem_ids` of a graded submission, reusing its stored extraction.
 
-    # Update the in-memory submissions dictionary
-    submissions[submission_id]["graded_content"] = graded_content
+    The new grades replace those problems' entries in `graded_content`; entries
+    of problems no longer in the rubric are dropped and every other grade is
+    kept. All problems are graded in one call, or one call each in
+    "per_problem" mode; single-pass assignments use a grading-only call since
+    the extraction already exists. Model calls always bypass the response cache.
+    On failure the previous grades stay in place and the error is recorded; the
+    status goes to pending while the job queue will retry (`final_attempt`
+    False), and back to `previous_status` after the last attempt.
+    """
+    from app.agents import llm_grading
+
+    def publish(**event: Any):
+        publish_submission_event(submission_id, assignment_id, **event)
+
+    async def on_problem(entry: Dict[str, Any]):
+        publish(type="problem", entry=entry)
+
+    wanted = set(problem_ids)
+    subset = [problem for problem in rubric if str(problem.get("id")) in wanted]
+    store.queue_submission_update(submission_id, status="grading", error=None)
+    publish(type="stage", stage="grading")
+    try:
+        regraded: List[Dict[str, Any]] = []
+        if subset:
+            optimized = await asyncio.to_thread(optimize_pdf, str(submission_path), sha256=pdf_sha256)
+            if optimized is not None:
+                submission_path, pdf_sha256 = Path(optimized.path), optimized.sha256
+            segments = await asyncio.to_thread(
+                segment_pdf, str(submission_path), problem_structure, sha256=pdf_sha256
+            )
+            problem_pdfs = None
+            if segments is not None:
+                submission_path, pdf_sha256 = Path(segments.relevant.path), segments.relevant.sha256
+                problem_pdfs = {pid: (part.path, part.sha256) for pid, part in segments.problems.items()}
+            if grading_mode == "per_problem":
+                regraded = await llm_grading.agrade_submission_by_problem(
+                    rubric=subset,
+                    student_markdown=extraction["markdown"],
+                    submission_pdf_path=submission_path,
+                    bypass_cache=True,
+                    pdf_sha256=pdf_sha256,
+                    on_problem=on_problem,
+                    problem_pdfs=problem_pdfs,
+                )
+            else:
+                sections = extraction.get("problems") or {}
+                # A problem without its own section maps to the whole markdown; join each text once
+                student_md = "\n\n".join(dict.fromkeys(sections[pid] for pid in problem_ids if pid in sections))
+                regraded = await llm_grading.agrade_submission(
+                    rubric=subset,
+                    student_markdown=student_md or extraction["markdown"],
+                    submission_pdf_path=submission_path,
+                    bypass_cache=True,
+                    pdf_sha256=pdf_sha256,
+                    on_problem=on_problem,
+                )
+            if not isinstance(regraded, list):
+                regraded = [regraded]
+    except Exception as exc:
+        if final_attempt:
+            store.queue_submission_update(submission_id, status=previous_status, error=str(exc))
+            publish(type="stage", stage="failed", error=str(exc))
+        else:
+            store.queue_submission_update(submission_id, status="pending", error=str(exc))
+            publish(type="stage", stage="retrying", error=str(exc))
+        raise
+
+    current = problem_digests(rubric)
+    digests = {
+        pid: digest if pid in wanted else rubric_digests.get(pid)
+        for pid, digest in current.items()
+        if pid in wanted or pid in rubric_digests
+    }
+    store.queue_submission_update(
+        submission_id,
+        status="graded",
+        graded_content=merge_graded(graded_content, regraded, rubric),
+        rubric_digests=digests,
+    )
+    publish(type="stage", stage="done")
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_submission(
-    background_tasks: BackgroundTasks,
+async def create_submission(
     assignment_id: str = Form(...),
     file: UploadFile = File(...),
     student_name: str = Form(...),
 ):
-    submission_id = str(random.randint(1, 999))
+    submission_id = new_submission_id()
 
-    assignment = assignments.get(assignment_id)
+    assignment = store.get_assignment(assignment_id)
     if not assignment:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"message": "Assignment not found"}
         )
 
-    sanitized_filename = _sanitize_filename(file.filename)
+    sanitized_filename = sanitize_filename(file.filename)
     submission_path = UPLOAD_DIR / f"{submission_id}-{sanitized_filename}"
-    with submission_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Store basic submission info in dict
-    submissions[submission_id] = {
-        "id": submission_id,
-        "assignment_id": assignment_id,
-        "student_name": student_name,
-        "file_path": str(submission_path),
-        "graded_content": None  # Will be filled by background task
-    }
+    try:
+        stored = await save_upload(file, submission_path)
+    except UploadRejected as exc:
+        return rejection_response(exc)
 
-    # Schedule grading in background
-    background_tasks.add_task(
-        process_submission,
-        submission_id=submission_id,
-        submission_path=submission_path,
-        rubric=assignment.get("rubric", {}),
-        problem_structure=assignment.get("problem_structure", {}),
+    # Store basic submission info; graded_content is filled by the background task
+    store.create_submission(
+        id=submission_id,
+        assignment_id=assignment_id,
+        student_name=student_name,
+        file_path=str(submission_path),
+        sha256=stored.sha256,
+        size_bytes=stored.size,
     )
 
+    # Grading and page images run on a worker; see app.worker
+    jobs.enqueue("grade_submission", {"submission_id": submission_id})
+    jobs.enqueue("render_pages", {"submission_id": submission_id})
+    publish_submission_event(submission_id, assignment_id, type="stage", stage="uploaded")
+
     return JSONResponse(
         status_code=status.HTTP_201_CREATED,
         content={"submission_id": submission_id, "message": "Submission received. Grading in progress."}
     )
 
 @router.get("/", status_code=status.HTTP_200_OK)
-def list_submissions():
-    """List all submissions with their basic info."""
-    submission_list = []
-    for submission_id, submission in submissions.items():
-        submission_list.append({
-            "id": submission_id,
-            "assignment_id": submission.get("assignment_id", ""),
-            "student_name": submission.get("student_name", f"Student {submission_id}"),
-            "file_path": submission.get("file_path", ""),
-            "graded_content": submission.get("graded_content"),
-        })
-    
-    return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content={"submissions": submission_list}
+def list_submissions(
+    request: Request,
+    assignment_id: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """List submissions, oldest first, optionally filtered by assignment and status.
+
+    `graded_content` is omitted unless requested with `fields` (comma-separated
+    column names). Follow `next_cursor` for the next page; send the returned
+    ETag as If-None-Match to get 304 for an unchanged page.
+    """
+    filters = []
+    if assignment_id is not None:
+        filters.append(Submission.assignment_id == assignment_id)
+    if status_filter is not None:
+        filters.append(Submission.status == status_filter)
+
+    # Background updates must be visible in both the ETag and the page
+    store.write_buffer.flush()
+    return paged_response(
+        request,
+        Submission,
+        "submissions",
+        filters=filters,
+        fields=fields,
+        allowed_fields=store.columns_of(Submission),
+        default_fields=SUBMISSION_LIST_FIELDS,
+        cursor=cursor,
+        limit=limit,
     )
 
 @router.get("/{submission_id}", status_code=status.HTTP_200_OK)
 def get_submission(submission_id: str):
-    submission = submissions.get(submission_id)
+    submission = store.get_submission(submission_id)
     if not submission:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"message": "Submission not found"}
         )
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_200_OK,
         content=submission
     )
 
 
+@router.get("/{submission_id}/events")
+async def submission_events(submission_id: str, request: Request):
+    """Server-Sent Events stream of a submission's grading progress.
+
+    Starts with a `snapshot` of the current stage, then pushes `stage` events
+    (uploaded -> extracting -> grading -> done | failed) and `problem` events
+    with each problem's grades as they finish. Ends after done or failed.
+    """
+    if store.get_submission(submission_id) is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Submission not found"}
+        )
+
+    async def stream():
+        async with bus.subscribe(submission_topic(submission_id)) as queue:
+            # Read the state only after subscribing so no transition is missed
+            submission = store.get_submission(submission_id)
+            snapshot = {
+                "type": "snapshot",
+                "submission_id": submission_id,
+                "assignment_id": submission["assignment_id"],
+                "stage": STAGE_FOR_STATUS.get(submission["status"], submission["status"]),
+                "error": submission.get("error"),
+            }
+            async for frame in sse_stream(request, queue, snapshot=snapshot, until_terminal=True):
+                yield frame
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/{submission_id}/pages")
+async def list_pages(submission_id: str):
+    """Size in PDF points and image URLs of each page of a submission.
+
+    The grading view shows these images rather than the PDF. The URLs carry
+    the PDF's `version`, which makes them cacheable forever.
+    """
+    submission = store.get_submission(submission_id)
+    if not submission:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Submission not found"}
+        )
+    pages = await asyncio.to_thread(page_images.page_set, submission["file_path"], sha256=submission.get("sha256"))
+    if pages is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Page images are not available for this submission"}
+        )
+
+    return ORJSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "submission_id": submission_id,
+            "version": pages.version,
+            "pages": [
+                {
+                    "page": page,
+                    "width": width,
+                    "height": height,
+                    **{
+                        size: f"/submissions/{submission_id}/pages/{page}?size={size}&v={pages.version}"
+                        for size in page_images.SIZES
+                    },
+                }
+                for page, (width, height) in enumerate(pages.page_sizes, start=1)
+            ],
+        },
+    )
+
+
+@router.get("/{submission_id}/pages/{page}")
+async def get_page_image(
+    submission_id: str,
+    page: int,
+    request: Request,
+    size: Literal["thumb", "preview"] = "preview",
+    v: Optional[str] = None,
+):
+    """One page (1-based) of a submission as a WebP image.
+
+    Pages are rendered after upload; one that is not ready yet is rendered
+    now. With the current `v` (from the pages list) the response may be
+    cached forever; without it, clients must revalidate with If-None-Match.
+    Range requests are supported.
+    """
+    submission = store.get_submission(submission_id)
+    if not submission:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Submission not found"}
+        )
+    pages = await asyncio.to_thread(page_images.page_set, submission["file_path"], sha256=submission.get("sha256"))
+    if pages is None or not 1 <= page <= len(pages.page_sizes):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Page not found"}
+        )
+
+    etag = compute_etag(pages.sha256, size, page_images.SIZES[size], page_images.WEBP_QUALITY, page)
+    # A URL without the version may point at a different file after the PDF is replaced
+    cache_control = page_images.PAGE_CACHE_CONTROL if v == pages.version else LIST_CACHE_CONTROL
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    path = await asyncio.to_thread(page_images.render_page, submission["file_path"], pages, page, size)
+    return FileResponse(path, media_type="image/webp", headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+@router.post("/{submission_id}/grade", status_code=status.HTTP_202_ACCEPTED)
+def regrade_submission(submission_id: str):
+    """Re-run extraction and grading with fresh model calls (bypasses the response cache)."""
+    submission = store.update_submission(submission_id, graded_content=None, status="pending")
+    if not submission:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": "Submission not found"}
+        )
+
+    # Instructor re-grades jump ahead of queued batch work
+    jobs.enqueue("grade_submission", {"submission_id": submission_id, "bypass_cache": True}, lane="regrade")
+    publish_submission_event(submission_id, submission["assignment_id"], type="stage", stage="uploaded")
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"submission_id": submission_id, "message": "Re-grading in progress."}
+    )
+
+
 @router.put("/{submission_id}", status_code=status.HTTP_200_OK)
 def update_submission(submission_id: str, payload: Dict[str, Any]):
     """Update a submission's fields (e.g., graded_content).
@@ -131,19 +503,19 @@ def update_submission(submission_id: str, payload: Dict[str, Any]):
     Expects a JSON body containing fields to update. For now we allow
     updating `graded_content` and `student_name` and `file_path` if provided.
     """
-    submission = submissions.get(submission_id)
+    # Only update allowed fields to avoid unexpected changes
+    allowed_fields = {"graded_content", "student_name", "file_path"}
+    updates = {key: value for key, value in payload.items() if key in allowed_fields}
+    if "file_path" in updates:
+        # The recorded digest belongs to the old file
+        updates.update(sha256=None, size_bytes=None)
+    submission = store.update_submission(submission_id, **updates)
     if not submission:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content={"message": "Submission not found"}
         )
-
-    # Only update allowed fields to avoid unexpected changes
-    allowed_fields = {"graded_content", "student_name", "file_path"}
-    for key, value in payload.items():
-        if key in allowed_fields:
-            submission[key] = value
-
-    submissions[submission_id] = submission
+    if "file_path" in updates:
+        jobs.enqueue("render_pages", {"submission_id": submission_id})
 
     return JSONResponse(status_code=status.HTTP_200_OK, content=submission)
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy import select as select_columns
+from sqlmodel import SQLModel, select
+
+from .db import get_session
+from .models import Assignment, Submission, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Background-task writes are buffered and flushed together in one transaction.
+FLUSH_INTERVAL_S = float(os.getenv("GRADER_WRITE_FLUSH_INTERVAL_S", "0.25"))
+FLUSH_MAX_PENDING = int(os.getenv("GRADER_WRITE_FLUSH_MAX_PENDING", "64"))
+
+
+def _to_dict(row: Any) -> Dict[str, Any]:
+    record = row.model_dump() if isinstance(row, SQLModel) else dict(row._mapping)
+    for key, value in record.items():
+        if isinstance(value, datetime):
+            # SQLite drops the offset; timestamps are always stored in UTC
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            record[key] = value.isoformat()
+    return record
+
+
+def new_id(model: Type[SQLModel]) -> str:
+    """Return a random id that is not already used by `model`."""
+    with get_session() as session:
+        while True:
+            candidate = str(random.randint(1, 999999))
+            if session.get(model, candidate) is None:
+                return candidate
+
+
+def columns_of(model: Type[SQLModel]) -> Tuple[str, ...]:
+    return tuple(model.__table__.columns.keys())
+
+
+def page_keys(
+    model: Type[SQLModel],
+    filters: Sequence[Any] = (),
+    after: Optional[Tuple[datetime, str]] = None,
+    limit: int = 100,
+) -> List[Tuple[str, datetime, datetime]]:
+    """(id, created_at, updated_at) of up to `limit` + 1 rows after the keyset cursor `after`.
+
+    Only the narrow key columns are read so callers can compute an ETag before
+    loading (and decompressing) the heavy ones.
+    """
+    statement = select(model.id, model.created_at, model.updated_at).where(*filters)
+    if after is not None:
+        created_at, row_id = after
+        statement = statement.where(
+            or_(model.created_at > created_at, and_(model.created_at == created_at, model.id > row_id))
+        )
+    statement = statement.order_by(model.created_at, model.id).limit(limit + 1)
+    with get_session() as session:
+        return [tuple(row) for row in session.exec(statement)]
+
+
+def load_rows(
+    model: Type[SQLModel],
+    ids: Sequence[str],
+    fields: Sequence[str],
+    computed: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Rows of `model` with the given ids, in the same order, projected to `fields`.
+
+    `computed` maps extra output names to SQL expressions (e.g. flags that
+    avoid loading a compressed column just to test it for NULL).
+    """
+    if not ids:
+        return []
+    columns = [getattr(model, name) for name in fields if name not in (computed or {})]
+    columns += [expression.label(name) for name, expression in (computed or {}).items() if name in fields]
+    statement = select_columns(*columns).where(model.id.in_(ids))
+    with get_session() as session:
+        by_id = {record["id"]: record for record in map(_to_dict, session.exec(statement))}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+# Assignments
+
+def create_assignment(**fields: Any) -> Dict[str, Any]:
+    with get_session() as session:
+        row = Assignment(**fields)
+        session.add(row)
+        session.commit()
+        return _to_dict(row)
+
+
+def get_assignment(assignment_id: str) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        row = session.get(Assignment, assignment_id)
+        return _to_dict(row) if row else None
+
+
+def update_assignment(assignment_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        row = session.get(Assignment, assignment_id)
+        if row is None:
+            return None
+        for key, value in fields.items():
+            setattr(row, key, value)
+        row.updated_at = utcnow()
+        session.add(row)
+        session.commit()
+        return _to_dict(row)
+
+
+# Submissions
+
+class SubmissionWriteBuffer:
+    """Write-behind buffer for submission updates made by background tasks.
+
+    Updates are merged per submission and flushed in a single transaction every
+    FLUSH_INTERVAL_S, or as soon as FLUSH_MAX_PENDING submissions are dirty.
+    Flushes run on the `run` task's worker thread, so `put` never blocks the
+    caller on the database. Reads in this process overlay pending updates so
+    they never look stale.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Set while `run` is active; `put` wakes it early once the buffer is full
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._full: Optional[asyncio.Event] = None
+
+    def put(self, submission_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.setdefault(submission_id, {}).update(fields)
+            full = len(self._pending) >= FLUSH_MAX_PENDING
+        if full:
+            self._wake()
+
+    def _wake(self) -> None:
+        loop, event = self._loop, self._full
+        if loop is None or event is None:
+            # No flusher in this process (scripts): flush in the caller
+            self.flush()
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:  # the flusher's loop has just closed
+            self.flush()
+
+    def overlay(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending.get(record["id"])
+            if pending:
+                record = {**record, **pending}
+        return record
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            now = utcnow()
+            try:
+                with get_session() as session:
+                    for submission_id, fields in pending.items():
+                        session.exec(
+                            update(Submission)
+                            .where(Submission.id == submission_id)
+                            .values(**fields, updated_at=now)
+                        )
+                    session.commit()
+            except BaseException:
+                # Keep the updates for the next flush; fields queued since win
+                with self._lock:
+                    for submission_id, fields in pending.items():
+                        self._pending[submission_id] = {**fields, **self._pending.get(submission_id, {})}
+                raise
+
+    async def run(self) -> None:
+        """Periodic flusher; run as a task for the lifetime of the process."""
+        self._loop, self._full = asyncio.get_running_loop(), asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._full.wait(), FLUSH_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                self._full.clear()
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception:
+                    # The updates stay pending; the next tick tries again
+                    logger.warning("Could not flush submission updates", exc_info=True)
+        finally:
+            self._loop = self._full = None
+            self.flush()
+
+
+write_buffer = SubmissionWriteBuffer()
+
+
+def create_submissions(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert several submissions in one transaction."""
+    with get_session() as session:
+        rows = [Submission(**fields) for fields in records]
+        session.add_all(rows)
+        session.commit()
+        return [_to_dict(row) for row in rows]
+
+
+def create_submission(**fields: Any) -> Dict[str, Any]:
+    return create_submissions([fields])[0]
+
+
+def get_submission(submission_id: str) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        row = session.get(Submission, submission_id)
+        return write_buffer.overlay(_to_dict(row)) if row else None
+
+
+def update_submission(submission_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+    """Apply an update immediately (API requests); see `queue_submission_update` for background work."""
+    write_buffer.flush()
+    with get_session() as session:
+        row = session.get(Submission, submission_id)
+        if row is None:
+            return None
+        for key, value in fields.items():
+            setattr(row, key, value)
+        row.updated_at = utcnow()
+        session.add(row)
+        session.commit()
+        return _to_dict(row)
+
+
+def queue_submission_update(submission_id: str, **fields: Any) -> None:
+    """Buffer an update from a background task; it is flushed in the next batch."""
+    write_buffer.put(submission_id, fields)
+
+
+def list_submissions(
+    assignment_id: Optional[str] = None,
+    status: Optional[str] = None,
+    batch_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    statement = select(Submission)
+    if assignment_id is not None:
+        statement = statement.where(Submission.assignment_id == assignment_id)
+    if status is not None:
+        statement = statement.where(Submission.status == status)
+    if batch_id is not None:
+        statement = statement.where(Submission.batch_id == batch_id)
+    with get_session() as session:
+        rows = session.exec(statement.order_by(Submission.created_at, Submission.id))
+        return [write_buffer.overlay(_to_dict(row)) for row in rows]
+
+
+def count_submissions_by_status(batch_id: str) -> Dict[str, int]:
+    write_buffer.flush()
+    statement = (
+        select(Submission.status, func.count())
+        .where(Submission.batch_id == batch_id)
+        .group_by(Submission.status)
+    )
+    with get_session() as session:
+        return {status: count for status, count in session.exec(statement)}
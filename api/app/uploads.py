@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+import anyio
+from fastapi import UploadFile, status
+from fastapi.responses import JSONResponse
+
+from app import store
+from app.models import Submission
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("GRADER_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+UPLOAD_CHUNK = 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+# Readers accept the header anywhere in the first KiB of the file
+_MAGIC_WINDOW = 1024
+
+
+class UploadRejected(Exception):
+    """Upload refused before it was fully stored; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def sanitize_filename(filename: str) -> str:
+    """Sanitize filename to be safe for filesystem and API usage."""
+    # Remove or replace problematic characters
+    sanitized = re.sub(r'[<>:"/\\|?*]', '-', filename)
+    # Remove multiple consecutive dashes
+    sanitized = re.sub(r'-+', '-', sanitized)
+    # Remove leading and trailing dashes
+    sanitized = sanitized.strip('-')
+    # Ensure it's not empty
+    if not sanitized:
+        sanitized = "file"
+    return sanitized
+
+
+def new_submission_id() -> str:
+    """Return a random submission id that is not already in use."""
+    return store.new_id(Submission)
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    path: Path
+    sha256: str
+    size: int
+
+
+class _PdfSink:
+    """Hashes, counts and validates chunks as they are written."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._checked = False
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise too_large(self.max_bytes)
+        if not self._checked:
+            self._head += chunk[:_MAGIC_WINDOW]
+            if len(self._head) >= _MAGIC_WINDOW:
+                self._check_magic()
+        self._digest.update(chunk)
+
+    def finish(self) -> None:
+        if not self._checked:
+            self._check_magic()
+
+    def _check_magic(self) -> None:
+        self._checked = True
+        if PDF_MAGIC not in self._head[:_MAGIC_WINDOW]:
+            raise UploadRejected(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "File is not a PDF")
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def too_large(max_bytes: int) -> UploadRejected:
+    return UploadRejected(
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit",
+    )
+
+
+async def save_upload(upload: UploadFile, destination: Path, *, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """Stream an upload to `destination` in chunks, hashing and validating it on the way.
+
+    Raises UploadRejected (413 oversized, 415 not a PDF) and removes the partial file.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large(max_bytes)
+    sink = _PdfSink(max_bytes)
+    try:
+        async with await anyio.open_file(destination, "wb") as out:
+            while chunk := await upload.read(UPLOAD_CHUNK):
+                sink.feed(chunk)
+                await out.write(chunk)
+        sink.finish()
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return StoredFile(destination, sink.hexdigest(), sink.size)
+
+
+def save_stream(source: BinaryIO, destination: Path, *, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """Blocking variant of `save_upload` for file objects such as ZIP members."""
+    sink = _PdfSink(max_bytes)
+    try:
+        with destination.open("wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK):
+                sink.feed(chunk)
+                out.write(chunk)
+        sink.finish()
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return StoredFile(destination, sink.hexdigest(), sink.size)
+
+
+def rejection_response(exc: UploadRejected) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"message": exc.message})
@@ -0,0 +1,320 @@
+"""Grading job worker.
+
+Run standalone with `python -m app.worker` (from the api/ directory); start as
+many as needed, on any machine that shares the database and uploads directory.
+The API also runs one embedded worker unless GRADER_EMBEDDED_WORKER=0.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from prometheus_client import start_http_server
+
+from . import jobs, metrics, page_images, store
+from .agents.pdf_optimize import optimize_pdf
+from .db import init_db
+from .events import publish_submission_event, run_relay
+from .models import Job
+from .routers.assignments import DEFAULT_GRADING_MODE, process_rubric
+from .routers.submissions import process_submission, regrade_problems
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("GRADER_WORKER_CONCURRENCY", "8"))
+LEASE_S = float(os.getenv("GRADER_JOB_LEASE_S", "120"))
+POLL_INTERVAL_S = float(os.getenv("GRADER_JOB_POLL_INTERVAL_S", "1"))
+# Submissions wait this long between checks for their assignment's rubric
+RUBRIC_WAIT_S = 5.0
+
+
+class NotReady(Exception):
+    """Job inputs are not available yet; retry later without counting an attempt."""
+
+
+class RubricFailed(Exception):
+    """The assignment's rubric could not be preprocessed; fail the job without retrying."""
+
+
+def _fail_submission(submission_id: str, error: str, *, keep_grades: bool = False) -> None:
+    """Mark a submission failed (or graded again, if `keep_grades` and it has grades) and publish it."""
+    submission = store.get_submission(submission_id)
+    if submission is None:
+        return
+    kept = keep_grades and submission.get("graded_content") is not None
+    submission = store.update_submission(submission_id, status="graded" if kept else "failed", error=error)
+    if submission is not None:
+        publish_submission_event(submission_id, submission["assignment_id"], type="stage", stage="failed", error=error)
+
+
+def _require_rubric(assignment: Dict[str, Any], submission_id: str) -> None:
+    """Raise NotReady while the rubric is being preprocessed, RubricFailed once that failed for good."""
+    if assignment.get("rubric") is not None:
+        return
+    if assignment.get("error"):
+        error = f"Rubric preprocessing failed: {assignment['error']}"
+        _fail_submission(submission_id, error)
+        raise RubricFailed(error)
+    raise NotReady("Rubric is still being processed")
+
+
+async def grade_submission_job(job: Job) -> None:
+    payload = job.payload
+    submission = store.get_submission(payload["submission_id"])
+    if submission is None:
+        return
+    assignment = store.get_assignment(submission["assignment_id"]) or {}
+    _require_rubric(assignment, submission["id"])
+
+    with metrics.for_assignment(submission["assignment_id"]):
+        await process_submission(
+            submission_id=submission["id"],
+            submission_path=Path(submission["file_path"]),
+            rubric=assignment["rubric"],
+            problem_structure=assignment.get("problem_structure") or {},
+            bypass_cache=payload.get("bypass_cache", False),
+            grading_mode=assignment.get("grading_mode", DEFAULT_GRADING_MODE),
+            pdf_sha256=submission.get("sha256"),
+            assignment_id=submission["assignment_id"],
+            final_attempt=job.attempts >= job.max_attempts,
+        )
+
+
+async def regrade_problems_job(job: Job) -> None:
+    """Re-grade the payload's `problems` of a graded submission from its stored extraction.
+
+    Submissions without a stored extraction (or jobs without `problems`) get a
+    full re-grade instead.
+    """
+    payload = job.payload
+    submission = store.get_submission(payload["submission_id"])
+    if submission is None:
+        return
+    assignment = store.get_assignment(submission["assignment_id"]) or {}
+    _require_rubric(assignment, submission["id"])
+
+    common = dict(
+        submission_id=submission["id"],
+        submission_path=Path(submission["file_path"]),
+        problem_structure=assignment.get("problem_structure") or {},
+        grading_mode=assignment.get("grading_mode", DEFAULT_GRADING_MODE),
+        pdf_sha256=submission.get("sha256"),
+        assignment_id=submission["assignment_id"],
+        final_attempt=job.attempts >= job.max_attempts,
+    )
+    partial = (
+        payload.get("problems") is not None
+        and submission.get("extraction") is not None
+        and submission.get("rubric_digests") is not None
+        and isinstance(assignment["rubric"], list)
+    )
+    with metrics.for_assignment(submission["assignment_id"]):
+        if not partial:
+            await process_submission(rubric=assignment["rubric"], bypass_cache=True, **common)
+            return
+        await regrade_problems(
+            rubric=assignment["rubric"],
+            extraction=submission["extraction"],
+            graded_content=submission.get("graded_content"),
+            rubric_digests=submission["rubric_digests"],
+            problem_ids=payload["problems"],
+            previous_status=payload.get("previous_status", "graded"),
+            **common,
+        )
+
+
+async def preprocess_rubric_job(job: Job) -> None:
+    assignment = store.get_assignment(job.payload["assignment_id"])
+    if assignment is None:
+        return
+    with metrics.for_assignment(assignment["id"]):
+        await process_rubric(
+            file_id=assignment["id"],
+            file_path=Path(assignment["file_path"]),
+            pdf_sha256=assignment.get("sha256"),
+            final_attempt=job.attempts >= job.max_attempts,
+        )
+
+
+async def prefetch_uploads_job(job: Job) -> None:
+    """Upload a batch's PDFs to Gemini together so its grading jobs find them ready.
+
+    Scans are optimized first (see `pdf_optimize`), since grading attaches the
+    optimized copy; the copy is written once and reused by the grading job.
+    """
+    from .agents import llm_grading
+
+    submissions = [store.get_submission(submission_id) for submission_id in job.payload["submission_ids"]]
+    submissions = [submission for submission in submissions if submission is not None]
+    if not submissions:
+        return
+    with metrics.for_assignment(submissions[0]["assignment_id"]):
+        optimized = await asyncio.gather(
+            *(
+                asyncio.to_thread(optimize_pdf, submission["file_path"], sha256=submission.get("sha256"))
+                for submission in submissions
+            )
+        )
+        sources = [
+            (copy.path, copy.sha256) if copy is not None else (submission["file_path"], submission.get("sha256"))
+            for submission, copy in zip(submissions, optimized)
+        ]
+        await llm_grading.aupload_files([path for path, _ in sources], sha256s=[digest for _, digest in sources])
+
+
+async def render_pages_job(job: Job) -> None:
+    """Render a submission's page images for the grading view (see `page_images`)."""
+    submission = store.get_submission(job.payload["submission_id"])
+    if submission is None:
+        return
+    await asyncio.to_thread(page_images.render_pages, submission["file_path"], sha256=submission.get("sha256"))
+
+
+HANDLERS: Dict[str, Callable[[Job], Awaitable[None]]] = {
+    "grade_submission": grade_submission_job,
+    "regrade_problems": regrade_problems_job,
+    "preprocess_rubric": preprocess_rubric_job,
+    "prefetch_uploads": prefetch_uploads_job,
+    "render_pages": render_pages_job,
+}
+
+
+def _record_dead_job(job: Job) -> None:
+    """Mark the record of a job that died with its worker on the last attempt."""
+    error = f"Worker lost while processing (after {job.attempts} attempts)"
+    if job.kind in ("grade_submission", "regrade_problems"):
+        # A failed partial re-grade keeps the previous grades
+        _fail_submission(job.payload["submission_id"], error, keep_grades=job.kind == "regrade_problems")
+    elif job.kind == "preprocess_rubric":
+        store.update_assignment(job.payload["assignment_id"], error=error)
+
+
+class Worker:
+    """Claims jobs from the queue and runs up to `concurrency` of them at a time.
+
+    Each running job's lease is renewed every third of LEASE_S; if the process
+    dies, another worker picks the job up once the lease runs out.
+    """
+
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY, worker_id: Optional[str] = None):
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        jobs.add_enqueue_listener(self._notify)
+        try:
+            while True:
+                await asyncio.to_thread(self._reap)
+                while len(self._running) < self.concurrency:
+                    job = await asyncio.to_thread(jobs.claim, self.worker_id, LEASE_S, HANDLERS)
+                    if job is None:
+                        break
+                    task = asyncio.create_task(self._execute(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._done)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            jobs.remove_enqueue_listener(self._notify)
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        # A slot is free; look for the next job right away
+        self._wake.set()
+
+    def _reap(self) -> None:
+        for job in jobs.reap_expired():
+            _record_dead_job(job)
+
+    async def _heartbeat(self, job: Job, handler: asyncio.Task) -> None:
+        """Renew the job's lease while `handler` runs; cancel the handler once the lease is lost."""
+        while True:
+            await asyncio.sleep(LEASE_S / 3)
+            if not await asyncio.to_thread(jobs.heartbeat, job, LEASE_S):
+                logger.warning("Lost the lease on job %s; stopping it", job.id)
+                handler.cancel()
+                return
+
+    async def _execute(self, job: Job) -> None:
+        handler = asyncio.create_task(HANDLERS[job.kind](job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, handler))
+        metrics.JOBS_RUNNING.labels(job.kind).inc()
+        started = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            await handler
+            # The submission's final state must be stored before the job is marked done
+            await asyncio.to_thread(store.write_buffer.flush)
+        except NotReady:
+            outcome = "deferred"
+            await asyncio.to_thread(jobs.defer, job, RUBRIC_WAIT_S)
+        except RubricFailed as exc:
+            outcome = "failed"
+            await asyncio.to_thread(store.write_buffer.flush)
+            await asyncio.to_thread(jobs.fail, job, str(exc), retry=False)
+            logger.warning("Job %s (%s) failed: %s", job.id, job.kind, exc)
+        except asyncio.CancelledError:
+            if not heartbeat.done() or asyncio.current_task().cancelling():
+                # Shutting down; leave the lease to expire so another worker retries it
+                raise
+            # Another worker may own the job now; its state is theirs to record
+            outcome = "lease_lost"
+        except Exception as exc:
+            try:
+                await asyncio.to_thread(store.write_buffer.flush)
+            except Exception:
+                # The updates stay buffered for the next flush; the job still records its failure
+                logger.warning("Could not store the updates of job %s", job.id, exc_info=True)
+            delay = await asyncio.to_thread(jobs.fail, job, str(exc))
+            if delay is None:
+                outcome = "failed"
+                logger.exception("Job %s (%s) failed for good", job.id, job.kind)
+            else:
+                outcome = "retry"
+                logger.warning("Job %s (%s) failed, retrying in %.1fs: %s", job.id, job.kind, delay, exc)
+        else:
+            outcome = "done"
+            await asyncio.to_thread(jobs.complete, job)
+        finally:
+            heartbeat.cancel()
+            handler.cancel()
+            metrics.JOBS_RUNNING.labels(job.kind).dec()
+            metrics.JOB_SECONDS.labels(job.kind, outcome).observe(time.perf_counter() - started)
+
+
+async def main() -> None:
+    init_db()
+    if metrics.WORKER_METRICS_PORT:
+        metrics.register_state_collector()
+        start_http_server(metrics.WORKER_METRICS_PORT)
+    background = [asyncio.create_task(store.write_buffer.run()), asyncio.create_task(run_relay())]
+    try:
+        await Worker().run()
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,65 @@
+"""Benchmark: grading with and without context-cached prompt prefixes.
+
+Grades submissions of one assignment against the stub model (see
+`benchmarks.stub_model`) with context caching off and on, after warming the
+caches the way `process_rubric` does. Reports per-submission input tokens the
+model had to process (cached tokens excluded), tokens served from the cache
+and mean latency; cached tokens skip the stub's prefill time. Answers are kept
+short and decode fast, since caching only changes the input side.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_context_cache [submissions] [problems]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from benchmarks.stub_model import StubModel, install, make_submission_pdfs, sample_rubric
+
+
+async def _run(mode: str, model: StubModel, rubric, structure, paths):
+    from app.agents import llm_grading
+
+    caches = await llm_grading.awarm_context_caches(rubric, structure, mode)
+    model.stats.reset()
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        if mode == "single_pass":
+            await llm_grading.agrade_submission_single_pass(rubric, structure, path)
+        else:
+            student_md = await llm_grading.aextract_submission(path, structure)
+            await llm_grading.agrade_submission(rubric, student_md, path)
+        latencies.append(time.perf_counter() - start)
+    return caches, latencies, model.stats
+
+
+def main(submissions: int = 5, problems: int = 10) -> None:
+    rubric = sample_rubric(problems)
+    model = StubModel(rubric=rubric, decode_s_per_token=0.0005, answer_chars_per_problem=200)
+    scratch = install(model)
+
+    from app.agents import context_cache, llm_grading
+
+    structure = llm_grading.rubric_to_problem_structure(rubric)
+    paths = make_submission_pdfs(scratch, submissions)
+
+    print(
+        f"{'mode':<12} {'cache':<5} {'caches':>6} {'mean latency':>13}"
+        f" {'processed tok/sub':>18} {'cached tok/sub':>15}"
+    )
+    for mode in ("two_stage", "single_pass"):
+        for enabled in (False, True):
+            context_cache.ENABLED = enabled
+            caches, latencies, stats = asyncio.run(_run(mode, model, rubric, structure, paths))
+            processed = (stats.input_tokens - stats.cached_tokens) / submissions
+            print(
+                f"{mode:<12} {'on' if enabled else 'off':<5} {caches:>6} {statistics.mean(latencies):>12.2f}s"
+                f" {processed:>18.0f} {stats.cached_tokens / submissions:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
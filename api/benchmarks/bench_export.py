@@ -0,0 +1,81 @@
+"""Benchmark: streaming gradebook export vs building it from the full submission list.
+
+Seeds a scratch SQLite database with graded submissions, then for growing
+class sizes compares the streamed CSV export (`app.export`) with loading every
+submission at once (as a client of `GET /submissions/` would) and flattening
+it in memory. Reports rows per second and peak Python heap (tracemalloc).
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_export [largest_class] [problems]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.stub_model import StubModel, sample_rubric
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def main(largest: int = 20000, problems: int = 5) -> None:
+    scratch = tempfile.mkdtemp(prefix="grader-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'grader.db')}"
+
+    from app import store
+    from app.db import init_db
+    from app.export import export_columns, flatten_grades, iter_export_rows, stream_csv
+
+    init_db()
+    rubric = sample_rubric(problems)
+    graded = StubModel(rubric=rubric)._grades(rubric)
+    sizes = [size for size in (largest // 10, largest) if size]
+
+    def streamed(assignment_id):
+        def run():
+            total = 0
+            for chunk in stream_csv(export_columns(rubric), iter_export_rows(assignment_id, rubric)):
+                total += len(chunk)
+            return total
+        return run
+
+    def in_memory(assignment_id):
+        def run():
+            submissions = store.list_submissions(assignment_id=assignment_id)
+            rows = [flatten_grades(submission, rubric) for submission in submissions]
+            return len(rows)
+        return run
+
+    print(f"{'submissions':>11} {'export':<10} {'rows/s':>9} {'peak heap':>10}")
+    for size in sizes:
+        assignment_id = f"bench-{size}"
+        store.create_assignment(id=assignment_id, name="bench", file_path="", rubric=rubric)
+        for offset in range(0, size, 1000):
+            store.create_submissions(
+                {
+                    "id": f"{assignment_id}-{i}",
+                    "assignment_id": assignment_id,
+                    "student_name": f"Student {i}",
+                    "file_path": "",
+                    "status": "graded",
+                    "graded_content": graded,
+                }
+                for i in range(offset, min(offset + 1000, size))
+            )
+        for label, fn in (("streamed", streamed(assignment_id)), ("in-memory", in_memory(assignment_id))):
+            _, elapsed, peak = _measure(fn)
+            print(f"{size:>11} {label:<10} {size / elapsed:>9.0f} {peak / 2**20:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,108 @@
+"""Benchmark: re-grading a class after one rubric problem is edited.
+
+Grades text-layer submissions against the stub model through the real
+pipeline (`process_submission`, on a scratch SQLite database), changes one
+problem of the rubric and re-grades the class twice: with `regrade_problems`,
+which reuses each stored extraction and grades only the changed problem, and
+with a full re-grade (extraction and every problem again). Reports model
+calls, input tokens and wall time per submission for each grading mode.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_incremental_regrade [submissions] [problems]
+"""
+import asyncio
+import copy
+import os
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.stub_model import StubModel, install, make_text_pdf, sample_rubric
+
+
+def _pages(index: int, problems: int):
+    pages = [f"Name: Student {index}"]
+    for p in range(1, problems + 1):
+        pages.append(f"Problem {p}\n" + "\n".join(f"step {line}: a_{line} = {index + line * p}" for line in range(25)))
+    return pages
+
+
+async def _run(mode: str, model: StubModel, scratch: str, submissions: int, problems: int):
+    from app import store
+    from app.agents.llm_grading import rubric_to_problem_structure
+    from app.agents.rubric_diff import stale_problems
+    from app.routers.submissions import process_submission, regrade_problems
+
+    rubric = sample_rubric(problems)
+    structure = rubric_to_problem_structure(rubric)
+    assignment = store.create_assignment(
+        id=f"bench-{mode}", name=mode, file_path="", grading_mode=mode, rubric=rubric, problem_structure=structure
+    )
+    records = []
+    for i in range(submissions):
+        path = make_text_pdf(os.path.join(scratch, f"{mode}-{i}.pdf"), _pages(i, problems))
+        records.append(store.create_submission(
+            id=f"{mode}-{i}", assignment_id=assignment["id"], student_name=f"Student {i}", file_path=path
+        ))
+
+    async def grade_all(rubric, **kwargs):
+        await asyncio.gather(*(
+            process_submission(
+                r["id"], Path(r["file_path"]), rubric, rubric_to_problem_structure(rubric), grading_mode=mode, **kwargs
+            )
+            for r in records
+        ))
+        store.write_buffer.flush()
+
+    await grade_all(rubric)
+
+    edited = copy.deepcopy(rubric)
+    edited[1]["items"][0]["points"] = 3
+    edited[1]["total"] += 1
+    edited_structure = rubric_to_problem_structure(edited)
+
+    results = {}
+    model.stats.reset()
+    started = time.perf_counter()
+    graded = [store.get_submission(r["id"]) for r in records]
+    await asyncio.gather(*(
+        regrade_problems(
+            s["id"], Path(s["file_path"]), edited, edited_structure, s["extraction"], s["graded_content"],
+            s["rubric_digests"], stale_problems(s["rubric_digests"], edited), grading_mode=mode,
+        )
+        for s in graded
+    ))
+    store.write_buffer.flush()
+    results["changed problems"] = (time.perf_counter() - started, copy.copy(model.stats))
+    regraded = store.get_submission(records[0]["id"])
+    assert len(regraded["graded_content"]) == problems, "partial re-grade lost problems"
+    assert stale_problems(regraded["rubric_digests"], edited) == []
+
+    model.stats.reset()
+    started = time.perf_counter()
+    await grade_all(edited, bypass_cache=True)
+    results["full"] = (time.perf_counter() - started, copy.copy(model.stats))
+    return results
+
+
+def main(submissions: int = 5, problems: int = 5) -> None:
+    model = StubModel(rubric=sample_rubric(problems), decode_s_per_token=0.001)
+    scratch = install(model)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'grader.db')}"
+    os.environ["GRADER_SEGMENT_DIR"] = os.path.join(scratch, "segments")
+
+    from app.db import init_db
+
+    init_db()
+    print(f"{'mode':<12} {'re-grade':<17} {'wall time':>10} {'calls/sub':>10} {'input tok/sub':>14}")
+    for mode in ("two_stage", "per_problem"):
+        for label, (elapsed, stats) in asyncio.run(_run(mode, model, scratch, submissions, problems)).items():
+            print(
+                f"{mode:<12} {label:<17} {elapsed:>9.2f}s {stats.calls / submissions:>10.1f}"
+                f" {stats.input_tokens / submissions:>14.0f}"
+            )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,60 @@
+"""Micro-benchmark: per-call setup overhead of the Gemini client/model objects.
+
+Compares what every pipeline stage used to do (fresh `genai.Client()`, fresh
+`ChatGoogleGenerativeAI` objects, re-importing prompts) with the pooled
+registry in `app.agents.clients`. No network calls are made; connection reuse
+(TLS handshakes avoided by the shared channels) comes on top of these numbers.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_model_registry [iterations]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder-key")
+
+from google import genai  # noqa: E402
+from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: E402
+
+from app.agents import clients, prompts  # noqa: E402
+
+
+def _prompt_dict():
+    """The prompt lookup the old code rebuilt on every call; prompts are module constants now."""
+    return {name: getattr(prompts, name) for name in dir(prompts) if name.endswith("_PROMPT")}
+
+
+def _per_stage_before():
+    """Objects the old code built on every extract/grade call."""
+    _prompt_dict()
+    genai.Client()
+    ChatGoogleGenerativeAI(model=clients.DEFAULT_MODEL, model_kwargs={"generation_config": clients.JSON_GENERATION_CONFIG})
+    ChatGoogleGenerativeAI(model=clients.DEFAULT_MODEL, model_kwargs={"generation_config": clients.TEXT_GENERATION_CONFIG})
+
+
+def _per_stage_after():
+    clients.get_client()
+    clients.get_llm(clients.DEFAULT_MODEL, clients.JSON_GENERATION_CONFIG)
+    clients.get_llm(clients.DEFAULT_MODEL, clients.TEXT_GENERATION_CONFIG)
+
+
+def _time(fn, iterations: int) -> float:
+    fn()  # warm-up (first construction, imports)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main(iterations: int = 200) -> None:
+    before = _time(_per_stage_before, iterations)
+    after = _time(_per_stage_after, iterations)
+    print(f"iterations:           {iterations}")
+    print(f"per-stage setup before: {before * 1e6:10.1f} us")
+    print(f"per-stage setup after:  {after * 1e6:10.1f} us")
+    print(f"speedup:                {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
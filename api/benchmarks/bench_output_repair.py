@@ -0,0 +1,117 @@
+"""Benchmark: malformed grading answers, re-asked per problem vs re-running the submission.
+
+Grades text-layer submissions through `process_submission` (on a scratch
+SQLite database) against the stub model, which corrupts `rate` of its JSON
+grading answers: fenced, truncated, mis-summed, a problem left out or an entry
+missing its items (see `benchmarks.stub_model`). Local repair handles fences,
+truncation and sums. The answers it cannot repair are either re-asked for just
+the failing problems (GRADER_REASK_ATTEMPTS, the default), or, with re-asks
+off, fail the submission. A failed submission is graded again from scratch
+with fresh model calls, as a retried job would be (up to three attempts).
+
+Reports model calls and input tokens per submission, answers the stub
+corrupted, problems re-asked and submissions that still failed.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_output_repair [submissions] [malformed_percent]
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.stub_model import StubModel, install, make_text_pdf, sample_rubric
+
+PROBLEMS = 5
+JOB_ATTEMPTS = 3
+
+
+def _pages(index: int):
+    pages = [f"Name: Student {index}"]
+    for p in range(1, PROBLEMS + 1):
+        pages.append(f"Problem {p}\n" + "\n".join(f"step {line}: a_{line} = {index + line * p}" for line in range(25)))
+    return pages
+
+
+def _counter_total(counter) -> float:
+    return sum(sample.value for metric in counter.collect() for sample in metric.samples if sample.name.endswith("_total"))
+
+
+async def _run(label: str, mode: str, reask: bool, model: StubModel, scratch: str, submissions: int):
+    from app import metrics, store
+    from app.agents import structured_output
+    from app.agents.problems import rubric_to_problem_structure
+    from app.routers.submissions import process_submission
+
+    rubric = sample_rubric(PROBLEMS)
+    structure = rubric_to_problem_structure(rubric)
+    assignment = store.create_assignment(
+        id=f"bench-{label}", name=label, file_path="", grading_mode=mode, rubric=rubric, problem_structure=structure
+    )
+    records = [
+        store.create_submission(
+            id=f"{label}-{i}",
+            assignment_id=assignment["id"],
+            student_name=f"Student {i}",
+            file_path=make_text_pdf(os.path.join(scratch, f"{label}-{i}.pdf"), _pages(i)),
+        )
+        for i in range(submissions)
+    ]
+
+    async def grade(record) -> bool:
+        # A failure is retried as a whole, like the job queue does
+        for _ in range(JOB_ATTEMPTS):
+            try:
+                await process_submission(
+                    record["id"], Path(record["file_path"]), rubric, structure, grading_mode=mode, bypass_cache=True
+                )
+                return True
+            except Exception:
+                continue
+        return False
+
+    structured_output.REASK_ATTEMPTS = 2 if reask else 0
+    model.stats.reset()
+    reasked = _counter_total(metrics.REASKED_PROBLEMS)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(grade(record) for record in records))
+    store.write_buffer.flush()
+    return {
+        "elapsed": time.perf_counter() - started,
+        "stats": model.stats,
+        "reasked": _counter_total(metrics.REASKED_PROBLEMS) - reasked,
+        "failed": results.count(False),
+    }
+
+
+def main(submissions: int = 20, malformed_percent: int = 20) -> None:
+    model = StubModel(
+        rubric=sample_rubric(PROBLEMS), malformed_rate=malformed_percent / 100, decode_s_per_token=0.0005
+    )
+    scratch = install(model)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'grader.db')}"
+    os.environ["GRADER_SEGMENT_DIR"] = os.path.join(scratch, "segments")
+
+    from app.db import init_db
+
+    init_db()
+    print(f"{malformed_percent}% of grading answers malformed, {submissions} submissions of {PROBLEMS} problems")
+    print(
+        f"{'mode':<12} {'on failure':<18} {'wall time':>10} {'calls/sub':>10} {'input tok/sub':>14}"
+        f" {'malformed':>10} {'re-asked':>9} {'failed':>7}"
+    )
+    for mode in ("two_stage", "single_pass"):
+        for reask, label in ((False, "re-run submission"), (True, "re-ask problems")):
+            result = asyncio.run(_run(f"{mode}-{int(reask)}", mode, reask, model, scratch, submissions))
+            stats = result["stats"]
+            print(
+                f"{mode:<12} {label:<18} {result['elapsed']:>9.2f}s {stats.calls / submissions:>10.2f}"
+                f" {stats.input_tokens / submissions:>14.0f} {stats.malformed:>10} {result['reasked']:>9.0f}"
+                f" {result['failed']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,62 @@
+"""Benchmark: page images for the grading view vs downloading the whole PDF.
+
+Writes phone-scan-like PDFs (full-resolution JPEG pages) and runs the
+rendering stage (`app.page_images`) on each. Reports the PDF size, the time
+the post-upload stage takes, the time to render one page on request when the
+stage has not run yet, and the bytes a reviewer downloads, with the time at a
+given bandwidth. That is the whole PDF before, and now every thumbnail plus
+one preview.
+
+Usage (from the api/ directory; needs pypdfium2 and Pillow):
+    python -m benchmarks.bench_page_images [pages] [download_mbps]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_model import make_scanned_pdf
+
+
+def main(pages: int = 20, download_mbps: float = 20) -> None:
+    scratch = tempfile.mkdtemp(prefix="grader-bench-")
+    os.environ["GRADER_PAGE_IMAGE_DIR"] = os.path.join(scratch, "pages")
+
+    from app import page_images
+
+    def download_s(size: int) -> float:
+        return size * 8 / (download_mbps * 1e6)
+
+    print(
+        f"{pages}-page scans, downloads at {download_mbps:g} Mbit/s;"
+        f" thumb {page_images.SIZES['thumb']}px, preview {page_images.SIZES['preview']}px"
+    )
+    print(
+        f"{'scan dpi':>8} {'pdf':>8} {'stage':>7} {'on request':>11} {'thumbs':>8} {'preview':>8}"
+        f" {'view pdf':>9} {'view page':>10}"
+    )
+    for dpi in (200, 300):
+        path = make_scanned_pdf(os.path.join(scratch, f"scan-{dpi}.pdf"), pages, dpi=dpi)
+        size = os.path.getsize(path)
+
+        # A page asked for before the stage has run
+        started = time.perf_counter()
+        cold = page_images.page_set(path)
+        page_images.render_page(path, cold, 1, "preview")
+        on_request = time.perf_counter() - started
+
+        started = time.perf_counter()
+        report = page_images.render_pages(path)
+        stage = time.perf_counter() - started + on_request
+        thumbs, previews = report["bytes"]["thumb"], report["bytes"]["preview"]
+        # The grading view loads every thumbnail and the page being read
+        page_view = thumbs + previews / pages
+        print(
+            f"{dpi:>8} {size / 2**20:>6.1f}MB {stage:>6.2f}s {on_request:>10.2f}s {thumbs / 2**10:>6.0f}KB"
+            f" {previews / pages / 2**10:>6.0f}KB {download_s(size):>8.2f}s {download_s(page_view):>9.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(*([int(args[0])] if args else []), *(float(a) for a in args[1:]))
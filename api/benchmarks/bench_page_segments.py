@@ -0,0 +1,59 @@
+"""Benchmark: local page segmentation of a submission PDF.
+
+Builds a text-layer submission (cover page, then several pages per problem),
+times `segment_pdf` cold (subsets written) and warm (subsets reused) and prints
+the PDF tokens and bytes each grading mode saves compared with attaching the
+whole PDF to every call.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_page_segments [problems] [pages_per_problem]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_model import make_text_pdf, sample_rubric
+
+
+def _submission_pages(problems: int, pages_per_problem: int):
+    pages = ["Name: Student\nCourse: Algorithms"]
+    for p in range(1, problems + 1):
+        for page in range(pages_per_problem):
+            heading = f"Problem {p}\n" if page == 0 else ""
+            pages.append(heading + "\n".join(f"step {line}: x_{line} = x_{line - 1} + {p}" for line in range(30)))
+    return pages
+
+
+def main(problems: int = 5, pages_per_problem: int = 6) -> None:
+    scratch = tempfile.mkdtemp(prefix="grader-bench-")
+    os.environ["GRADER_SEGMENT_DIR"] = os.path.join(scratch, "segments")
+
+    from app.agents import page_segments
+    from app.agents.llm_grading import rubric_to_problem_structure
+    from app.routers.submissions import _attached_parts
+
+    structure = rubric_to_problem_structure(sample_rubric(problems))
+    path = make_text_pdf(os.path.join(scratch, "submission.pdf"), _submission_pages(problems, pages_per_problem))
+
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        segments = page_segments.segment_pdf(path, structure)
+        print(f"segment_pdf ({label}): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    pages = len(segments.source.pages)
+    print(f"\n{pages} pages, {segments.source.size} bytes; relevant pages: {len(segments.relevant.pages)}")
+    print(f"{'mode':<12} {'calls':>5} {'PDF tokens':>11} {'whole-PDF tokens':>17} {'saved':>7} {'bytes saved':>12}")
+    for mode in ("two_stage", "single_pass", "per_problem"):
+        attached = _attached_parts(segments, mode)
+        report = segments.report(attached)
+        baseline = len(attached) * pages * page_segments.TOKENS_PER_PAGE
+        print(
+            f"{mode:<12} {len(attached):>5} {report['pdf_tokens']:>11} {baseline:>17}"
+            f" {report['tokens_saved'] / baseline:>6.0%} {report['bytes_saved']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(int(args[0]) if args else 5, int(args[1]) if len(args) > 1 else 6)
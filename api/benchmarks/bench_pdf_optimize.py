@@ -0,0 +1,54 @@
+"""Benchmark: optimizing scanned submissions before upload.
+
+Writes phone-scan-like PDFs (full-resolution JPEG pages, a few of them blank)
+and runs the optimization stage (`app.agents.pdf_optimize`) on each. Reports
+the bytes and PDF tokens before and after, the time the stage takes, and the
+upload time of the original and the copy at a given bandwidth.
+
+Usage (from the api/ directory; needs Pillow):
+    python -m benchmarks.bench_pdf_optimize [pages] [upload_mbps]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_model import make_scanned_pdf
+
+
+def main(pages: int = 20, upload_mbps: float = 20) -> None:
+    scratch = tempfile.mkdtemp(prefix="grader-bench-")
+    os.environ["GRADER_OPTIMIZED_DIR"] = os.path.join(scratch, "optimized")
+
+    from app.agents import pdf_optimize
+    from app.agents.page_segments import TOKENS_PER_PAGE
+
+    def upload_s(size: int) -> float:
+        return size * 8 / (upload_mbps * 1e6)
+
+    blank = tuple(range(4, pages + 1, 5))
+    print(
+        f"{pages}-page scans, {len(blank)} blank pages, uploads at {upload_mbps:g} Mbit/s;"
+        f" target {pdf_optimize.TARGET_DPI} dpi"
+    )
+    print(
+        f"{'scan dpi':>8} {'original':>9} {'optimized':>10} {'stage':>7} {'upload':>8} {'upload opt':>11}"
+        f" {'pdf tokens':>11} {'tokens opt':>11}"
+    )
+    for dpi in (200, 300):
+        path = make_scanned_pdf(os.path.join(scratch, f"scan-{dpi}.pdf"), pages, blank_pages=blank, dpi=dpi)
+        started = time.perf_counter()
+        optimized = pdf_optimize.optimize_pdf(path)
+        elapsed = time.perf_counter() - started
+        report = optimized.report()
+        print(
+            f"{dpi:>8} {report['original_bytes'] / 2**20:>7.1f}MB {report['optimized_bytes'] / 2**20:>8.1f}MB"
+            f" {elapsed:>6.2f}s {upload_s(report['original_bytes']):>7.2f}s"
+            f" {upload_s(report['optimized_bytes']):>10.2f}s"
+            f" {pages * TOKENS_PER_PAGE:>11} {pages * TOKENS_PER_PAGE - report['tokens_saved']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(*([int(args[0])] if args else []), *(float(a) for a in args[1:]))
@@ -0,0 +1,56 @@
+"""Benchmark: two-stage (extract + grade) vs single-pass grading against a stub model.
+
+Reports per-submission end-to-end latency, model calls and billed tokens for
+both paths. The stub's latency follows ttft + prefill + decode per token (see
+`benchmarks.stub_model`), so the comparison reflects the request shapes the
+pipeline actually sends without spending quota.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_single_pass [submissions] [problems]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from benchmarks.stub_model import StubModel, install, make_submission_pdfs, sample_rubric
+
+
+async def _run(mode: str, model: StubModel, rubric, structure, paths):
+    from app.agents import llm_grading
+
+    model.stats.reset()
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        if mode == "single_pass":
+            await llm_grading.agrade_submission_single_pass(rubric, structure, path)
+        else:
+            student_md = await llm_grading.aextract_submission(path, structure)
+            await llm_grading.agrade_submission(rubric, student_md, path)
+        latencies.append(time.perf_counter() - start)
+    return latencies, model.stats
+
+
+def main(submissions: int = 5, problems: int = 5) -> None:
+    rubric = sample_rubric(problems)
+    model = StubModel(rubric=rubric)
+    scratch = install(model)
+
+    from app.agents import llm_grading
+
+    structure = llm_grading.rubric_to_problem_structure(rubric)
+    paths = make_submission_pdfs(scratch, submissions)
+
+    print(f"{'mode':<12} {'mean latency':>13} {'calls/sub':>10} {'input tok/sub':>14} {'output tok/sub':>15}")
+    for mode in ("two_stage", "single_pass"):
+        latencies, stats = asyncio.run(_run(mode, model, rubric, structure, paths))
+        print(
+            f"{mode:<12} {statistics.mean(latencies):>12.2f}s {stats.calls / submissions:>10.1f}"
+            f" {stats.input_tokens / submissions:>14.0f} {stats.output_tokens / submissions:>15.0f}"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,108 @@
+"""Benchmark: time to the first graded problem, streamed vs whole grading answers.
+
+Grades text-layer submissions through `process_submission` (on a scratch
+SQLite database) against the stub model, once waiting for each whole grading
+answer and once streaming it (GRADER_STREAM_GRADES), where every problem is
+parsed, stored and published as soon as its entry closes. Timings come from
+the submission events: from the "grading" stage to the first `problem` event,
+and to the last one.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_streaming [submissions] [problems]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.stub_model import StubModel, install, make_text_pdf, sample_rubric
+
+
+def _pages(index: int, problems: int):
+    pages = [f"Name: Student {index}"]
+    for p in range(1, problems + 1):
+        pages.append(f"Problem {p}\n" + "\n".join(f"step {line}: a_{line} = {index + line * p}" for line in range(25)))
+    return pages
+
+
+async def _run(label: str, mode: str, stream: bool, scratch: str, submissions: int, problems: int):
+    from app import store
+    from app.agents import llm_grading
+    from app.agents.problems import rubric_to_problem_structure
+    from app.events import assignment_topic, bus
+    from app.routers.submissions import process_submission
+
+    rubric = sample_rubric(problems)
+    structure = rubric_to_problem_structure(rubric)
+    assignment = store.create_assignment(
+        id=f"bench-{label}", name=label, file_path="", grading_mode=mode, rubric=rubric, problem_structure=structure
+    )
+    records = [
+        store.create_submission(
+            id=f"{label}-{i}",
+            assignment_id=assignment["id"],
+            student_name=f"Student {i}",
+            file_path=make_text_pdf(os.path.join(scratch, f"{label}-{i}.pdf"), _pages(i, problems)),
+        )
+        for i in range(submissions)
+    ]
+
+    llm_grading.STREAM_GRADES = stream
+    events = defaultdict(list)
+
+    async def collect(queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            events[event["submission_id"]].append((time.perf_counter(), event))
+
+    async with bus.subscribe(assignment_topic(assignment["id"])) as queue:
+        collector = asyncio.create_task(collect(queue))
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                process_submission(
+                    record["id"], Path(record["file_path"]), rubric, structure,
+                    grading_mode=mode, bypass_cache=True, assignment_id=assignment["id"],
+                )
+                for record in records
+            )
+        )
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0)
+        collector.cancel()
+    store.write_buffer.flush()
+
+    first, last = [], []
+    for timeline in events.values():
+        grading = next(ts for ts, event in timeline if event.get("stage") == "grading")
+        results = [ts for ts, event in timeline if event["type"] == "problem"]
+        first.append(results[0] - grading)
+        last.append(results[-1] - grading)
+    return {"elapsed": elapsed, "first": statistics.median(first), "last": statistics.median(last)}
+
+
+def main(submissions: int = 8, problems: int = 8) -> None:
+    model = StubModel(rubric=sample_rubric(problems))
+    scratch = install(model)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'grader.db')}"
+    os.environ["GRADER_SEGMENT_DIR"] = os.path.join(scratch, "segments")
+
+    from app.db import init_db
+
+    init_db()
+    print(f"{submissions} submissions of {problems} problems; medians from the start of grading")
+    print(f"{'mode':<12} {'answer':<8} {'first problem':>14} {'last problem':>13} {'wall time':>10}")
+    for mode in ("two_stage", "single_pass"):
+        for stream, label in ((False, "whole"), (True, "streamed")):
+            result = asyncio.run(_run(f"{mode}-{label}", mode, stream, scratch, submissions, problems))
+            print(
+                f"{mode:<12} {label:<8} {result['first']:>13.2f}s {result['last']:>12.2f}s {result['elapsed']:>9.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
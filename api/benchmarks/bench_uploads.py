@@ -0,0 +1,56 @@
+"""Benchmark: uploading PDFs one at a time vs together with `aupload_files`.
+
+The stub file API keeps each upload PROCESSING for a fixed time, so the numbers
+show how much network and processing time overlaps, plus the dead time between
+a file turning ACTIVE and the poller noticing it.
+
+Usage (from the api/ directory):
+    python -m benchmarks.bench_uploads [files] [processing_seconds]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.stub_model import StubModel, install, make_submission_pdfs, sample_rubric
+
+UPLOAD_LATENCY_S = 0.2
+
+
+async def _run(mode: str, paths) -> float:
+    from app.agents import llm_grading
+
+    start = time.perf_counter()
+    if mode == "sequential":
+        for path in paths:
+            await llm_grading.aupload_files([path])
+    else:
+        await llm_grading.aupload_files(paths)
+    return time.perf_counter() - start
+
+
+def main(files: int = 10, processing_s: float = 1.5) -> None:
+    scratch = install(StubModel(rubric=sample_rubric()), upload_latency_s=UPLOAD_LATENCY_S, processing_s=processing_s)
+
+    from app.agents import llm_grading
+
+    stub_files = llm_grading.get_client().aio.files
+    ideal = UPLOAD_LATENCY_S + processing_s
+    print(f"{'mode':<11} {'files':>5} {'total':>8} {'per file':>9} {'dead time/file':>15} {'API calls':>10}")
+    for mode in ("sequential", "concurrent"):
+        paths = make_submission_pdfs(f"{scratch}", files)
+        # Fresh content per run so the file index never short-circuits the upload
+        for path in paths:
+            with open(path, "ab") as f:
+                f.write(mode.encode())
+        stub_files.calls = 0
+        total = asyncio.run(_run(mode, paths))
+        per_file = total / files if mode == "sequential" else total
+        print(
+            f"{mode:<11} {files:>5} {total:>7.2f}s {per_file:>8.2f}s {max(per_file - ideal, 0):>14.2f}s"
+            f" {stub_files.calls:>10}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    main(int(args[0]) if args else 10, float(args[1]) if len(args) > 1 else 1.5)
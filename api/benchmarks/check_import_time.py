@@ -0,0 +1,91 @@
+"""Startup budget check: how long `import app.main` takes, and what it pulls in.
+
+Imports the API in fresh interpreters under `python -X importtime` (from a
+scratch directory, so nothing is written next to the code) and reports the
+best cumulative time of `--runs` runs, after one warm-up run that compiles
+bytecode. The slowest top-level imports are listed for diagnosis.
+
+Exits non-zero when the time exceeds `--budget-ms`, or when the model stack
+(google-genai, langchain) or the PDF and image libraries (pypdf, Pillow) are
+imported at startup at all; they are meant to be loaded on first use (see
+`app.agents.problems`), and that part of the check does not depend on how
+fast the machine is. Run it in CI to catch startup
+regressions.
+
+Usage (from the api/ directory):
+    python -m benchmarks.check_import_time [--budget-ms 1500] [--runs 5]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+API_DIR = Path(__file__).resolve().parent.parent
+TARGET = "app.main"
+# Module prefixes that must stay out of the startup import graph
+LAZY_MODULES = ("google.genai", "langchain_core", "langchain_google_genai", "app.agents.llm_grading", "pypdf", "PIL")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _import_times(scratch: str) -> List[Tuple[int, int, str]]:
+    """(cumulative us, depth, module) per import of one fresh `import app.main`."""
+    os.makedirs(os.path.join(scratch, "uploads"), exist_ok=True)
+    env = {**os.environ, "PYTHONPATH": str(API_DIR)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=scratch, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {TARGET} failed:\n{result.stderr[-2000:]}")
+    times = []
+    for line in result.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            times.append((int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)))
+    return times
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Import-time budget check for {TARGET}")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="fail above this cumulative import time")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters timed; the best run counts")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="grader-import-") as scratch:
+        _import_times(scratch)  # warm-up: writes bytecode caches
+        runs = [_import_times(scratch) for _ in range(max(1, args.runs))]
+
+    totals = [next(us for us, _, module in run if module == TARGET) for run in runs]
+    best = runs[totals.index(min(totals))]
+    total_ms = min(totals) / 1000
+
+    # Modules app.main imports directly, slowest first
+    top_level: Dict[str, int] = {module: us for us, depth, module in best if depth == 1}
+    print(f"import {TARGET}: best {total_ms:.0f} ms of {len(totals)} runs (budget {args.budget_ms:.0f} ms)")
+    for module, us in sorted(top_level.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {module}")
+
+    failures = []
+    eager = sorted({module for _, _, module in best if module.startswith(LAZY_MODULES)})
+    if eager:
+        failures.append(f"imported at startup but meant to load lazily: {', '.join(eager[:5])}")
+    if total_ms > args.budget_ms:
+        failures.append(f"{total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
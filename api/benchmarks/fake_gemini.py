@@ -0,0 +1,413 @@
+"""Local stand-in for the Gemini file and generateContent APIs.
+
+Speaks the real wire protocols, so the API and workers run unmodified against
+it once `GRADER_GEMINI_BASE_URL`/`GRADER_GEMINI_GRPC_ENDPOINT` point here:
+
+- REST on --http-port: resumable file upload, `files.get`, context caches
+  (`cachedContents` create/update/delete) and `GET /stats`;
+- gRPC (TLS, self-signed) on --grpc-port: `GenerativeService.GenerateContent`
+  and `StreamGenerateContent` (the answer in chunks paced at the decode rate),
+  honouring `cached_content`.
+  Clients must trust the certificate via GRPC_DEFAULT_SSL_ROOTS_FILE_PATH.
+
+Answers are canned from `StubModel` (rubric JSON, extraction markdown, grades),
+latency follows its ttft + prefill + decode model scaled by lognormal jitter
+(cached tokens skip prefill), and --throttle-rate of requests get a 429 with a
+retry hint.
+
+Usage (from the api/ directory; needs `openssl` on PATH for the certificate):
+    python -m benchmarks.fake_gemini --http-port 8790 --grpc-port 8791 --cert-dir /tmp/fake-gemini
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import time
+import types
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.ai.generativelanguage_v1beta.types import content as gl_content
+from google.ai.generativelanguage_v1beta.types import generative_service as gl_service
+
+from benchmarks.stub_model import StubModel, estimate_tokens, sample_rubric
+
+FILE_TTL = timedelta(hours=48)
+CACHE_MIN_TOKENS = 1024
+
+
+@dataclass
+class FakeConfig:
+    problems: int = 5
+    pages: int = 6
+    ttft_s: float = 0.4
+    decode_s_per_token: float = 0.004
+    # Sigma of the lognormal factor applied to every model latency (0 = fixed)
+    jitter: float = 0.3
+    upload_latency_s: float = 0.05
+    processing_s: float = 0.5
+    throttle_rate: float = 0.0
+    retry_delay_s: float = 1.0
+    seed: int = 0
+
+
+@dataclass
+class FakeStats:
+    uploads: int = 0
+    file_gets: int = 0
+    generate_calls: int = 0
+    throttled: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    caches_created: int = 0
+
+
+def ensure_certificate(cert_dir: str) -> Tuple[str, str]:
+    """Self-signed certificate for 127.0.0.1/localhost; returns (cert, key) paths."""
+    os.makedirs(cert_dir, exist_ok=True)
+    cert, key = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+    if not (os.path.exists(cert) and os.path.exists(key)):
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "7",
+                "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+                "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            ],
+            check=True,
+            capture_output=True,
+        )
+    return cert, key
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+@dataclass
+class FakeGemini:
+    config: FakeConfig
+    http_base: str
+    stats: FakeStats = field(default_factory=FakeStats)
+
+    def __post_init__(self):
+        self.random = random.Random(self.config.seed)
+        self.model = StubModel(
+            rubric=sample_rubric(self.config.problems),
+            pages=self.config.pages,
+            ttft_s=self.config.ttft_s,
+            decode_s_per_token=self.config.decode_s_per_token,
+        )
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.ready_at: Dict[str, float] = {}
+        self.pending_uploads: Dict[str, Dict[str, Any]] = {}
+        self.caches: Dict[str, Dict[str, Any]] = {}
+
+    def _throttle(self) -> bool:
+        if self.config.throttle_rate and self.random.random() < self.config.throttle_rate:
+            self.stats.throttled += 1
+            return True
+        return False
+
+    def _throttle_message(self) -> str:
+        return f"Resource has been exhausted (e.g. check quota). Please retry in {self.config.retry_delay_s:g}s."
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * self.random.lognormvariate(0, self.config.jitter) if self.config.jitter else seconds
+
+    # REST file API
+
+    def _error(self, code: int, status: str, message: str) -> JSONResponse:
+        return JSONResponse({"error": {"code": code, "message": message, "status": status}}, status_code=code)
+
+    def _file_view(self, name: str) -> Dict[str, Any]:
+        record = dict(self.files[name])
+        record["state"] = "PROCESSING" if time.monotonic() < self.ready_at[name] else "ACTIVE"
+        return record
+
+    def _cache_view(self, name: str, ttl: Any) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        seconds = float(str(ttl).rstrip("s")) if ttl else 3600.0
+        return {
+            "name": name,
+            "model": self.caches[name]["model"],
+            "createTime": _timestamp(now),
+            "updateTime": _timestamp(now),
+            "expireTime": _timestamp(now + timedelta(seconds=seconds)),
+            "usageMetadata": {"totalTokenCount": self.caches[name]["tokens"]},
+        }
+
+    def rest_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/upload/v1beta/files")
+        async def upload(request: Request):
+            upload_id = request.query_params.get("upload_id")
+            if upload_id is None:
+                if self._throttle():
+                    return self._error(429, "RESOURCE_EXHAUSTED", self._throttle_message())
+                meta = (await request.json()).get("file", {})
+                if meta.get("name") in self.files:
+                    return self._error(409, "ALREADY_EXISTS", f"File {meta['name']} already exists.")
+                upload_id = uuid.uuid4().hex
+                self.pending_uploads[upload_id] = meta
+                return JSONResponse(
+                    {},
+                    headers={
+                        "x-goog-upload-url": f"{self.http_base}/upload/v1beta/files?upload_id={upload_id}",
+                        "x-goog-upload-status": "active",
+                    },
+                )
+
+            body = await request.body()
+            if "finalize" not in request.headers.get("x-goog-upload-command", ""):
+                return JSONResponse({}, headers={"x-goog-upload-status": "active"})
+            meta = self.pending_uploads.pop(upload_id, {})
+            await asyncio.sleep(self.config.upload_latency_s)
+            name = meta.get("name") or f"files/{uuid.uuid4().hex[:12]}"
+            now = datetime.now(timezone.utc)
+            self.files[name] = {
+                "name": name,
+                "displayName": meta.get("displayName", ""),
+                "mimeType": meta.get("mimeType", "application/pdf"),
+                "sizeBytes": str(len(body)),
+                "createTime": _timestamp(now),
+                "updateTime": _timestamp(now),
+                "expirationTime": _timestamp(now + FILE_TTL),
+                "uri": f"{self.http_base}/v1beta/{name}",
+            }
+            self.ready_at[name] = time.monotonic() + self.config.processing_s
+            self.stats.uploads += 1
+            return JSONResponse({"file": self._file_view(name)}, headers={"x-goog-upload-status": "final"})
+
+        @app.get("/v1beta/files/{file_id}")
+        async def get_file(file_id: str):
+            self.stats.file_gets += 1
+            if self._throttle():
+                return self._error(429, "RESOURCE_EXHAUSTED", self._throttle_message())
+            name = f"files/{file_id}"
+            if name not in self.files:
+                return self._error(404, "NOT_FOUND", f"File {name} not found.")
+            return self._file_view(name)
+
+        @app.post("/v1beta/cachedContents")
+        async def create_cache(request: Request):
+            body = await request.json()
+            system = "".join(part.get("text", "") for part in body.get("systemInstruction", {}).get("parts", []))
+            parts = [
+                {"type": "text", "text": part.get("text", "")}
+                for turn in body.get("contents", [])
+                for part in turn.get("parts", [])
+            ]
+            messages = [types.SimpleNamespace(content=system), types.SimpleNamespace(content=parts)]
+            tokens = self.model._input_tokens(messages)
+            if tokens < CACHE_MIN_TOKENS:
+                message = f"Cached content is too small. total_token_count={tokens}, min_total_token_count={CACHE_MIN_TOKENS}"
+                return self._error(400, "INVALID_ARGUMENT", message)
+            name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+            self.caches[name] = {"messages": messages, "tokens": tokens, "model": body.get("model", "")}
+            self.stats.caches_created += 1
+            return self._cache_view(name, body.get("ttl"))
+
+        @app.patch("/v1beta/cachedContents/{cache_id}")
+        async def update_cache(cache_id: str, request: Request):
+            name = f"cachedContents/{cache_id}"
+            if name not in self.caches:
+                return self._error(404, "NOT_FOUND", f"CachedContent not found (or permission denied): {name}")
+            return self._cache_view(name, (await request.json()).get("ttl"))
+
+        @app.delete("/v1beta/cachedContents/{cache_id}")
+        async def delete_cache(cache_id: str):
+            if self.caches.pop(f"cachedContents/{cache_id}", None) is None:
+                return self._error(404, "NOT_FOUND", f"CachedContent not found: cachedContents/{cache_id}")
+            return {}
+
+        @app.get("/stats")
+        async def stats():
+            return vars(self.stats)
+
+        return app
+
+    # gRPC model service
+
+    def _messages(self, request: gl_service.GenerateContentRequest) -> Tuple[List[Any], int]:
+        """The request as the LangChain-style messages StubModel answers, and its cached tokens."""
+        system = "".join(part.text for part in request.system_instruction.parts)
+        parts: List[Dict[str, Any]] = []
+        cached_tokens = 0
+        if request.cached_content:
+            cached = self.caches[request.cached_content]
+            system = cached["messages"][0].content
+            parts.extend(cached["messages"][1].content)
+            cached_tokens = cached["tokens"]
+        for turn in request.contents:
+            for part in turn.parts:
+                if part.file_data.file_uri:
+                    parts.append({"type": "media", "file_uri": part.file_data.file_uri})
+                else:
+                    parts.append({"type": "text", "text": part.text})
+        return [types.SimpleNamespace(content=system), types.SimpleNamespace(content=parts)], cached_tokens
+
+    async def _answer(self, request: gl_service.GenerateContentRequest, context) -> Tuple[str, int, int]:
+        """(text, input tokens, cached tokens) of a request that is not throttled or rejected."""
+        if self._throttle():
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self._throttle_message())
+        if request.cached_content and request.cached_content not in self.caches:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"CachedContent not found: {request.cached_content}")
+        messages, cached_tokens = self._messages(request)
+        text = self.model.respond(messages)
+        input_tokens = self.model._input_tokens(messages)
+        self.stats.generate_calls += 1
+        self.stats.input_tokens += input_tokens
+        self.stats.cached_tokens += cached_tokens
+        self.stats.output_tokens += estimate_tokens(text)
+        return text, input_tokens, cached_tokens
+
+    def _response(
+        self, text: str, input_tokens: int, cached_tokens: int, output_tokens: int, done: bool = True
+    ) -> gl_service.GenerateContentResponse:
+        # Usage is cumulative, as Gemini reports it on every streamed chunk
+        reason = gl_service.Candidate.FinishReason
+        return gl_service.GenerateContentResponse(
+            candidates=[
+                gl_service.Candidate(
+                    index=0,
+                    content=gl_content.Content(role="model", parts=[gl_content.Part(text=text)]),
+                    finish_reason=reason.STOP if done else reason.FINISH_REASON_UNSPECIFIED,
+                )
+            ],
+            usage_metadata=gl_service.GenerateContentResponse.UsageMetadata(
+                prompt_token_count=input_tokens,
+                cached_content_token_count=cached_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=input_tokens + output_tokens,
+            ),
+        )
+
+    async def generate_content(self, request: gl_service.GenerateContentRequest, context) -> gl_service.GenerateContentResponse:
+        text, input_tokens, cached_tokens = await self._answer(request, context)
+        output_tokens = estimate_tokens(text)
+        await asyncio.sleep(self._jittered(self.model._latency(input_tokens, output_tokens, cached_tokens)))
+        return self._response(text, input_tokens, cached_tokens, output_tokens)
+
+    async def stream_generate_content(
+        self, request: gl_service.GenerateContentRequest, context
+    ) -> AsyncIterator[gl_service.GenerateContentResponse]:
+        text, input_tokens, cached_tokens = await self._answer(request, context)
+        output_tokens = estimate_tokens(text)
+        latency = self._jittered(self.model._latency(input_tokens, output_tokens, cached_tokens))
+        decode = min(latency, output_tokens * self.model.decode_s_per_token)
+        await asyncio.sleep(latency - decode)
+        size = self.model.stream_chunk_chars
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        sent = 0
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(decode / len(pieces))
+            sent += len(piece)
+            done = index == len(pieces) - 1
+            yield self._response(
+                piece, input_tokens, cached_tokens, output_tokens if done else estimate_tokens(text[:sent]), done
+            )
+
+    def grpc_handler(self) -> grpc.GenericRpcHandler:
+        return grpc.method_handlers_generic_handler(
+            "google.ai.generativelanguage.v1beta.GenerativeService",
+            {
+                "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                    self.generate_content,
+                    request_deserializer=gl_service.GenerateContentRequest.deserialize,
+                    response_serializer=gl_service.GenerateContentResponse.serialize,
+                ),
+                "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                    self.stream_generate_content,
+                    request_deserializer=gl_service.GenerateContentRequest.deserialize,
+                    response_serializer=gl_service.GenerateContentResponse.serialize,
+                ),
+            },
+        )
+
+
+async def serve(config: FakeConfig, http_port: int, grpc_port: int, cert_dir: str) -> None:
+    fake = FakeGemini(config, http_base=f"http://127.0.0.1:{http_port}")
+    cert, key = ensure_certificate(cert_dir)
+    grpc_server = grpc.aio.server()
+    grpc_server.add_generic_rpc_handlers((fake.grpc_handler(),))
+    with open(key, "rb") as key_file, open(cert, "rb") as cert_file:
+        credentials = grpc.ssl_server_credentials([(key_file.read(), cert_file.read())])
+    grpc_server.add_secure_port(f"127.0.0.1:{grpc_port}", credentials)
+    await grpc_server.start()
+
+    rest_server = uvicorn.Server(uvicorn.Config(fake.rest_app(), host="127.0.0.1", port=http_port, log_level="warning"))
+    try:
+        await rest_server.serve()
+    finally:
+        await grpc_server.stop(grace=None)
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--http-port", type=int, default=8790)
+    parser.add_argument("--grpc-port", type=int, default=8791)
+    parser.add_argument("--cert-dir", default=os.path.join(os.getcwd(), ".fake-gemini"))
+    add_config_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """FakeConfig options, shared with the load test."""
+    defaults = FakeConfig()
+    parser.add_argument("--problems", type=int, default=defaults.problems)
+    parser.add_argument("--pages", type=int, default=defaults.pages, help="pages billed per attached PDF")
+    parser.add_argument("--ttft", type=float, default=defaults.ttft_s, help="seconds to first token")
+    parser.add_argument("--decode-per-token", type=float, default=defaults.decode_s_per_token)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="lognormal sigma on model latency")
+    parser.add_argument("--upload-latency", type=float, default=defaults.upload_latency_s)
+    parser.add_argument("--processing", type=float, default=defaults.processing_s, help="seconds a file stays PROCESSING")
+    parser.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate, help="fraction of requests answered 429")
+    parser.add_argument("--retry-delay", type=float, default=defaults.retry_delay_s, help="retry hint sent with 429s")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        problems=args.problems,
+        pages=args.pages,
+        ttft_s=args.ttft,
+        decode_s_per_token=args.decode_per_token,
+        jitter=args.jitter,
+        upload_latency_s=args.upload_latency,
+        processing_s=args.processing,
+        throttle_rate=args.throttle_rate,
+        retry_delay_s=args.retry_delay,
+        seed=args.seed,
+    )
+
+
+def config_to_argv(config: FakeConfig) -> List[str]:
+    return [
+        "--problems", str(config.problems),
+        "--pages", str(config.pages),
+        "--ttft", str(config.ttft_s),
+        "--decode-per-token", str(config.decode_s_per_token),
+        "--jitter", str(config.jitter),
+        "--upload-latency", str(config.upload_latency_s),
+        "--processing", str(config.processing_s),
+        "--throttle-rate", str(config.throttle_rate),
+        "--retry-delay", str(config.retry_delay_s),
+        "--seed", str(config.seed),
+    ]
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    try:
+        asyncio.run(serve(config_from_args(args), args.http_port, args.grpc_port, args.cert_dir))
+    except KeyboardInterrupt:
+        pass
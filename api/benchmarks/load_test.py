@@ -0,0 +1,352 @@
+"""Offline load test: the real API, worker and clients against the fake Gemini.
+
+Starts `benchmarks.fake_gemini` and the API (uvicorn, embedded worker) in a
+scratch directory, creates an assignment through `POST /assignments/`, then
+keeps `--concurrency` submissions in flight through `POST /submissions/`
+until `--submissions` have finished. Each submission's latency runs from its
+POST until its event stream reports done or failed.
+
+Reports p50/p95/p99 end-to-end grading latency, throughput, 429s and API
+process memory per in-flight job. Save a run with `--out` and compare a
+later run against it with `--baseline` (regressions are marked with "!").
+
+Usage (from the api/ directory):
+    python -m benchmarks.load_test --submissions 40 --concurrency 8 --out baseline.json
+    python -m benchmarks.load_test --submissions 40 --concurrency 8 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_gemini import FakeConfig, add_config_arguments, config_from_args, config_to_argv
+from benchmarks.stub_model import make_text_pdf, sample_rubric
+
+API_DIR = Path(__file__).resolve().parent.parent
+SAMPLE_INTERVAL_S = 0.25
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_bytes(pid: int) -> int:
+    """Resident set size from /proc (Linux only; 0 elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _submission_pages(index: int, problems: int) -> List[str]:
+    pages = [f"Name: Student {index}\nID {index:06d}"]
+    for p in range(1, problems + 1):
+        pages.append(f"Problem {p}\n" + "\n".join(f"step {line}: a_{line} = {index + line * p}" for line in range(25)))
+    return pages
+
+
+async def _wait_http(client: httpx.AsyncClient, url: str, timeout_s: float = 30) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} did not come up within {timeout_s:.0f}s")
+        await asyncio.sleep(0.1)
+
+
+async def _wait_for_stage(client: httpx.AsyncClient, url: str) -> str:
+    """Follow a submission's event stream until done/failed; returns that stage."""
+    async with client.stream("GET", url, timeout=None) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:") and event in ("snapshot", "stage"):
+                stage = json.loads(line.split(":", 1)[1]).get("stage")
+                if stage in ("done", "failed"):
+                    return stage
+    return "disconnected"
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, scratch: str):
+        self.args = args
+        self.scratch = scratch
+        self.fake_config: FakeConfig = config_from_args(args)
+        self.http_port, self.grpc_port, self.api_port = _free_port(), _free_port(), _free_port()
+        self.api_url = f"http://127.0.0.1:{self.api_port}"
+        self.processes: List[subprocess.Popen] = []
+        self.samples: List[Dict[str, float]] = []
+
+    def _spawn(self, argv: List[str], env: Dict[str, str], log_name: str, cwd: str = str(API_DIR)) -> subprocess.Popen:
+        log = open(os.path.join(self.scratch, log_name), "wb")
+        process = subprocess.Popen(argv, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append(process)
+        return process
+
+    def start(self) -> None:
+        cert_dir = os.path.join(self.scratch, "cert")
+        base_env = {**os.environ, "PYTHONPATH": str(API_DIR)}
+        self._spawn(
+            [sys.executable, "-m", "benchmarks.fake_gemini", "--http-port", str(self.http_port),
+             "--grpc-port", str(self.grpc_port), "--cert-dir", cert_dir, *config_to_argv(self.fake_config)],
+            base_env,
+            "fake_gemini.log",
+        )
+        run_dir = os.path.join(self.scratch, "api")
+        os.makedirs(run_dir, exist_ok=True)
+        api_env = {
+            **base_env,
+            "GOOGLE_API_KEY": "load-test-placeholder-key",
+            "DATABASE_URL": f"sqlite:///{os.path.join(run_dir, 'grader.db')}",
+            "GRADER_GEMINI_BASE_URL": f"http://127.0.0.1:{self.http_port}",
+            "GRADER_GEMINI_GRPC_ENDPOINT": f"127.0.0.1:{self.grpc_port}",
+            "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": os.path.join(cert_dir, "cert.pem"),
+            # Every request should reach the fake model
+            "GRADER_RESPONSE_CACHE": "0",
+            "GRADER_WORKER_CONCURRENCY": str(self.args.worker_concurrency),
+            **dict(item.split("=", 1) for item in self.args.env),
+        }
+        self.api = self._spawn(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.api_port), "--log-level", "warning"],
+            api_env,
+            "api.log",
+            cwd=run_dir,
+        )
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    async def _sample(self, client: httpx.AsyncClient, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                running = (await client.get(f"{self.api_url}/jobs/stats")).json().get("running", 0)
+            except httpx.HTTPError:
+                running = 0
+            self.samples.append({"t": time.monotonic(), "rss": _rss_bytes(self.api.pid), "running": running})
+            try:
+                await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _create_assignment(self, client: httpx.AsyncClient) -> str:
+        rubric = sample_rubric(self.fake_config.problems)
+        path = make_text_pdf(
+            os.path.join(self.scratch, "assignment.pdf"),
+            [f"{p['name']}\n{p['description'][:80]}" for p in rubric],
+        )
+        with open(path, "rb") as pdf:
+            response = await client.post(
+                f"{self.api_url}/assignments/",
+                data={"name": "Load test", "grading_mode": self.args.mode},
+                files={"file": ("assignment.pdf", pdf, "application/pdf")},
+            )
+        response.raise_for_status()
+        assignment_id = response.json()["assignment_id"]
+        deadline = time.monotonic() + 120
+        while not (await client.get(f"{self.api_url}/assignments/{assignment_id}")).json().get("rubric"):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Rubric preprocessing did not finish within 120s")
+            await asyncio.sleep(0.2)
+        return assignment_id
+
+    async def _submit(self, client: httpx.AsyncClient, assignment_id: str, index: int) -> Dict[str, Any]:
+        path = make_text_pdf(
+            os.path.join(self.scratch, f"submission-{index}.pdf"),
+            _submission_pages(index, self.fake_config.problems),
+        )
+        start = time.monotonic()
+        with open(path, "rb") as pdf:
+            response = await client.post(
+                f"{self.api_url}/submissions/",
+                data={"assignment_id": assignment_id, "student_name": f"Student {index}"},
+                files={"file": (f"submission-{index}.pdf", pdf, "application/pdf")},
+            )
+        response.raise_for_status()
+        submission_id = response.json()["submission_id"]
+        stage = await _wait_for_stage(client, f"{self.api_url}/submissions/{submission_id}/events")
+        return {"latency_s": time.monotonic() - start, "stage": stage}
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2 + 8)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            await _wait_http(client, f"http://127.0.0.1:{self.http_port}/stats")
+            await _wait_http(client, f"{self.api_url}/")
+            assignment_id = await self._create_assignment(client)
+            await asyncio.sleep(1)
+            idle_rss = _rss_bytes(self.api.pid)
+
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self._sample(client, stop))
+            slots = asyncio.Semaphore(self.args.concurrency)
+
+            async def one(index: int) -> Dict[str, Any]:
+                async with slots:
+                    return await self._submit(client, assignment_id, index)
+
+            started = time.monotonic()
+            results = await asyncio.gather(*(one(i) for i in range(self.args.submissions)))
+            elapsed = time.monotonic() - started
+            stop.set()
+            await sampler
+
+            fake_stats = (await client.get(f"http://127.0.0.1:{self.http_port}/stats")).json()
+            limiter_stats = (await client.get(f"{self.api_url}/rate-limits/stats")).json()
+        return self._report(results, elapsed, idle_rss, fake_stats, limiter_stats)
+
+    def _report(self, results, elapsed, idle_rss, fake_stats, limiter_stats) -> Dict[str, Any]:
+        done = [r["latency_s"] for r in results if r["stage"] == "done"]
+        busy = [s for s in self.samples if s["running"] > 0 and s["rss"]]
+        per_job = [(s["rss"] - idle_rss) / s["running"] for s in busy]
+        return {
+            "config": {
+                "submissions": self.args.submissions,
+                "concurrency": self.args.concurrency,
+                "worker_concurrency": self.args.worker_concurrency,
+                "mode": self.args.mode,
+                "fake": vars(self.fake_config),
+            },
+            "graded": len(done),
+            "failed": len(results) - len(done),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_min": round(len(done) / elapsed * 60, 1) if elapsed else 0.0,
+            "latency_s": {
+                "p50": round(_percentile(done, 50), 3),
+                "p95": round(_percentile(done, 95), 3),
+                "p99": round(_percentile(done, 99), 3),
+                "max": round(max(done, default=0.0), 3),
+            },
+            "memory": {
+                "idle_rss_mb": round(idle_rss / 2**20, 1),
+                "peak_rss_mb": round(max((s["rss"] for s in self.samples), default=0) / 2**20, 1),
+                "peak_running_jobs": max((s["running"] for s in self.samples), default=0),
+                "per_inflight_job_kb": round(statistics.median(per_job) / 1024, 1) if per_job else None,
+            },
+            "model": {
+                "generate_calls": fake_stats["generate_calls"],
+                "uploads": fake_stats["uploads"],
+                "injected_429s": fake_stats["throttled"],
+                "limiter_throttled": sum(stats["throttled"] for stats in limiter_stats.values()),
+                "input_tokens": fake_stats["input_tokens"],
+                "cached_tokens": fake_stats["cached_tokens"],
+                "output_tokens": fake_stats["output_tokens"],
+                "context_caches": fake_stats["caches_created"],
+            },
+        }
+
+
+# Metrics compared against a baseline: (path, higher is better)
+_COMPARED = (
+    (("throughput_per_min",), True),
+    (("latency_s", "p50"), False),
+    (("latency_s", "p95"), False),
+    (("latency_s", "p99"), False),
+    (("memory", "per_inflight_job_kb"), False),
+    (("memory", "peak_rss_mb"), False),
+    (("model", "generate_calls"), False),
+    (("model", "input_tokens"), False),
+)
+
+
+def _lookup(report: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        report = report.get(key) if isinstance(report, dict) else None
+    return report
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    config = report["config"]
+    print(
+        f"{config['submissions']} submissions, {config['concurrency']} in flight, mode {config['mode']}, "
+        f"429 rate {config['fake']['throttle_rate']:g}"
+    )
+    print(f"graded {report['graded']}, failed {report['failed']} in {report['elapsed_s']}s")
+    print(f"{'metric':<30} {'value':>12}" + (f" {'baseline':>12} {'change':>8}" if baseline else ""))
+    for path, higher_is_better in _COMPARED:
+        value = _lookup(report, path)
+        line = f"{'.'.join(path):<30} {value if value is not None else '-':>12}"
+        if baseline:
+            before = _lookup(baseline, path)
+            change = ""
+            if isinstance(value, (int, float)) and before:
+                delta = (value - before) / before
+                better = delta > 0 if higher_is_better else delta < 0
+                change = f"{delta:+.1%}{' ' if better or not delta else '!'}"
+            line += f" {before if before is not None else '-':>12} {change:>8}"
+        print(line)
+    print(f"429s injected {report['model']['injected_429s']}, seen by the rate limiter {report['model']['limiter_throttled']}")
+    print(f"context caches {report['model']['context_caches']}, input tokens served from them {report['model']['cached_tokens']}")
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test against a fake Gemini")
+    parser.add_argument("--submissions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8, help="submissions in flight at once")
+    parser.add_argument("--worker-concurrency", type=int, default=8, help="GRADER_WORKER_CONCURRENCY for the API")
+    parser.add_argument("--mode", default="two_stage", choices=("two_stage", "single_pass", "per_problem"))
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra API environment")
+    parser.add_argument("--out", help="write the report (JSON) here")
+    parser.add_argument("--baseline", help="compare against a report written with --out")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory (logs, database)")
+    add_config_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    scratch = tempfile.mkdtemp(prefix="grader-load-")
+    test = LoadTest(args, scratch)
+    test.start()
+    try:
+        report = asyncio.run(test.run())
+    finally:
+        test.stop()
+        if args.keep:
+            print(f"scratch directory: {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
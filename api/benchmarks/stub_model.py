@@ -0,0 +1,408 @@
+"""Offline stand-ins for the Gemini file API and chat model used by the benchmarks.
+
+`install()` patches `app.agents.llm_grading` so every stage runs against a stub
+whose latency follows a simple prefill/decode model and which counts the tokens
+it would have been billed for. Nothing touches the network.
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from google.genai import errors as genai_errors
+from langchain_core.messages import AIMessageChunk
+
+# Gemini bills each PDF page as a fixed number of input tokens.
+TOKENS_PER_PDF_PAGE = 258
+
+# Ways `StubModel` corrupts a JSON answer when `malformed_rate` is set
+MALFORMED_KINDS = ("fenced", "truncated", "score_sum", "missing_problem", "invalid_entry")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def sample_rubric(problems: int = 5, items_per_problem: int = 3) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": str(p),
+            "name": f"Problem {p}",
+            "description": f"Prove statement {p} and analyse its running time. " * 4,
+            "items": [
+                {"id": str(i), "description": f"Correct step {i} of the argument", "points": 2}
+                for i in range(1, items_per_problem + 1)
+            ],
+            "total": 2 * items_per_problem,
+        }
+        for p in range(1, problems + 1)
+    ]
+
+
+@dataclass
+class StubStats:
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    malformed: int = 0
+
+    def reset(self) -> None:
+        self.calls = self.input_tokens = self.cached_tokens = self.output_tokens = self.malformed = 0
+
+
+@dataclass
+class StubModel:
+    """Chat model double: latency = ttft + input * prefill + output * decode (seconds).
+
+    Calls naming a context cache (see `_StubCaches`) get its system prompt and
+    parts prepended; cached tokens count as input but skip the prefill time.
+    `malformed_rate` of the JSON grading answers come back corrupted in one of
+    the `MALFORMED_KINDS` ways (seeded, so runs are repeatable). `astream`
+    sends the answer in `stream_chunk_chars` pieces paced at the decode rate.
+    """
+
+    rubric: List[Dict[str, Any]]
+    pages: int = 6
+    ttft_s: float = 0.4
+    prefill_s_per_token: float = 0.00002
+    decode_s_per_token: float = 0.004
+    answer_chars_per_problem: int = 1200
+    malformed_rate: float = 0.0
+    seed: int = 0
+    stream_chunk_chars: int = 64
+    stats: StubStats = field(default_factory=StubStats)
+    caches: Dict[str, List[Any]] = field(default_factory=dict)
+
+    def _input_tokens(self, messages: List[Any]) -> int:
+        total = 0
+        for message in messages:
+            content = message.content
+            parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+            for part in parts:
+                if part.get("type") == "media":
+                    total += self.pages * TOKENS_PER_PDF_PAGE
+                else:
+                    total += estimate_tokens(part.get("text", ""))
+        return total
+
+    def _markdown(self, problems: List[Dict[str, Any]]) -> str:
+        return "\n\n".join(
+            f"## {p['name']}\n" + ("The student argues by induction on n. " * (self.answer_chars_per_problem // 40))
+            for p in problems
+        )
+
+    def _grades(self, problems: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": p["id"],
+                "name": p["name"],
+                "items": [
+                    {
+                        "item": int(item["id"]),
+                        "score": item["points"],
+                        "total_possible_score": item["points"],
+                        "explanation": "The step is stated and justified correctly in the student's induction argument.",
+                        "confidence": 0.9,
+                    }
+                    for item in p["items"]
+                ],
+                "score": p["total"],
+                "total_score": p["total"],
+                "explanation": "All rubric items are satisfied with clear justification.",
+                "confidence": 0.9,
+            }
+            for p in problems
+        ]
+
+    def _problems_in(self, messages: List[Any]) -> List[Dict[str, Any]]:
+        """Problems mentioned in the request (all of them unless the prompt was narrowed)."""
+        text = json.dumps([m.content for m in messages[1:]], ensure_ascii=False)
+        named = [p for p in self.rubric if f'"name": "{p["name"]}"' in text or f'\\"name\\": \\"{p["name"]}\\"' in text]
+        return named or self.rubric
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def _malformed(self, grades: List[Dict[str, Any]], wrap=lambda grades: grades) -> str:
+        """A JSON grading answer, corrupted `malformed_rate` of the time."""
+        if self._rng.random() >= self.malformed_rate:
+            return json.dumps(wrap(grades))
+        self.stats.malformed += 1
+        kind = self._rng.choice(MALFORMED_KINDS)
+        grades = json.loads(json.dumps(grades))
+        if kind == "score_sum":
+            grades[0]["score"] += 1
+        elif kind == "missing_problem" and len(grades) > 1:
+            grades.pop()
+        elif kind == "invalid_entry":
+            del grades[-1]["items"]
+        text = json.dumps(wrap(grades))
+        if kind == "fenced":
+            return f"Here are the grades:\n```json\n{text}\n```"
+        if kind == "truncated":
+            return text[: int(len(text) * 0.8)]
+        return text
+
+    def respond(self, messages: List[Any]) -> str:
+        system = messages[0].content if messages else ""
+        problems = self._problems_in(messages)
+        if "In ONE pass" in system:
+            extraction = self._markdown(problems)
+            return self._malformed(self._grades(problems), lambda grades: {"extraction": extraction, "grades": grades})
+        if "extract each problem" in system:
+            return json.dumps(self.rubric)
+        if "extract student solutions" in system:
+            return self._markdown(problems)
+        return self._malformed(self._grades(problems))
+
+    def _latency(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+        return (
+            self.ttft_s
+            + (input_tokens - cached_tokens) * self.prefill_s_per_token
+            + output_tokens * self.decode_s_per_token
+        )
+
+    def with_cache(self, messages: List[Any], cached_content: Any) -> Tuple[List[Any], int]:
+        """The full request for `messages` sent against `cached_content`, and its cached tokens."""
+        if not cached_content:
+            return messages, 0
+        cached = self.caches[cached_content]
+        parts = cached[1].content + [part for message in messages for part in message.content]
+        return [cached[0], types.SimpleNamespace(content=parts)], self._input_tokens(cached)
+
+    def _account(self, messages: List[Any], cached_content: Any = None):
+        messages, cached_tokens = self.with_cache(messages, cached_content)
+        content = self.respond(messages)
+        input_tokens = self._input_tokens(messages)
+        output_tokens = estimate_tokens(content)
+        self.stats.calls += 1
+        self.stats.input_tokens += input_tokens
+        self.stats.cached_tokens += cached_tokens
+        self.stats.output_tokens += output_tokens
+        message = types.SimpleNamespace(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": cached_tokens},
+            },
+        )
+        return message, self._latency(input_tokens, output_tokens, cached_tokens)
+
+    def invoke(self, messages: List[Any], cached_content: Any = None, **kwargs: Any):
+        message, latency = self._account(messages, cached_content)
+        time.sleep(latency)
+        return message
+
+    async def ainvoke(self, messages: List[Any], cached_content: Any = None, **kwargs: Any):
+        message, latency = self._account(messages, cached_content)
+        await asyncio.sleep(latency)
+        return message
+
+    async def astream(self, messages: List[Any], cached_content: Any = None, **kwargs: Any) -> AsyncIterator[Any]:
+        message, latency = self._account(messages, cached_content)
+        content = message.content
+        decode = estimate_tokens(content) * self.decode_s_per_token
+        await asyncio.sleep(latency - decode)
+        size = self.stream_chunk_chars
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(decode / len(pieces))
+            # Usage arrives with the last chunk, as Gemini reports it
+            usage = message.usage_metadata if index == len(pieces) - 1 else None
+            yield AIMessageChunk(content=piece, usage_metadata=usage)
+
+
+class _StubCaches:
+    """Context cache API double storing prefixes on the model."""
+
+    def __init__(self, model: StubModel, min_tokens: int = 1024):
+        self.model = model
+        self.min_tokens = min_tokens
+        self.created = 0
+
+    def _create(self, model: str, config) -> Any:
+        messages = [
+            types.SimpleNamespace(content=config.system_instruction),
+            types.SimpleNamespace(
+                content=[{"type": "text", "text": part.text} for content in config.contents for part in content.parts]
+            ),
+        ]
+        if self.model._input_tokens(messages) < self.min_tokens:
+            raise ValueError("400 INVALID_ARGUMENT: Cached content is too small")
+        name = f"cachedContents/{len(self.model.caches) + 1}"
+        self.model.caches[name] = messages
+        self.created += 1
+        return types.SimpleNamespace(name=name, expire_time=None)
+
+    def create(self, model: str, config):
+        return self._create(model, config)
+
+    def update(self, name: str, config):
+        if name not in self.model.caches:
+            raise LookupError(name)
+        return types.SimpleNamespace(name=name, expire_time=None)
+
+    def delete(self, name: str):
+        self.model.caches.pop(name, None)
+
+
+class _AsyncStubCaches(_StubCaches):
+    async def create(self, model: str, config):
+        return self._create(model, config)
+
+    async def update(self, name: str, config):
+        return _StubCaches.update(self, name, config)
+
+    async def delete(self, name: str):
+        _StubCaches.delete(self, name)
+
+
+class _StubFiles:
+    """Remote file store double; uploads stay PROCESSING for `processing_s` seconds."""
+
+    def __init__(self, upload_latency_s: float, processing_s: float = 0.0):
+        self.upload_latency_s = upload_latency_s
+        self.processing_s = processing_s
+        self.ready_at: Dict[str, float] = {}
+        self.calls = 0
+
+    def _file(self, name: str):
+        state = None
+        if name in self.ready_at:
+            processing = time.monotonic() < self.ready_at[name]
+            state = types.SimpleNamespace(name="PROCESSING" if processing else "ACTIVE")
+        short = name.split("/", 1)[-1]
+        return types.SimpleNamespace(name=f"files/{short}", uri=f"https://stub/files/{short}", state=state, mime_type="application/pdf", expiration_time=None)
+
+    def _get(self, name: str):
+        self.calls += 1
+        short = name.split("/", 1)[-1]
+        if short not in self.ready_at:
+            raise genai_errors.ClientError(
+                404, {"error": {"code": 404, "message": f"File {name} not found.", "status": "NOT_FOUND"}}
+            )
+        return self._file(short)
+
+    def _upload(self, config):
+        self.calls += 1
+        if self.processing_s:
+            self.ready_at[config["name"]] = time.monotonic() + self.processing_s
+        return self._file(config["name"])
+
+    def get(self, name: str):
+        return self._get(name)
+
+    def upload(self, file, config):
+        time.sleep(self.upload_latency_s)
+        return self._upload(config)
+
+
+class _AsyncStubFiles(_StubFiles):
+    async def get(self, name: str):
+        return self._get(name)
+
+    async def upload(self, file, config):
+        await asyncio.sleep(self.upload_latency_s)
+        return self._upload(config)
+
+
+def install(model: StubModel, *, upload_latency_s: float = 0.05, processing_s: float = 0.0) -> str:
+    """Patch llm_grading to use `model` and stub files; returns the scratch dir used for caches."""
+    scratch = tempfile.mkdtemp(prefix="grader-bench-")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder-key")
+    os.environ["GRADER_FILE_INDEX_PATH"] = os.path.join(scratch, "file_index.db")
+    os.environ["GRADER_RESPONSE_CACHE"] = "0"
+    os.environ["GRADER_CONTEXT_CACHE_INDEX_PATH"] = os.path.join(scratch, "context_cache.db")
+
+    from app.agents import llm_grading
+
+    client = types.SimpleNamespace(
+        files=_StubFiles(upload_latency_s, processing_s),
+        caches=_StubCaches(model),
+        aio=types.SimpleNamespace(
+            files=_AsyncStubFiles(upload_latency_s, processing_s), caches=_AsyncStubCaches(model)
+        ),
+    )
+    llm_grading.get_client = lambda: client
+    llm_grading.get_llm = lambda *args, **kwargs: model
+    return scratch
+
+
+def make_submission_pdfs(directory: str, count: int) -> List[str]:
+    """Distinct placeholder PDFs (content differs so the file index never dedups them)."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"submission-{i}.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n% benchmark submission " + str(i).encode() + b"\n%%EOF\n")
+        paths.append(path)
+    return paths
+
+
+def make_text_pdf(path: str, pages: List[str]) -> str:
+    """Write a PDF with a real text layer, one string (lines split on \\n) per page."""
+    count = len(pages)
+    font_ref = 3 + 2 * count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(count))}] /Count {count} >>",
+    ]
+    for i, text in enumerate(pages):
+        lines = "".join(f"({line}) Tj 0 -14 Td " for line in text.split("\n"))
+        stream = f"BT /F1 12 Tf 72 720 Td {lines}ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_ref} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(body)
+    return path
+
+
+def make_scanned_pdf(path: str, pages: int, *, blank_pages=(), dpi: int = 300, seed: int = 0) -> str:
+    """Write a phone-scan-like PDF: one full-resolution JPEG per letter page, no text layer.
+
+    Pages are paper-grey noise with handwriting-like strokes; `blank_pages`
+    (1-based) get the noise only. Needs Pillow.
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    size = (int(8.5 * dpi), 11 * dpi)
+    images = []
+    for number in range(1, pages + 1):
+        noise = Image.effect_noise((size[0] // 4, size[1] // 4), 12).resize(size)
+        image = Image.merge("RGB", [noise.point(lambda v: 232 + v // 12)] * 3)
+        if number not in blank_pages:
+            draw = ImageDraw.Draw(image)
+            for line in range(30):
+                y = dpi + line * dpi * 0.3
+                x = dpi * rng.uniform(0.8, 1.2)
+                while x < size[0] - dpi * rng.uniform(1, 3):
+                    step = dpi * rng.uniform(0.05, 0.15)
+                    stroke = [(x, y + rng.uniform(-8, 8)), (x + step, y + rng.uniform(-20, 20))]
+                    draw.line(stroke, fill=(40, 40, 60), width=4)
+                    x += step
+        images.append(image)
+    images[0].save(path, "PDF", save_all=True, append_images=images[1:], resolution=dpi, quality=92)
+    return path
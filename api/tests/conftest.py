@@ -0,0 +1,41 @@
+"""Shared test setup: run from the api/ directory or the repository root."""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Route `app.agents.llm_grading` to a zero-latency `StubModel`; call it with the rubric.
+
+    Uses `benchmarks.stub_model.install`, with every global it replaces
+    (client, model, file and cache indexes, env vars) restored after the test.
+    """
+    from app.agents import context_cache, file_cache, llm_grading, response_cache
+    from benchmarks import stub_model
+
+    # Deleted here so monkeypatch restores them after install() sets them
+    for name in ("GOOGLE_API_KEY", "GRADER_FILE_INDEX_PATH", "GRADER_RESPONSE_CACHE", "GRADER_CONTEXT_CACHE_INDEX_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    if os.environ.get("GEMINI_API_KEY") is None:
+        monkeypatch.setenv("GOOGLE_API_KEY", "test-placeholder-key")
+    monkeypatch.setattr(llm_grading, "get_client", llm_grading.get_client)
+    monkeypatch.setattr(llm_grading, "get_llm", llm_grading.get_llm)
+    monkeypatch.setattr(file_cache, "_index", None)
+    monkeypatch.setattr(context_cache, "_index", None)
+    monkeypatch.setattr(response_cache, "_cache", None)
+
+    def install(rubric, *, upload_latency_s: float = 0.0, processing_s: float = 0.0, **fields):
+        fields = {"ttft_s": 0, "prefill_s_per_token": 0, "decode_s_per_token": 0, **fields}
+        model = stub_model.StubModel(rubric=rubric, **fields)
+        stub_model.install(model, upload_latency_s=upload_latency_s, processing_s=processing_s)
+        return model
+
+    return install
@@ -0,0 +1,80 @@
+"""The load test's fake Gemini must look like the real file API to `genai.Client`."""
+import threading
+import time
+
+import pytest
+import uvicorn
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from app.agents.rate_limit import is_throttle, retry_after
+from benchmarks.fake_gemini import FakeConfig, FakeGemini, config_from_args, config_to_argv, _parse_args
+from benchmarks.load_test import _free_port, _percentile
+
+
+@pytest.fixture
+def serve_fake():
+    """Start a FakeGemini REST app on a free port; returns (fake, genai client)."""
+    servers = []
+
+    def start(config: FakeConfig):
+        port = _free_port()
+        fake = FakeGemini(config, f"http://127.0.0.1:{port}")
+        server = uvicorn.Server(uvicorn.Config(fake.rest_app(), host="127.0.0.1", port=port, log_level="warning", ws="none"))
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+        deadline = time.monotonic() + 10
+        while not server.started:
+            assert time.monotonic() < deadline, "fake Gemini did not start"
+            time.sleep(0.01)
+        client = genai.Client(api_key="test-key", http_options=types.HttpOptions(base_url=fake.http_base))
+        return fake, client
+
+    yield start
+    for server in servers:
+        server.should_exit = True
+
+
+def test_file_upload_get_and_conflicts(serve_fake, tmp_path):
+    fake, client = serve_fake(FakeConfig(upload_latency_s=0, processing_s=0.2))
+    path = tmp_path / "submission.pdf"
+    path.write_bytes(b"%PDF-1.4 test")
+
+    with pytest.raises(genai_errors.ClientError) as missing:
+        client.files.get(name="files/sha-abc")
+    assert missing.value.code == 404
+
+    uploaded = client.files.upload(file=str(path), config={"name": "sha-abc", "mime_type": "application/pdf"})
+    assert uploaded.name == "files/sha-abc"
+    assert uploaded.state.name == "PROCESSING"
+    time.sleep(0.25)
+    assert client.files.get(name="files/sha-abc").state.name == "ACTIVE"
+
+    with pytest.raises(genai_errors.ClientError) as conflict:
+        client.files.upload(file=str(path), config={"name": "sha-abc", "mime_type": "application/pdf"})
+    assert conflict.value.code == 409
+    assert (fake.stats.uploads, fake.stats.file_gets) == (1, 2)
+
+
+def test_throttled_requests_carry_a_retry_hint(serve_fake):
+    fake, client = serve_fake(FakeConfig(throttle_rate=1.0, retry_delay_s=3))
+
+    with pytest.raises(genai_errors.APIError) as throttled:
+        client.files.get(name="files/anything")
+
+    assert is_throttle(throttled.value)
+    assert retry_after(throttled.value) == 3
+    assert fake.stats.throttled == 1
+
+
+def test_config_round_trips_through_the_command_line():
+    config = FakeConfig(problems=3, ttft_s=0.1, jitter=0, throttle_rate=0.2, seed=7)
+    assert config_from_args(_parse_args(config_to_argv(config))) == config
+
+
+def test_percentiles():
+    assert _percentile([], 95) == 0.0
+    assert _percentile([2.0], 95) == 2.0
+    assert _percentile([float(v) for v in range(1, 101)], 50) == pytest.approx(50.5)
+    assert _percentile([float(v) for v in range(1, 101)], 99) == pytest.approx(99.01)
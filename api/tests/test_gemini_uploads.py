@@ -0,0 +1,41 @@
+import asyncio
+import itertools
+import time
+
+from app.agents import llm_grading
+from app.agents.file_cache import file_sha256, remote_name_for
+from benchmarks.stub_model import make_submission_pdfs, sample_rubric
+
+
+def test_poll_delays_back_off_to_a_cap():
+    delays = list(itertools.islice(llm_grading._poll_delays(), 7))
+    assert delays == [0.25, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_upload_files_overlaps_uploads_and_keeps_input_order(stub_llm, tmp_path):
+    stub_llm(sample_rubric(1), upload_latency_s=0.3, processing_s=0.3)
+    paths = make_submission_pdfs(str(tmp_path), 4)
+
+    started = time.perf_counter()
+    uploaded = llm_grading.upload_files(paths)
+    elapsed = time.perf_counter() - started
+
+    assert [f.name for f in uploaded] == [f"files/{remote_name_for(file_sha256(path))}" for path in paths]
+    # One after another would take 4 x (upload + processing)
+    assert elapsed < 1.5
+
+
+def test_aupload_files_waits_for_active_and_reuses_the_index(stub_llm, tmp_path):
+    stub_llm(sample_rubric(1), processing_s=0.3)
+    paths = make_submission_pdfs(str(tmp_path), 3)
+    files = llm_grading.get_client().aio.files
+
+    uploaded = asyncio.run(llm_grading.aupload_files(paths))
+    calls = files.calls
+    again = asyncio.run(llm_grading.aupload_files(paths))
+
+    assert [f.sha256 for f in uploaded] == [file_sha256(path) for path in paths]
+    # Lookup, upload and at least one poll while PROCESSING, per file
+    assert calls >= 3 * 3
+    assert again == uploaded
+    assert files.calls == calls
@@ -0,0 +1,62 @@
+import pytest
+from PIL import Image
+
+from app import page_images
+from app.agents.file_cache import file_sha256
+from benchmarks.stub_model import make_scanned_pdf
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_images, "PAGE_IMAGE_DIR", tmp_path / "pages")
+    return tmp_path / "pages"
+
+
+@pytest.fixture
+def scan(tmp_path):
+    return make_scanned_pdf(str(tmp_path / "scan.pdf"), 3, dpi=100)
+
+
+def test_page_set_records_page_sizes(scan, image_dir):
+    pages = page_images.page_set(scan)
+
+    assert len(pages.page_sizes) == 3
+    assert pages.version == file_sha256(scan)[:16]
+    assert pages.directory.parent == image_dir
+    assert (pages.directory / "pages.json").exists()
+    assert page_images.page_set(scan, sha256=file_sha256(scan)) == pages
+
+
+def test_page_set_is_none_when_disabled_or_unreadable(tmp_path, scan, image_dir, monkeypatch):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    assert page_images.page_set(str(broken)) is None
+
+    monkeypatch.setattr(page_images, "PAGE_IMAGES_ENABLED", False)
+    assert page_images.page_set(scan) is None
+    assert page_images.render_pages(scan) is None
+
+
+def test_render_page_writes_every_size_from_one_render(scan, image_dir):
+    pages = page_images.page_set(scan)
+
+    path = page_images.render_page(scan, pages, 2, "thumb")
+
+    for size, width in page_images.SIZES.items():
+        with Image.open(pages.path(2, size)) as image:
+            assert image.format == "WEBP"
+            assert image.width <= width
+    assert path == pages.path(2, "thumb")
+    assert not pages.path(1, "thumb").exists()
+
+
+def test_render_pages_skips_cached_images(scan, image_dir):
+    pages = page_images.page_set(scan)
+    page_images.render_page(scan, pages, 1, "preview")
+
+    report = page_images.render_pages(scan)
+
+    assert (report["pages"], report["rendered"]) == (3, 2)
+    assert report["bytes"]["thumb"] < report["bytes"]["preview"]
+    assert page_images.render_pages(scan)["rendered"] == 0
+
@@ -0,0 +1,68 @@
+from app.agents import page_segments
+from app.agents.page_segments import _page_label, map_pages, segment_pdf
+from benchmarks.stub_model import make_text_pdf
+
+STRUCTURE = [{"id": "1", "name": "Problem 1"}, {"id": "2", "name": "Problem 2"}, {"id": "3", "name": "Problem 3"}]
+ANSWER = "The student works through the argument step by step. " * 3
+
+
+def test_problems_run_from_their_heading_to_the_next():
+    texts = [
+        "Name: Ada\nCourse: Algorithms",
+        f"Problem 1\n{ANSWER}",
+        ANSWER,
+        f"Problem 2\n{ANSWER}\nProblem 3\n{ANSWER}",
+        ANSWER,
+    ]
+
+    pages, shared = map_pages(texts, STRUCTURE)
+
+    # Cover page dropped; problems 2 and 3 share the page where 3 starts mid-page
+    assert pages == {"1": [2, 3], "2": [4], "3": [4, 5]}
+    assert shared == []
+
+
+def test_long_preamble_is_shared_by_every_problem():
+    texts = ["Instructions and definitions. " * 20, f"Problem 1\n{ANSWER}", f"Problem 2\n{ANSWER}"]
+
+    pages, shared = map_pages(texts, STRUCTURE[:2])
+
+    assert pages == {"1": [2], "2": [3]}
+    assert shared == [1]
+
+
+def test_bare_numbers_are_used_only_without_labelled_headings():
+    texts = [f"1. {ANSWER}", f"2) {ANSWER}", f"10. {ANSWER}"]
+    structure = [{"id": "1", "name": "1"}, {"id": "2", "name": "2"}]
+
+    pages, _ = map_pages(texts, structure)
+
+    # "1" does not match the heading "10."
+    assert pages == {"1": [1], "2": [2, 3]}
+    assert map_pages(["no headings here"], structure) == ({}, [])
+
+
+def test_page_label_compacts_ranges():
+    assert _page_label([1, 2, 3, 7, 9, 10]) == "1-3_7_9-10"
+    assert len(_page_label(list(range(1, 200, 2)))) == 16
+
+
+def test_segment_pdf_writes_each_problems_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_segments, "SEGMENT_DIR", tmp_path / "segments")
+    texts = ["Cover sheet", f"Problem 1\n{ANSWER}", f"Problem 2\n{ANSWER}", ANSWER, f"Problem 3\n{ANSWER}"]
+    path = make_text_pdf(str(tmp_path / "submission.pdf"), texts)
+
+    segments = segment_pdf(path, STRUCTURE)
+
+    assert segments.source.pages == (1, 2, 3, 4, 5)
+    assert segments.relevant.pages == (2, 3, 4, 5)
+    assert {pid: part.pages for pid, part in segments.problems.items()} == {"1": (2,), "2": (3, 4), "3": (5,)}
+    report = segments.report(list(segments.problems.values()))
+    assert report["tokens_saved"] == (3 * 5 - 4) * page_segments.TOKENS_PER_PAGE
+    # Parts are reused on the next run
+    assert segment_pdf(path, STRUCTURE).problems["2"] == segments.problems["2"]
+
+
+def test_segment_pdf_skips_pdfs_without_a_text_layer(tmp_path):
+    path = make_text_pdf(str(tmp_path / "scan.pdf"), ["", ""])
+    assert segment_pdf(path, STRUCTURE) is None
@@ -0,0 +1,69 @@
+import pytest
+from PIL import Image, ImageDraw
+from pypdf import PdfReader
+
+from app.agents import pdf_optimize
+from app.agents.pdf_optimize import _has_ink, optimize_pdf
+from benchmarks.stub_model import make_scanned_pdf
+
+
+@pytest.fixture
+def optimized_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_optimize, "OPTIMIZED_DIR", tmp_path / "optimized")
+    monkeypatch.setattr(pdf_optimize, "MIN_BYTES", 0)
+    return tmp_path / "optimized"
+
+
+def _paper(size=(850, 1100)):
+    noise = Image.effect_noise((size[0] // 4, size[1] // 4), 12).resize(size)
+    return Image.merge("RGB", [noise.point(lambda v: 232 + v // 12)] * 3)
+
+
+def test_scanner_noise_is_not_ink_but_a_few_strokes_are():
+    page = _paper()
+    assert not _has_ink(page)
+    draw = ImageDraw.Draw(page)
+    draw.line([(400, 500), (440, 520), (470, 490)], fill=(40, 40, 60), width=4)
+    assert _has_ink(page)
+
+
+def test_scan_is_downsampled_and_blank_pages_dropped(tmp_path, optimized_dir):
+    path = make_scanned_pdf(str(tmp_path / "scan.pdf"), 4, blank_pages=(3,), dpi=200)
+
+    optimized = optimize_pdf(path)
+
+    assert optimized.kept_pages == (1, 2, 4)
+    assert optimized.dropped_pages == (3,)
+    assert optimized.images_resampled == 3
+    assert optimized.size < optimized.source_size * (1 - pdf_optimize.MIN_SAVING)
+    assert len(PdfReader(optimized.path).pages) == 3
+    report = optimized.report()
+    assert (report["pages"], report["tokens_saved"]) == (4, pdf_optimize.TOKENS_PER_PAGE)
+
+
+def test_outcome_is_recorded_and_reused(tmp_path, optimized_dir, monkeypatch):
+    path = make_scanned_pdf(str(tmp_path / "scan.pdf"), 2, dpi=200)
+    first = optimize_pdf(path)
+
+    def fail(*args):
+        raise AssertionError("optimized twice")
+
+    monkeypatch.setattr(pdf_optimize, "_optimize", fail)
+    assert optimize_pdf(path) == first
+
+
+def test_a_submission_is_never_reduced_to_nothing(tmp_path, optimized_dir):
+    path = make_scanned_pdf(str(tmp_path / "blank.pdf"), 2, blank_pages=(1, 2), dpi=200)
+
+    optimized = optimize_pdf(path)
+
+    assert optimized.dropped_pages == ()
+    assert optimized.kept_pages == (1, 2)
+    assert optimized.images_resampled == 2
+
+
+def test_small_pdfs_are_left_alone(tmp_path, optimized_dir, monkeypatch):
+    monkeypatch.setattr(pdf_optimize, "MIN_BYTES", 2**20)
+    path = tmp_path / "small.pdf"
+    path.write_bytes(b"%PDF-1.4\n%%EOF\n")
+    assert optimize_pdf(str(path)) is None
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from app.agents import llm_grading
+from app.agents.problems import split_markdown_by_problem
+from benchmarks.stub_model import StubModel, make_submission_pdfs, sample_rubric
+
+
+def test_split_markdown_by_problem_maps_sections_to_rubric_ids():
+    rubric = [{"id": "a", "name": "Problem 1"}, {"id": "b", "name": "Problem 2"}, {"id": "c", "name": "Bonus"}]
+    markdown = "Intro\n\n## Problem 1\nfirst answer\n\n## Problem 2\nsecond answer\n"
+
+    sections = split_markdown_by_problem(markdown, rubric)
+
+    assert sections["a"] == "## Problem 1\nfirst answer"
+    assert sections["b"] == "## Problem 2\nsecond answer"
+    # No section of its own: graded against everything
+    assert sections["c"] == markdown
+
+
+def test_problems_are_graded_in_separate_calls_and_merged_in_rubric_order(stub_llm, tmp_path):
+    rubric = sample_rubric(4)
+    model = stub_llm(rubric)
+    [path] = make_submission_pdfs(str(tmp_path), 1)
+    markdown = model._markdown(rubric)
+    seen = []
+
+    async def on_problem(entry):
+        seen.append(entry["id"])
+
+    graded = asyncio.run(llm_grading.agrade_submission_by_problem(rubric, markdown, path, on_problem=on_problem))
+
+    assert model.stats.calls == 4
+    assert [entry["id"] for entry in graded] == ["1", "2", "3", "4"]
+    assert sorted(seen) == ["1", "2", "3", "4"]
+
+
+class _FailingModel(StubModel):
+    """Problem 2 always fails; problem 3 takes far longer than the test allows."""
+
+    def _account(self, messages, cached_content=None):
+        message, latency = super()._account(messages, cached_content)
+        names = [problem["name"] for problem in self._problems_in(messages)]
+        if names == ["Problem 2"]:
+            raise RuntimeError("model unavailable")
+        return message, 60 if names == ["Problem 3"] else 0
+
+
+def test_a_failed_problem_cancels_the_others(stub_llm, tmp_path, monkeypatch):
+    rubric = sample_rubric(3)
+    model = stub_llm(rubric)
+    failing = _FailingModel(rubric=rubric, ttft_s=0, prefill_s_per_token=0, decode_s_per_token=0)
+    monkeypatch.setattr(llm_grading, "get_llm", lambda *args, **kwargs: failing)
+    [path] = make_submission_pdfs(str(tmp_path), 1)
+    seen = []
+
+    async def on_problem(entry):
+        seen.append(entry["id"])
+
+    started = time.perf_counter()
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        asyncio.run(
+            llm_grading.agrade_submission_by_problem(
+                rubric, model._markdown(rubric), path, max_attempts=1, on_problem=on_problem
+            )
+        )
+
+    assert time.perf_counter() - started < 30
+    assert "3" not in seen
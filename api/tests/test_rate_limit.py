@@ -0,0 +1,102 @@
+import pytest
+from google.genai import errors as genai_errors
+
+from app.agents import rate_limit
+from app.agents.rate_limit import RateLimiter, Throttled, is_throttle, retry_after
+
+
+def _quota_error(delay: str = "7s") -> genai_errors.ClientError:
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": delay}]
+    return genai_errors.ClientError(
+        429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED", "details": details}}
+    )
+
+
+def _raise(exc: BaseException):
+    raise exc
+
+
+def _throttle(limiter: RateLimiter, exc: BaseException) -> None:
+    with pytest.raises(type(exc)):
+        with limiter.slot():
+            raise exc
+
+
+def test_window_grows_about_one_slot_per_window_of_successes():
+    limiter = RateLimiter("m", rpm=10_000, max_window=16, initial_window=4)
+    for _ in range(4):
+        with limiter.slot():
+            pass
+    assert 4.9 < limiter.window < 5
+
+
+def test_window_never_exceeds_max_window():
+    limiter = RateLimiter("m", rpm=10_000, max_window=3, initial_window=3)
+    with limiter.slot():
+        pass
+    assert limiter.window == 3
+
+
+def test_throttle_halves_window_and_pauses_for_retry_delay():
+    limiter = RateLimiter("m", rpm=10_000, max_window=16, initial_window=8)
+    _throttle(limiter, _quota_error("7s"))
+
+    assert limiter.window == 4
+    assert 6 < limiter._try_acquire(0) <= 7
+    stats = limiter.stats()
+    assert (stats["throttled"], stats["in_flight"]) == (1, 0)
+
+
+def test_window_does_not_drop_below_one_slot():
+    limiter = RateLimiter("m", rpm=10_000, max_window=16, initial_window=1)
+    _throttle(limiter, _quota_error("0.01s"))
+    assert limiter.window == rate_limit.MIN_WINDOW
+
+
+def test_in_flight_calls_are_capped_by_the_window():
+    limiter = RateLimiter("m", rpm=10_000, max_window=16, initial_window=2)
+    assert limiter._try_acquire(0) == 0
+    assert limiter._try_acquire(0) == 0
+    assert limiter._try_acquire(0) > 0
+
+
+def test_token_estimate_is_reconciled_with_reported_usage():
+    limiter = RateLimiter("m", rpm=10_000, tpm=1_000_000, max_window=16)
+    with limiter.slot(tokens=1000) as usage:
+        usage["tokens"] = 3000
+    assert 996_000 < limiter.stats()["tokens_available"] <= 997_100
+
+
+def test_call_retries_throttled_calls(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_THROTTLE_RETRIES", 2)
+    limiter = RateLimiter("m", rpm=10_000, max_window=16)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _quota_error("0.01s")
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert limiter.stats()["retried"] == 2
+
+    with pytest.raises(Throttled):
+        limiter.call(lambda: _raise(_quota_error("0.01s")))
+
+
+def test_other_errors_are_not_retried():
+    limiter = RateLimiter("m", rpm=10_000, max_window=16, initial_window=4)
+    with pytest.raises(ValueError):
+        limiter.call(lambda: _raise(ValueError("bad request")))
+    stats = limiter.stats()
+    assert (stats["retried"], stats["throttled"]) == (0, 0)
+
+
+def test_throttle_detection_and_retry_hint():
+    assert is_throttle(_quota_error())
+    assert retry_after(_quota_error("12.5s")) == 12.5
+    wrapped = RuntimeError("grading failed")
+    wrapped.__cause__ = _quota_error()
+    assert is_throttle(wrapped)
+    assert not is_throttle(ValueError("400 INVALID_ARGUMENT"))
@@ -0,0 +1,80 @@
+import base64
+import os
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from app.agents import response_cache
+from app.agents.response_cache import ResponseCache, cache_key
+
+
+class Clock:
+    """Stands in for time.time(); every reading is one second after the last."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+def _payload() -> str:
+    # Random bytes keep zstd from shrinking entries below the size budget
+    return base64.b64encode(os.urandom(3000)).decode()
+
+
+def test_evicts_least_recently_used_over_max_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=7000, ttl_s=3600)
+    cache.put("a", _payload())
+    cache.put("b", _payload())
+    assert cache.get("a") is not None  # a is now more recent than b
+
+    cache.put("c", _payload())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert 0 < stats["size_bytes"] <= 7000
+
+
+def test_total_size_tracks_overwrites_and_deletes(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path, max_bytes=10**9, ttl_s=3600)
+    cache.put("a", _payload())
+    cache.put("a", "small")
+    cache.put("b", _payload())
+    conn = cache._connection()
+    summed = conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    assert cache.stats()["size_bytes"] == summed
+    # Another process opening the file sees the same total
+    assert ResponseCache(path, max_bytes=10**9, ttl_s=3600).stats()["size_bytes"] == summed
+
+
+def test_expired_entries_are_misses(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=10**9, ttl_s=5)
+    cache.put("a", "answer", tokens=120)
+    assert cache.get("a") == "answer"
+    clock.now += 10
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["tokens_saved"]) == (1, 1, 120)
+
+
+def test_cache_key_ignores_remote_file_uris():
+    def messages(uri: str):
+        return [HumanMessage(content=[{"type": "text", "text": "grade"}, {"type": "media", "file_uri": uri, "mime_type": "application/pdf"}])]
+
+    first = cache_key("gemini", {"temperature": 0}, messages("https://files/1"), ["sha"])
+    assert first == cache_key("gemini", {"temperature": 0}, messages("https://files/2"), ["sha"])
+    assert first != cache_key("gemini", {"temperature": 0}, messages("https://files/1"), ["other"])
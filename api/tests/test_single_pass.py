@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import pytest
+
+from app.agents import llm_grading
+from app.agents.llm_grading import _split_single_pass_output, rubric_to_problem_structure
+from benchmarks.stub_model import StubModel, make_submission_pdfs, sample_rubric
+
+
+def test_single_pass_extracts_and_grades_in_one_call(stub_llm, tmp_path):
+    rubric = sample_rubric(3)
+    model = stub_llm(rubric)
+    [path] = make_submission_pdfs(str(tmp_path), 1)
+
+    result = asyncio.run(llm_grading.agrade_submission_single_pass(rubric, rubric_to_problem_structure(rubric), path))
+
+    assert model.stats.calls == 1
+    assert "## Problem 1" in result["student_markdown"]
+    assert [entry["id"] for entry in result["graded_content"]] == ["1", "2", "3"]
+    assert all(entry["score"] == 6 for entry in result["graded_content"])
+
+
+def test_single_pass_output_splits_extraction_and_failing_problems():
+    rubric = sample_rubric(2)
+    # Problem 2 is missing from a fenced answer
+    grades = StubModel(rubric=rubric)._grades(rubric[:1])
+    answer = "```json\n" + json.dumps({"extraction": "## Problem 1\n...", "grades": grades}) + "\n```"
+
+    markdown, graded, failed = _split_single_pass_output(answer, rubric)
+
+    assert markdown.startswith("## Problem 1")
+    assert [entry["id"] for entry in graded] == ["1"]
+    assert [problem["id"] for problem in failed] == ["2"]
+
+
+def test_single_pass_output_without_grades_is_rejected():
+    with pytest.raises(ValueError):
+        _split_single_pass_output('{"extraction": "text"}', sample_rubric(1))
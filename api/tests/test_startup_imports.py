@@ -0,0 +1,24 @@
+"""`import app.main` must not load the model stack or the PDF/image libraries."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+# Loaded on first use by the code that needs them
+LAZY = ("google.genai", "langchain_google_genai", "pypdf", "PIL")
+
+
+def test_app_main_keeps_heavy_modules_lazy(tmp_path):
+    (tmp_path / "uploads").mkdir()
+    script = f"import json, sys, app.main; print(json.dumps([m for m in {LAZY!r} if m in sys.modules]))"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": str(API_DIR), "DATABASE_URL": f"sqlite:///{tmp_path / 'grader.db'}"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert json.loads(result.stdout.splitlines()[-1]) == []
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from app.agents import llm_grading
+from app.agents.structured_output import ArrayElementStream, check_entry
+from benchmarks.stub_model import StubModel, make_submission_pdfs, sample_rubric
+
+
+def _feed_in_pieces(stream: ArrayElementStream, text: str, size: int):
+    """Elements in the order they complete, with the length of text fed when each did."""
+    done = []
+    for start in range(0, len(text), size):
+        for element in stream.feed(text[start:start + size]):
+            done.append((element, start + size))
+    return done
+
+
+def test_elements_are_returned_as_each_one_closes():
+    elements = [{"id": "1", "text": 'brackets ] } and "quotes" \\ inside'}, {"id": "2", "nested": [{"a": [1]}]}]
+    text = "```json\n" + json.dumps(elements) + "\n```"
+
+    done = _feed_in_pieces(ArrayElementStream(), text, 1)
+
+    assert [element for element, _ in done] == elements
+    # Each element is returned with the piece holding its closing brace
+    assert done[0][1] == text.index('}, {"id": "2"') + 1
+
+
+def test_grades_nested_in_a_single_pass_answer():
+    answer = json.dumps({"extraction": "## Problem 1\n[not json {", "grades": [{"id": "1"}, {"id": "2"}]})
+    assert [element for element, _ in _feed_in_pieces(ArrayElementStream(depth=2), answer, 7)] == [{"id": "1"}, {"id": "2"}]
+
+
+def test_malformed_elements_are_dropped():
+    assert ArrayElementStream().feed('[{"id": 1,}, {"id": 2}]') == [{"id": 2}]
+
+
+def test_check_entry_validates_against_its_own_problem():
+    rubric = sample_rubric(2)
+    [entry] = StubModel(rubric=rubric)._grades(rubric[1:])
+    entry["score"] = 99
+
+    checked = check_entry(entry, rubric)
+
+    assert checked["id"] == "2" and checked["score"] == 6
+    assert check_entry({"id": "7", "items": []}, rubric) is None
+    assert check_entry({"id": "1"}, rubric) is None
+
+
+def test_each_problem_is_handed_on_before_the_answer_completes(stub_llm, tmp_path):
+    rubric = sample_rubric(4)
+    # About 0.1s per problem of decoding
+    model = stub_llm(rubric, decode_s_per_token=0.0003, stream_chunk_chars=32)
+    [path] = make_submission_pdfs(str(tmp_path), 1)
+    loop_times = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        async def on_problem(entry):
+            loop_times.append((entry["id"], loop.time()))
+
+        graded = await llm_grading.agrade_submission(rubric, model._markdown(rubric), path, on_problem=on_problem)
+        return graded, loop.time()
+
+    graded, finished = asyncio.run(run())
+
+    assert model.stats.calls == 1
+    assert [pid for pid, _ in loop_times] == ["1", "2", "3", "4"]
+    assert [entry["id"] for entry in graded] == ["1", "2", "3", "4"]
+    assert finished - loop_times[0][1] > 0.1
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from app.agents.structured_output import check_grades, check_rubric, grading_schema, parse_json
+
+RUBRIC = [
+    {"id": "1", "name": "Problem 1", "items": [{"id": "1", "points": 2}, {"id": "2", "points": 3}], "total": 5},
+    {"id": "2", "name": "Problem 2", "items": [{"id": "1", "points": 4}], "total": 4},
+]
+
+
+def _entry(pid, scores, *, score=None, total_score=None):
+    items = [{"item": str(i), "score": s, "total_possible_score": None, "explanation": ""} for i, s in enumerate(scores, 1)]
+    return {"id": pid, "name": f"Problem {pid}", "items": items, "score": score, "total_score": total_score}
+
+
+ANSWER = [{"id": "1", "score": 2}, {"id": "2", "score": 3}]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        json.dumps(ANSWER),
+        "```json\n" + json.dumps(ANSWER) + "\n```",
+        "Here are the grades:\n```\n" + json.dumps(ANSWER) + "\n```\nLet me know.",
+        "Sure! " + json.dumps(ANSWER) + " Hope this helps.",
+    ],
+)
+def test_parse_json_recovers_wrapped_answers(content):
+    assert parse_json(content) == ANSWER
+
+
+def test_parse_json_keeps_the_complete_part_of_truncated_output():
+    text = json.dumps(ANSWER)
+    assert parse_json(text[: text.index('"score": 3')]) == [{"id": "1", "score": 2}, {"id": "2"}]
+    assert parse_json('{"extraction": "## Problem 1", "grades": [{"id": "1"}, {"id": "2", "na') == {
+        "extraction": "## Problem 1",
+        "grades": [{"id": "1"}, {"id": "2"}],
+    }
+
+
+def test_parse_json_rejects_answers_without_json():
+    with pytest.raises(ValueError):
+        parse_json("I cannot grade this submission.")
+
+
+def test_check_grades_repairs_sums_totals_and_ranges():
+    entry = _entry("1", [2, 7], score=3, total_score=10)
+
+    graded, failed = check_grades([entry, _entry("2", [4], score=4, total_score=4)], RUBRIC)
+
+    assert failed == []
+    first = graded[0]
+    assert [item["total_possible_score"] for item in first["items"]] == [2, 3]
+    assert [item["score"] for item in first["items"]] == [2, 3]
+    assert (first["score"], first["total_score"]) == (5, 5)
+
+
+def test_check_grades_returns_missing_and_invalid_problems_to_reask():
+    invalid = {"id": "2", "name": "Problem 2", "score": 1}
+    stray = _entry("9", [1], score=1)
+
+    graded, failed = check_grades({"grades": [stray, _entry("1", [1, 1], score=2), invalid]}, RUBRIC)
+
+    assert [entry["id"] for entry in graded] == ["1"]
+    assert [problem["id"] for problem in failed] == ["2"]
+    graded, failed = check_grades([], RUBRIC)
+    assert graded == [] and [problem["id"] for problem in failed] == ["1", "2"]
+
+
+def test_problem_score_is_not_resummed_over_indeterminate_items():
+    graded, _ = check_grades([_entry("1", [2, None], score=2)], RUBRIC[:1])
+    assert graded[0]["score"] == 2
+
+
+def test_check_rubric_sets_totals_from_item_points():
+    problems = check_rubric({"id": 1, "name": "P", "items": [{"id": 1, "points": 2}, {"id": 2, "points": 2.5}], "total": 9})
+    assert problems[0]["total"] == 4.5
+    with pytest.raises(ValueError):
+        check_rubric([{"id": 1, "name": "P"}])
+
+
+def test_grading_schema_pins_ids_and_entry_count():
+    schema = grading_schema(RUBRIC)
+    problem = schema["items"]["properties"]
+    assert problem["id"]["enum"] == ["1", "2"]
+    assert problem["items"]["items"]["properties"]["item"]["enum"] == ["1", "2"]
+    assert schema["minItems"] == schema["maxItems"] == 2
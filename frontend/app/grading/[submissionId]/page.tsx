@@ -56,22 +56,112 @@ type Problem = {
   grading?: GradingProblem;
 };
 
-function PDFViewer({ filePath }: { filePath: string }) {
+type PageImage = {
+  page: number;
+  width: number;
+  height: number;
+  thumb: string;
+  preview: string;
+};
+
+function PDFViewer({
+  submissionId,
+  filePath,
+}: {
+  submissionId: string;
+  filePath: string;
+}) {
   // Convert file path to URL format with parameters to hide sidebar and toolbar
   const baseUrl = `http://localhost:8000/uploads/${filePath.split("/").pop()}`;
   const pdfUrl = `${baseUrl}#toolbar=0&navpanes=0&scrollbar=1&view=FitH`;
+  // Server-rendered page images; null falls back to the PDF itself
+  const [pages, setPages] = useState<PageImage[] | null>(null);
+  const [current, setCurrent] = useState(1);
+
+  useEffect(() => {
+    let cancelled = false;
+    fetch(`http://localhost:8000/submissions/${submissionId}/pages`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((data) => {
+        if (!cancelled && data && data.pages.length > 0) {
+          setPages(data.pages);
+          setCurrent(1);
+        }
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [submissionId]);
+
+  const page = pages?.[current - 1];
 
   return (
     <div className="w-full h-full bg-gray-100 dark:bg-gray-800 rounded-lg overflow-hidden relative">
-      <iframe
-        src={pdfUrl}
-        className="w-full h-full border-0"
-        title="Student Submission PDF"
-        onError={() => {
-          console.error("Failed to load PDF in iframe");
-        }}
-      />
-      <div className="absolute top-4 right-4">
+      {pages && page ? (
+        <div className="flex h-full">
+          {/* Thumbnails load as they scroll into view; only the page being read is fetched at full size */}
+          <div className="w-24 shrink-0 overflow-y-auto p-2 space-y-2 border-r border-black/10 dark:border-white/15">
+            {pages.map((p) => (
+              <button
+                key={p.page}
+                onClick={() => setCurrent(p.page)}
+                className={`block w-full rounded border-2 ${
+                  p.page === current ? "border-[#0fe3c2]" : "border-transparent"
+                }`}
+              >
+                <img
+                  src={`http://localhost:8000${p.thumb}`}
+                  alt={`Page ${p.page}`}
+                  loading="lazy"
+                  className="w-full bg-white"
+                  style={{ aspectRatio: `${p.width} / ${p.height}` }}
+                />
+                <span className="text-xs">{p.page}</span>
+              </button>
+            ))}
+          </div>
+          <div className="flex-1 overflow-auto p-4">
+            <img
+              src={`http://localhost:8000${page.preview}`}
+              alt={`Page ${page.page} of the student submission`}
+              className="w-full bg-white shadow-sm"
+              style={{ aspectRatio: `${page.width} / ${page.height}` }}
+            />
+          </div>
+        </div>
+      ) : (
+        <iframe
+          src={pdfUrl}
+          className="w-full h-full border-0"
+          title="Student Submission PDF"
+          onError={() => {
+            console.error("Failed to load PDF in iframe");
+          }}
+        />
+      )}
+      <div className="absolute top-4 right-4 flex items-center gap-2">
+        {pages && (
+          <>
+            <button
+              onClick={() => setCurrent((n) => Math.max(1, n - 1))}
+              disabled={current <= 1}
+              className="text-xs px-3 py-2 bg-white/90 text-black rounded hover:bg-white transition-colors shadow-sm disabled:opacity-50"
+            >
+              Prev
+            </button>
+            <span className="text-xs px-2 py-2 bg-white/90 text-black rounded shadow-sm">
+              {current} / {pages.length}
+            </span>
+            <button
+              onClick={() => setCurrent((n) => Math.min(pages.length, n + 1))}
+              disabled={current >= pages.length}
+              className="text-xs px-3 py-2 bg-white/90 text-black rounded hover:bg-white transition-colors shadow-sm disabled:opacity-50"
+            >
+              Next
+            </button>
+          </>
+        )}
         <a
           href={baseUrl}
           target="_blank"
@@ -590,7 +680,7 @@ export default function GradingDetailsPage() {
             <div className="bg-white dark:bg-gray-900 rounded-lg border border-black/10 dark:border-white/15 p-4">
               <h2 className="text-lg font-semibold mb-4">Student Submission</h2>
               <div className="h-[calc(100%-3rem)]">
-                <PDFViewer filePath={submission.file_path} />
+                <PDFViewer submissionId={submission.id} filePath={submission.file_path} />
               </div>
             </div>
 
@@ -28,7 +28,9 @@ type Submission = {
   assignment_id: string;
   student_name: string;
   file_path: string;
-  graded_content: any | null;
+  status?: string;
+  // Not included in list responses; only fetched for a single submission
+  graded_content?: any | null;
 };
 
 function formatBytes(bytes: number): string {
@@ -219,7 +221,7 @@ function SubmissionResults({
               </p>
             </div>
             <div className="flex items-center gap-2">
-              {submission.graded_content ? (
+              {submission.status === "graded" || submission.graded_content ? (
                 <div className="flex items-center gap-2">
                   <span className="text-xs px-2 py-1 rounded-full bg-green-100 text-green-800 dark:bg-green-900 dark:text-green-200">
                     Graded
@@ -254,32 +256,43 @@ function SubmissionResults({
   );
 }
 
+// List endpoints are keyset-paged: follow next_cursor until every row is loaded
+async function fetchAllPages<T>(url: string, key: string): Promise<T[]> {
+  const rows: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: "500" });
+    if (cursor) params.set("cursor", cursor);
+    const response = await fetch(`${url}?${params}`);
+    if (!response.ok) {
+      throw new Error(`Failed to load ${url}`);
+    }
+    const data = await response.json();
+    rows.push(...(data[key] || []));
+    cursor = data.next_cursor ?? null;
+  } while (cursor);
+  return rows;
+}
+
 export default function SubmissionsPage() {
   const router = useRouter();
   const [assignments, setAssignments] = useState<Assignment[]>([]);
   const [submissions, setSubmissions] = useState<Submission[]>([]);
   const [isLoading, setIsLoading] = useState(false);
-  const [pollingIntervals, setPollingIntervals] = useState<Map<string, NodeJS.Timeout>>(new Map());
+  const [pollingIntervals, setPollingIntervals] = useState<Map<string, EventSource>>(new Map());
 
   // Load assignments and submissions on component mount
   useEffect(() => {
     const loadData = async () => {
       try {
         // Load assignments
-        const assignmentsResponse = await fetch("http://localhost:8000/assignments");
-        if (!assignmentsResponse.ok) {
-          throw new Error("Failed to load assignments");
-        }
-        const assignmentsData = await assignmentsResponse.json();
-        setAssignments(assignmentsData.assignments || []);
+        setAssignments(await fetchAllPages<Assignment>("http://localhost:8000/assignments", "assignments"));
 
         // Load existing submissions
-        const submissionsResponse = await fetch("http://localhost:8000/submissions");
-        if (submissionsResponse.ok) {
-          const submissionsData = await submissionsResponse.json();
-          setSubmissions(submissionsData.submissions || []);
-        } else {
-          console.error("Failed to load submissions from backend, trying localStorage fallback");
+        try {
+          setSubmissions(await fetchAllPages<Submission>("http://localhost:8000/submissions", "submissions"));
+        } catch (err) {
+          console.error("Failed to load submissions from backend, trying localStorage fallback", err);
           // Fallback to localStorage
           const savedSubmissions = localStorage.getItem("ai-grader-submissions");
           if (savedSubmissions) {
@@ -351,50 +364,65 @@ export default function SubmissionsPage() {
   }, []);
 
   const startPollingSubmission = useCallback((submissionId: string) => {
-    const interval = setInterval(async () => {
+    // Progress is pushed over Server-Sent Events; the full record is fetched once at the end
+    const events = new EventSource(`http://localhost:8000/submissions/${submissionId}/events`);
+
+    const updateSubmission = (data: Partial<Submission>) => {
+      setSubmissions(prev => {
+        const updated = prev.map(sub =>
+          sub.id === submissionId
+            ? { ...sub, ...data }
+            : sub
+        );
+        // Save to localStorage
+        try {
+          localStorage.setItem("ai-grader-submissions", JSON.stringify(updated));
+        } catch (e) {
+          console.error("Failed to save submissions to localStorage:", e);
+        }
+        return updated;
+      });
+    };
+
+    const stopListening = () => {
+      events.close();
+      setPollingIntervals(prev => {
+        const newMap = new Map(prev);
+        newMap.delete(submissionId);
+        return newMap;
+      });
+    };
+
+    const handleStage = async (event: MessageEvent) => {
+      const { stage } = JSON.parse(event.data);
+      if (stage !== "done" && stage !== "failed") return;
+      stopListening();
       try {
         const response = await fetch(`http://localhost:8000/submissions/${submissionId}`);
-        if (!response.ok) return;
-        
-        const data = await response.json();
-        
-        // Update submission in state
-        setSubmissions(prev => {
-          const updated = prev.map(sub => 
-            sub.id === submissionId 
-              ? { ...sub, ...data }
-              : sub
-          );
-          // Save to localStorage
-          try {
-            localStorage.setItem("ai-grader-submissions", JSON.stringify(updated));
-          } catch (e) {
-            console.error("Failed to save submissions to localStorage:", e);
-          }
-          return updated;
-        });
-        
-        // Stop polling if grading is complete
-        if (data.graded_content) {
-          clearInterval(interval);
-          setPollingIntervals(prev => {
-            const newMap = new Map(prev);
-            newMap.delete(submissionId);
-            return newMap;
-          });
+        if (response.ok) {
+          updateSubmission(await response.json());
         }
       } catch (error) {
-        console.error("Error polling submission:", error);
+        console.error("Error fetching submission:", error);
+      }
+    };
+
+    events.addEventListener("snapshot", handleStage);
+    events.addEventListener("stage", handleStage);
+    events.onerror = () => {
+      // EventSource reconnects by itself; give up only once the server closed the stream
+      if (events.readyState === EventSource.CLOSED) {
+        stopListening();
       }
-    }, 2000);
-    
-    setPollingIntervals(prev => new Map(prev).set(submissionId, interval));
+    };
+
+    setPollingIntervals(prev => new Map(prev).set(submissionId, events));
   }, []);
 
-  // Cleanup polling intervals on unmount
+  // Close open event streams on unmount
   useEffect(() => {
     return () => {
-      pollingIntervals.forEach(interval => clearInterval(interval));
+      pollingIntervals.forEach(events => events.close());
     };
   }, [pollingIntervals]);
 